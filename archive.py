@@ -0,0 +1,91 @@
+
+from hashlib import sha256
+from os import makedirs, replace, remove, stat
+from os.path import join, exists, dirname, normpath, isabs, abspath
+from shutil import copyfileobj
+from .locking import temp_path, write_atomic
+from .signatures import hash_file_streaming
+from .utils import get_cache_dir, InvalidPackageConfigError
+
+
+_HASHES = {}
+
+
+def archive_hash(archive_pth, cache_dir=None):
+	"""
+	Hash of the archive content. It is remembered while the archive's size and modification time are unchanged:
+	within the process, and between processes in a small file per archive state in `cache_dir`, so the archive is
+	only read completely the first time.
+	"""
+	info = stat(archive_pth)
+	key = (abspath(archive_pth), info.st_size, info.st_mtime_ns)
+	if key not in _HASHES:
+		state_pth = join(cache_dir or join(get_cache_dir(), 'archives'), '.hashes',
+			sha256('{0:s}\t{1:d}\t{2:d}'.format(*key).encode('utf-8')).hexdigest())
+		try:
+			with open(state_pth, 'r') as fh:
+				_HASHES[key] = fh.read().strip()
+		except FileNotFoundError:
+			_HASHES[key] = hash_file_streaming(archive_pth)
+			makedirs(dirname(state_pth), exist_ok=True)
+			write_atomic(state_pth, _HASHES[key])
+	return _HASHES[key]
+
+
+def select_members(names, wanted, archive_pth=None):
+	"""
+	Choose the archive members to extract: each wanted path matches the member with that name, or if there is none,
+	all members in the directory with that name. Raises an InvalidPackageConfigError if a wanted path matches nothing
+	(e.g. a `local_path` or `copy_map` source that is not in a downloaded archive).
+	"""
+	names = [name for name in names if not name.endswith('/')]
+	available = set(names)
+	selected, missing = set(), []
+	for want in wanted:
+		want = want.strip('/')
+		if want in available:
+			selected.add(want)
+		else:
+			prefix = want + '/' if want else ''
+			found = [name for name in names if name.startswith(prefix)]
+			if not found:
+				missing.append(want)
+			selected.update(found)
+	if missing:
+		raise InvalidPackageConfigError('{0:s} does not contain {1:s}'.format('archive "{0:s}"'.format(archive_pth)
+			if archive_pth else 'the archive', ', '.join('"{0:s}"'.format(want) for want in missing)))
+	return sorted(selected)
+
+
+def extract_members(archive_pth, wanted, cache_dir=None, key=None):
+	"""
+	Extract only the needed members of zip archive `archive_pth`, without unpacking the rest. Only the central
+	directory and the selected members are read. Extracted files are cached in a directory per archive content
+	hash, so other resources using the same archive reuse them (and only add what they need).
+
+	:param wanted: Paths of files or directories within the archive (see `select_members`).
+	:param key: Name of the directory for this archive, instead of the content hash (see `archive_hash`).
+	:return: The directory containing the extracted members (at their path in the archive).
+	"""
+	from zipfile import ZipFile  # imported here, since zipfile imports pathlib and more that is rarely needed
+	cache_dir = cache_dir or join(get_cache_dir(), 'archives')
+	dest = join(cache_dir, key or archive_hash(archive_pth, cache_dir=cache_dir))
+	with ZipFile(archive_pth) as archive:
+		for name in select_members(archive.namelist(), wanted, archive_pth=archive_pth):
+			if isabs(name) or normpath(name).startswith('..'):
+				raise ValueError('archive "{0:s}" contains unsafe path "{1:s}"'.format(archive_pth, name))
+			pth = join(dest, name)
+			if exists(pth):
+				continue
+			makedirs(dirname(pth), exist_ok=True)
+			tmp_pth = temp_path(pth)
+			try:
+				with archive.open(name) as fin, open(tmp_pth, 'wb+') as fout:
+					copyfileobj(fin, fout)
+				replace(tmp_pth, pth)
+			finally:
+				if exists(tmp_pth):
+					remove(tmp_pth)
+	return dest
+
+
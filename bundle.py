@@ -0,0 +1,138 @@
+
+from hashlib import sha256
+from json import dumps
+from os.path import basename, dirname, splitext
+from posixpath import relpath
+from re import sub, search
+from .content_cache import get_content_cache
+from .resource import ScriptResource, StyleResource, RELATIVE_CSS_REF
+
+
+BUNDLE_VERSION = 3  # change when the bundle output changes, since bundles are cached by input
+BUNDLE_DIR = 'bundles'
+CSS_CHARSET = r'^\ufeff?@charset\s+"[^"]*"\s*;'
+BASE64_DIGITS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+
+def encode_vlq(value):
+	"""
+	Encode an integer as a base64 variable-length quantity, as used in source map mappings.
+	"""
+	value = ((-value) << 1) | 1 if value < 0 else value << 1
+	encoded = ''
+	while True:
+		digit, value = value & 31, value >> 5
+		encoded += BASE64_DIGITS[digit | (32 if value else 0)]
+		if not value:
+			return encoded
+
+
+def can_bundle(resource):
+	"""
+	Only local (or offline-made) files can be bundled; resources that copy extra files or are inlined are kept apart.
+	So are styles with relative `url()` or `@import` references, which would resolve against the bundle directory.
+	"""
+	if resource.local_path is None or resource.copy_map or resource.internalize:
+		return False
+	return not (isinstance(resource, StyleResource) and search(RELATIVE_CSS_REF, resource.file_content()))
+
+
+class Bundler:
+	"""
+	Concatenates the content of style or script resources into a single file with a source map.
+	"""
+	def __init__(self, members):
+		self.members = members
+		self.is_script = isinstance(members[0], ScriptResource)
+		self.ext = splitext(members[0].local_path)[1] or ('.js' if self.is_script else '.css')
+
+	def _read(self, resource):
+		return resource.file_content()
+
+	def build(self, map_name):
+		"""
+		:return: The bundle content (including a link to the source map) and the source map.
+		"""
+		lines, mappings, sources, contents = [], [], [], []
+		prev_source, prev_line = 0, 0
+		for index, resource in enumerate(self.members):
+			text = self._read(resource)
+			# sources are relative to the source map, which is in the bundle directory
+			sources.append(relpath(resource.relative_path, BUNDLE_DIR))
+			contents.append(text)
+			if index > 0 and not self.is_script:
+				# @charset is only valid at the very start of a stylesheet
+				text = sub(CSS_CHARSET, '', text, count=1)
+			source_lines = text.split('\n')
+			if source_lines and not source_lines[-1]:
+				source_lines.pop()
+			for line_nr, line in enumerate(source_lines):
+				lines.append(line)
+				mappings.append('{0:s}{1:s}{2:s}{3:s}'.format(encode_vlq(0), encode_vlq(index - prev_source),
+					encode_vlq(line_nr - prev_line), encode_vlq(0)))
+				prev_source, prev_line = index, line_nr
+			if self.is_script:
+				# prevent statements from running together between files
+				lines.append(';')
+				mappings.append('')
+		if self.is_script:
+			lines.append('//# sourceMappingURL={0:s}'.format(map_name))
+		else:
+			lines.append('/*# sourceMappingURL={0:s} */'.format(map_name))
+		source_map = dumps({'version': 3, 'file': map_name[:-4], 'sources': sources, 'sourcesContent': contents,
+			'names': [], 'mappings': ';'.join(mappings)})
+		return '\n'.join(lines) + '\n', source_map
+
+	def make_resource(self):
+		"""
+		Write the bundle (and source map) to the content cache and create a resource for it.
+		"""
+		first = self.members[0]
+		digest = sha256('{0:d}\n{1:s}'.format(BUNDLE_VERSION, '\n'.join('{0:s}\t{1:s}'.format(resource.relative_path,
+			self._read(resource)) for resource in self.members)).encode('utf-8')).hexdigest()
+		name = '{0:s}/bundle.{1:.12s}{2:s}'.format(BUNDLE_DIR, digest, self.ext)
+		content, source_map = self.build(basename(name) + '.map')
+		def write(text):
+			def create(pth):
+				with open(pth, 'w+') as fh:
+					fh.write(text)
+			return create
+		cache = get_content_cache('bundle')
+		pth = cache.get_or_create(digest + self.ext, write(content))
+		cache.get_or_create(digest + self.ext + '.map', write(source_map))
+		bundle = first.__class__(logger=first.logger, cache=first.cache, compile_conf=first.compile_conf,
+			group_name='bundle', resource_dir=dirname(pth), local_path=name, allow_minify=False,
+			tag_type=first.tag_type, copy_map={None: name, basename(pth) + '.map': name + '.map'})
+		bundle.processed_path = pth
+		bundle.content_named = True
+		bundle.notes = ['bundle of {0:s}'.format(', '.join('{0:s}{1:s}'.format(resource.relative_path,
+			' ({0:s})'.format('; '.join(resource.notes)) if resource.notes else '') for resource in self.members))]
+		return bundle
+
+
+def bundle_resources(resources):
+	"""
+	Merge consecutive bundleable resources of the same type and `tag_type` into bundles, yielding bundles and
+	unbundleable resources in the original order. Resources are only grouped while consecutive, since for example a
+	local script may rely on a remote one (or a config script of another type) before it.
+	"""
+	run = []
+	for resource in resources:
+		if run and not (can_bundle(resource) and type(resource) is type(run[0])
+				and resource.tag_type == run[0].tag_type):
+			yield _finish_run(run)
+			run = []
+		if can_bundle(resource):
+			run.append(resource)
+		else:
+			yield resource
+	if run:
+		yield _finish_run(run)
+
+
+def _finish_run(run):
+	if len(run) == 1:
+		return run[0]
+	return Bundler(run).make_resource()
+
+
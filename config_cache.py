@@ -0,0 +1,42 @@
+
+from hashlib import sha1
+from os import stat, replace, remove, makedirs
+from os.path import join, abspath
+from pickle import load, dump, HIGHEST_PROTOCOL, UnpicklingError
+from .locking import temp_path
+from .utils import get_cache_dir
+
+
+def get_cached(pth, create, version='', cache_dir=None):
+	"""
+	Get the result of `create(pth)` from a binary cache shared between processes, keyed by path, modification time
+	and size of file `pth` (and `version`, which should change whenever `create` does). Exceptions from `create`
+	are raised and nothing is cached.
+	"""
+	info = stat(pth)
+	key = (abspath(pth), info.st_mtime_ns, info.st_size, version)
+	if cache_dir is None:
+		cache_dir = join(get_cache_dir(), 'config')
+	cache_pth = join(cache_dir, '{0:s}.pickle'.format(sha1(key[0].encode('utf-8')).hexdigest()))
+	try:
+		with open(cache_pth, 'rb') as fh:
+			cached_key, value = load(fh)
+		if cached_key == key:
+			return value
+	except (OSError, EOFError, ValueError, UnpicklingError):
+		pass
+	value = create(pth)
+	tmp_pth = temp_path(cache_pth)
+	try:
+		makedirs(cache_dir, exist_ok=True)
+		with open(tmp_pth, 'wb+') as fh:
+			dump((key, value), fh, protocol=HIGHEST_PROTOCOL)
+		replace(tmp_pth, cache_pth)
+	except OSError:
+		try:
+			remove(tmp_pth)
+		except OSError:
+			pass
+	return value
+
+
@@ -0,0 +1,133 @@
+
+from os import makedirs, replace, remove, scandir, stat, utime
+from os.path import join, exists
+from threading import RLock
+from time import time_ns
+from .locking import temp_path
+from .utils import get_cache_dir
+
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+MIN_EVICT_AGE_NS = 10 * 60 * 10**9
+
+
+class ContentCache:
+	"""
+	Files stored under a key derived from their content (so identical inputs share one entry), shared between
+	compiles. The total size is bounded by removing the least recently used entries.
+
+	The total size is counted once and then kept up to date as entries are added, so the cache is only scanned again
+	when it seems to be over `max_size` (entries added by other processes are counted at that point).
+	"""
+	def __init__(self, name, max_size=DEFAULT_MAX_SIZE, cache_dir=None):
+		"""
+		:param name: Subdirectory of the cache directory used for these entries.
+		:param max_size: Maximum total size in bytes; entries used in the last few minutes are never removed.
+		"""
+		self.dir = join(cache_dir or get_cache_dir(), name)
+		self.max_size = max_size
+		self.lock = RLock()
+		self._size = None
+		self._evict_above = max_size
+		makedirs(self.dir, exist_ok=True, mode=0o700)
+
+	def __repr__(self):
+		return '<{0:s} "{1:s}">'.format(self.__class__.__name__, self.dir)
+
+	def path(self, key):
+		return join(self.dir, key[:2], key)
+
+	def get(self, key):
+		"""
+		Get the path of entry `key` (marking it as used), or None if it is not cached.
+		"""
+		pth = self.path(key)
+		try:
+			# the access time is set explicitly, since it is not updated on reading for many filesystems
+			utime(pth, ns=(time_ns(), stat(pth).st_mtime_ns))
+		except FileNotFoundError:
+			return None
+		return pth
+
+	def get_or_create(self, key, create):
+		"""
+		Get the path of entry `key`, first calling `create(path)` to write it if it is not cached.
+		"""
+		pth = self.get(key)
+		if pth is not None:
+			return pth
+		pth = self.path(key)
+		makedirs(join(self.dir, key[:2]), exist_ok=True, mode=0o700)
+		tmp_pth = temp_path(pth)
+		try:
+			create(tmp_pth)
+			size = stat(tmp_pth).st_size
+			replace(tmp_pth, pth)
+		finally:
+			if exists(tmp_pth):
+				remove(tmp_pth)
+		with self.lock:
+			if self._size is None:
+				self._size = self._scan()[1]
+			else:
+				self._size += size
+			if self._size > self._evict_above:
+				self.evict()
+		return pth
+
+	def _scan(self):
+		"""
+		List the entries as (access time, size, path), and count their total size.
+		"""
+		entries, total = [], 0
+		for subdir in scandir(self.dir):
+			if not subdir.is_dir():
+				continue
+			for entry in scandir(subdir.path):
+				if entry.name.endswith('.tmp'):
+					continue
+				try:
+					info = entry.stat()
+				except FileNotFoundError:
+					continue
+				entries.append((info.st_atime_ns, info.st_size, entry.path))
+				total += info.st_size
+		return entries, total
+
+	def evict(self):
+		"""
+		Remove the least recently used entries until the total size is below `max_size`.
+		"""
+		with self.lock:
+			entries, total = self._scan()
+			self._size, self._evict_above = total, self.max_size
+			if total <= self.max_size:
+				return
+			recent = time_ns() - MIN_EVICT_AGE_NS
+			for atime, size, pth in sorted(entries):
+				if total <= self.max_size or atime > recent:
+					break
+				try:
+					remove(pth)
+				except FileNotFoundError:
+					pass
+				total -= size
+			# if recently used entries could not be removed, wait until a bit more was added before scanning again
+			self._size = total
+			self._evict_above = max(self.max_size, total + self.max_size // 8)
+
+
+_CACHES = {}
+_CACHES_LOCK = RLock()
+
+
+def get_content_cache(name, **kwargs):
+	"""
+	Get the (process-wide) content cache `name`.
+	"""
+	with _CACHES_LOCK:
+		if name not in _CACHES:
+			_CACHES[name] = ContentCache(name, **kwargs)
+		return _CACHES[name]
+
+
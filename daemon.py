@@ -0,0 +1,233 @@
+
+from json import loads, dumps
+from os import fork, waitpid, remove, chmod, _exit, WNOHANG
+from os.path import exists
+from socket import socket, AF_UNIX, SOCK_STREAM
+from traceback import format_exc
+from .package import Package, LazyAction, forget_modules
+from .packages import PackageList
+from .resolver import resolve_versions
+from .signatures import file_stats
+from .snapshot import load_package_list
+from .utils import get_package_dir
+
+
+def preload_actions(package):
+	"""
+	Import and instantiate all lazily loaded actions of `package`, so that forked workers share them.
+	"""
+	actions = list(package.pre_processors) + list(package.tags.values()) + list(package.compilers) + \
+		list(package.linkers) + list(package.post_processors) + [package.parser, package.renderer]
+	for action in actions:
+		if isinstance(action, LazyAction):
+			action.resolve()
+
+
+def package_state(package):
+	"""
+	The listing of the package's files, which stays valid while no directory modification time changes (so files
+	were not added or removed), and for directories the size and modification time of config.json and the python
+	modules, which change when those are edited in place. Other files, like styles, are read when used, so they are
+	not checked.
+	"""
+	index = package.get_index()
+	if package.is_archive:
+		return index, None
+	names = [relpth for relpth in [package.config_file('')] + index.glob('**/*.py') if index.isfile(relpth)]
+	return index, file_stats(package.path, names)
+
+
+def is_unchanged(state):
+	index, stats = state
+	if not index.is_valid():
+		return False
+	if stats is None:
+		return True
+	try:
+		return file_stats(index.path, stats.keys()) == stats
+	except FileNotFoundError:
+		return False
+
+
+class CompileDaemon:
+	"""
+	Keeps the packages for a document loaded and handles compile requests sent to a Unix socket. Every request is
+	handled in a forked worker, which shares the loaded packages and imported actions with the daemon
+	(copy-on-write), so changes made while compiling do not affect later requests. Before each request, packages
+	whose files changed (or for which another version should now be chosen) are reloaded, and their modules imported
+	again.
+
+	Requests and responses are single lines of json. `{"action": "ping"}`, `{"action": "reload"}` and
+	`{"action": "stop"}` are handled by the daemon; anything else is passed to `handler(package_list, request)`,
+	which returns the (json-serializable) response.
+	"""
+	def __init__(self, socket_path, handler, requests, logger, cache, compile_conf, document_conf, *,
+			packages_dir=None, lockfile=None, max_workers=4, **kwargs):
+		"""
+		:param requests: Sequence of (name, version range, options) tuples for the packages to keep loaded.
+		:param lockfile: Path of a lockfile with the resolved versions, used on every (re)load if valid.
+		:param max_workers: Maximum number of requests handled at the same time.
+		:param kwargs: Passed on to PackageList.
+		"""
+		self.socket_path = socket_path
+		self.handler = handler
+		self.requests = tuple(requests)
+		self.logger = logger
+		self.cache = cache
+		self.compile_conf = compile_conf
+		self.document_conf = document_conf
+		self.packages_dir = packages_dir or get_package_dir()
+		self.lockfile = lockfile
+		self.max_workers = max_workers
+		self.kwargs = kwargs
+		self.workers = set()
+		self.package_list = None
+		self.states = []
+
+	def load(self):
+		self.package_list = load_package_list(self.requests, logger=self.logger, cache=self.cache,
+			compile_conf=self.compile_conf, document_conf=self.document_conf, packages_dir=self.packages_dir,
+			lockfile=self.lockfile, **self.kwargs)
+		for package in self.package_list.packages:
+			preload_actions(package)
+		self.states = [package_state(package) for package in self.package_list.packages]
+
+	def reload_changed(self):
+		"""
+		Reload only the packages whose resolved version or files changed; others are kept as they are. Versions are
+		resolved again (including required packages and the lockfile), the same way as when loading. The modules of
+		reloaded packages are removed from `sys.modules` first, so their actions are imported from the new files.
+		"""
+		resolved = resolve_versions(self.requests, packages_dir=self.packages_dir, lockfile=self.lockfile,
+			logger=self.logger)
+		current = {old.name: (old, state) for old, state in zip(self.package_list.packages, self.states)}
+		packages, changed = [], []
+		for item in resolved:
+			old, state = current.get(item.name, (None, None))
+			if old is not None and (old.version, old.path) == (item.version, item.path) and is_unchanged(state):
+				packages.append(old)
+				continue
+			package = Package(item.name, item.version_request, item.options, logger=self.logger, cache=self.cache,
+				compile_conf=self.compile_conf, packages_dir=self.packages_dir, locked=(item.version, item.path))
+			changed.append(package)
+			packages.append(package)
+		if not changed and len(packages) == len(self.package_list.packages):
+			return []
+		self.logger.info('reloading changed packages: {0:s}'.format(', '.join(str(package) for package in changed)),
+			level=1)
+		for package in changed:
+			forget_modules(package.name)
+		package_list = PackageList([], logger=self.logger, cache=self.cache, compile_conf=self.compile_conf,
+			document_conf=self.document_conf, **self.kwargs)
+		for package in packages:
+			package.packages = package_list
+		package_list.add_packages(packages)
+		for package in changed:
+			preload_actions(package)
+		self.package_list = package_list
+		self.states = [package_state(package) for package in package_list.packages]
+		return changed
+
+	def _reap(self, block=False):
+		while self.workers:
+			pid, status = waitpid(-1, 0 if block else WNOHANG)
+			if pid == 0:
+				return
+			self.workers.discard(pid)
+			if block:
+				return
+
+	def _respond(self, conn, response):
+		conn.sendall((dumps(response) + '\n').encode('utf-8'))
+
+	def _read_request(self, conn):
+		data = b''
+		while not data.endswith(b'\n'):
+			chunk = conn.recv(65536)
+			if not chunk:
+				break
+			data += chunk
+		return loads(data.decode('utf-8'))
+
+	def _handle_in_worker(self, conn, server, request):
+		pid = fork()
+		if pid:
+			self.workers.add(pid)
+			return
+		try:
+			server.close()
+			try:
+				response = {'ok': True, 'result': self.handler(self.package_list, request)}
+			except Exception as err:
+				response = {'ok': False, 'error': str(err), 'traceback': format_exc()}
+			self._respond(conn, response)
+			conn.close()
+		finally:
+			_exit(0)
+
+	def serve_forever(self):
+		"""
+		Load the packages and handle requests until a stop request arrives.
+		"""
+		if self.package_list is None:
+			self.load()
+		if exists(self.socket_path):
+			remove(self.socket_path)
+		server = socket(AF_UNIX, SOCK_STREAM)
+		server.bind(self.socket_path)
+		# only the owner may send requests (connecting fails until `listen`, so there is no window before this)
+		chmod(self.socket_path, 0o600)
+		server.listen(16)
+		self.logger.info('compile daemon listening on "{0:s}"'.format(self.socket_path), level=1)
+		try:
+			while True:
+				conn, _ = server.accept()
+				try:
+					request = self._read_request(conn)
+					action = request.get('action', None)
+					if action == 'ping':
+						self._respond(conn, {'ok': True, 'result': 'pong'})
+					elif action == 'stop':
+						self._respond(conn, {'ok': True, 'result': 'stopping'})
+						return
+					elif action == 'reload':
+						changed = self.reload_changed()
+						self._respond(conn, {'ok': True, 'result': [str(package) for package in changed]})
+					else:
+						self.reload_changed()
+						self._reap()
+						while len(self.workers) >= self.max_workers:
+							self._reap(block=True)
+						self._handle_in_worker(conn, server, request)
+				except Exception as err:
+					self.logger.info('could not handle daemon request: {0:}'.format(err), level=1)
+					try:
+						self._respond(conn, {'ok': False, 'error': str(err)})
+					except OSError:
+						pass
+				finally:
+					conn.close()
+		finally:
+			server.close()
+			remove(self.socket_path)
+			while self.workers:
+				self._reap(block=True)
+
+
+def send_request(socket_path, request, timeout=None):
+	"""
+	Send a request to a running CompileDaemon and return its response.
+	"""
+	with socket(AF_UNIX, SOCK_STREAM) as conn:
+		conn.settimeout(timeout)
+		conn.connect(socket_path)
+		conn.sendall((dumps(request) + '\n').encode('utf-8'))
+		data = b''
+		while not data.endswith(b'\n'):
+			chunk = conn.recv(65536)
+			if not chunk:
+				break
+			data += chunk
+	return loads(data.decode('utf-8'))
+
+
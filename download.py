@@ -0,0 +1,207 @@
+
+from collections import OrderedDict
+from hashlib import sha256
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from json import load, dump
+from os import makedirs, replace, remove
+from os.path import join, exists, splitext
+from shutil import copyfileobj
+from threading import local
+from time import sleep, time
+from urllib.parse import urlsplit, urljoin
+from .locking import temp_path
+from .utils import get_cache_dir, run_parallel, DownloadError
+
+
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+
+
+class Downloader:
+	"""
+	Downloads remote files to a cache directory. Many files can be fetched concurrently, and each thread keeps one
+	connection per host open for reuse. Cached copies are revalidated with ETag / If-Modified-Since once they are
+	older than `max_age`, and failed requests are retried with exponential backoff.
+	"""
+	def __init__(self, cache_dir=None, *, workers=8, per_host=2, retries=3, backoff=0.5, timeout=30, max_age=3600,
+			logger=None):
+		"""
+		:param workers: Maximum number of concurrent downloads.
+		:param per_host: Maximum number of concurrent connections to a single host.
+		:param max_age: Seconds during which a cached copy is used without asking the server (0 to always ask).
+		"""
+		self.dir = cache_dir or join(get_cache_dir(), 'download')
+		makedirs(self.dir, exist_ok=True, mode=0o700)
+		self.workers = workers
+		self.per_host = per_host
+		self.retries = retries
+		self.backoff = backoff
+		self.timeout = timeout
+		self.max_age = max_age
+		self.logger = logger
+		self._local = local()
+
+	def __repr__(self):
+		return '<{0:s} "{1:s}">'.format(self.__class__.__name__, self.dir)
+
+	def _log(self, msg, level=2):
+		if self.logger is not None:
+			self.logger.info(msg, level=level)
+
+	@staticmethod
+	def normalize_url(url):
+		if url.startswith('//'):
+			return 'https:' + url
+		return url
+
+	def path_for(self, url):
+		url = self.normalize_url(url)
+		ext = splitext(urlsplit(url).path)[1][:12]
+		return join(self.dir, sha256(url.encode('utf-8')).hexdigest() + ext)
+
+	def _read_meta(self, pth):
+		try:
+			with open(pth + '.meta', 'r') as fh:
+				return load(fh)
+		except (FileNotFoundError, ValueError):
+			return None
+
+	def _write_meta(self, pth, meta):
+		tmp_pth = temp_path(pth + '.meta')
+		with open(tmp_pth, 'w+') as fh:
+			dump(meta, fh)
+		replace(tmp_pth, pth + '.meta')
+
+	def _get_connection(self, scheme, netloc):
+		connections = getattr(self._local, 'connections', None)
+		if connections is None:
+			connections = self._local.connections = {}
+		if (scheme, netloc) not in connections:
+			cls = HTTPSConnection if scheme == 'https' else HTTPConnection
+			connections[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+		return connections[(scheme, netloc)]
+
+	def _drop_connection(self, scheme, netloc):
+		connection = getattr(self._local, 'connections', {}).pop((scheme, netloc), None)
+		if connection is not None:
+			connection.close()
+
+	def close(self):
+		"""
+		Close the connections opened by the current thread (those of pool threads are closed by `fetch_all`).
+		"""
+		for connection in getattr(self._local, 'connections', {}).values():
+			connection.close()
+		self._local.connections = {}
+
+	def _request(self, url, headers, pth, redirects=5):
+		"""
+		Perform a single GET, writing a 200 response to `pth`. Returns the response status and headers.
+		"""
+		parts = urlsplit(url)
+		target = parts.path or '/'
+		if parts.query:
+			target += '?' + parts.query
+		connection = self._get_connection(parts.scheme, parts.netloc)
+		try:
+			connection.request('GET', target, headers=headers)
+			response = connection.getresponse()
+		except (OSError, HTTPException):
+			self._drop_connection(parts.scheme, parts.netloc)
+			raise
+		if response.status in REDIRECT_CODES and redirects > 0:
+			response.read()
+			location = urljoin(url, response.getheader('Location'))
+			self._log('  {0:s} redirected to {1:s}'.format(url, location), level=3)
+			return self._request(location, headers, pth, redirects=redirects - 1)
+		if response.status == 200:
+			tmp_pth = temp_path(pth)
+			try:
+				with open(tmp_pth, 'wb+') as fh:
+					copyfileobj(response, fh)
+				replace(tmp_pth, pth)
+			finally:
+				if exists(tmp_pth):
+					remove(tmp_pth)
+		else:
+			response.read()
+		if response.getheader('Connection', '').lower() == 'close':
+			self._drop_connection(parts.scheme, parts.netloc)
+		return response.status, response
+
+	def fetch(self, url):
+		"""
+		Get the path of a cached copy of `url`, downloading or revalidating it if needed.
+		"""
+		url = self.normalize_url(url)
+		pth = self.path_for(url)
+		meta = self._read_meta(pth) if exists(pth) else None
+		if meta is not None and time() - meta.get('checked', 0) < self.max_age:
+			return pth
+		headers = {'Accept-Encoding': 'identity'}
+		if meta is not None:
+			if meta.get('etag', None):
+				headers['If-None-Match'] = meta['etag']
+			if meta.get('last_modified', None):
+				headers['If-Modified-Since'] = meta['last_modified']
+		for attempt in range(self.retries + 1):
+			try:
+				status, response = self._request(url, headers, pth)
+			except (OSError, HTTPException) as err:
+				status, response, problem = None, None, err
+			else:
+				problem = 'status {0:d}'.format(status)
+			if status == 304 and meta is not None:
+				self._log('  {0:s} not modified'.format(url), level=3)
+				meta['checked'] = time()
+				self._write_meta(pth, meta)
+				return pth
+			if status == 200:
+				self._log('  downloaded {0:s}'.format(url), level=2)
+				self._write_meta(pth, {'url': url, 'checked': time(), 'etag': response.getheader('ETag', None),
+					'last_modified': response.getheader('Last-Modified', None)})
+				return pth
+			if status is not None and status < 500 and status != 429:
+				break
+			if attempt < self.retries:
+				self._log('  retrying {0:s} after {1:}'.format(url, problem), level=2)
+				sleep(self.backoff * 2 ** attempt)
+		if meta is not None:
+			self._log('  could not revalidate {0:s} ({1:}); using cached copy'.format(url, problem), level=1)
+			return pth
+		raise DownloadError('could not download "{0:s}": {1:}'.format(url, problem))
+
+	def fetch_all(self, urls):
+		"""
+		Fetch several urls concurrently. The urls of each host are split into at most `per_host` batches; a batch is
+		fetched over a single connection.
+
+		:return: A mapping from url to path, and a mapping from url to exception for the ones that failed.
+		"""
+		by_host = OrderedDict()
+		for url in sorted(set(urls)):
+			by_host.setdefault(urlsplit(self.normalize_url(url)).netloc, []).append(url)
+		batches = [tuple(host_urls[k::self.per_host]) for host_urls in by_host.values()
+			for k in range(min(self.per_host, len(host_urls)))]
+		def fetch_batch(batch):
+			results = []
+			try:
+				for url in batch:
+					try:
+						results.append((url, self.fetch(url), None))
+					except (DownloadError, OSError, HTTPException) as err:
+						results.append((url, None, err))
+			finally:
+				self.close()
+			return results
+		paths, errors = {}, {}
+		for batch, results, err in run_parallel(fetch_batch, batches, workers=self.workers):
+			if err is not None:
+				raise err
+			for url, pth, url_err in results:
+				if url_err is None:
+					paths[url] = pth
+				else:
+					errors[url] = url_err
+		return paths, errors
+
+
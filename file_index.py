@@ -0,0 +1,139 @@
+
+from os import scandir, stat
+from os.path import join
+from re import compile, escape
+from threading import RLock
+
+
+def translate_glob(pattern):
+	"""
+	Convert a glob pattern with '/' separators to a regular expression. Like `glob`, `*` and `?` do not match '/' or
+	a leading '.', while `**` matches any number of directories (including none).
+	"""
+	parts, k = [], 0
+	while k < len(pattern):
+		char = pattern[k]
+		at_start = k == 0 or pattern[k - 1] == '/'
+		if pattern.startswith('**/', k) and at_start:
+			parts.append(r'(?:(?!\.)[^/]*/)*')
+			k += 3
+			continue
+		if pattern.startswith('**', k) and at_start and k + 2 == len(pattern):
+			parts.append(r'(?:(?!\.)[^/]*(?:/(?!\.)[^/]*)*)?')
+			k += 2
+			continue
+		if char == '*':
+			parts.append(r'(?!\.)[^/]*' if at_start else r'[^/]*')
+		elif char == '?':
+			parts.append(r'(?!\.)[^/]' if at_start else r'[^/]')
+		elif char == '[' and ']' in pattern[k + 2:]:
+			end = pattern.index(']', k + 2)
+			content = pattern[k + 1:end]
+			if content.startswith('!'):
+				content = '^' + content[1:]
+			parts.append('[{0:s}]'.format(content.replace('\\', '\\\\')))
+			k = end
+		else:
+			parts.append(escape(char))
+		k += 1
+	return compile('^{0:s}$'.format(''.join(parts)))
+
+
+class FileListing:
+	"""
+	Answers glob patterns, existence checks and file listings from the relative paths in `files` and `dirs`.
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.files = set()
+		self.dirs = {}
+		self._patterns = {}
+
+	def __repr__(self):
+		return '<{0:s} "{1:s}": {2:d} files>'.format(self.__class__.__name__, self.path, len(self.files))
+
+	@staticmethod
+	def _normalize(relpth):
+		relpth = relpth.replace('\\', '/')
+		while relpth.startswith('./'):
+			relpth = relpth[2:]
+		return relpth.rstrip('/')
+
+	def list_files(self):
+		return sorted(self.files)
+
+	def isfile(self, relpth):
+		return self._normalize(relpth) in self.files
+
+	def exists(self, relpth):
+		relpth = self._normalize(relpth)
+		return relpth in self.files or relpth in self.dirs
+
+	def glob(self, pattern):
+		"""
+		Sorted relative paths of files and directories matching `pattern` (relative to `path`).
+		"""
+		pattern = self._normalize(pattern)
+		if pattern not in self._patterns:
+			regex = translate_glob(pattern)
+			self._patterns[pattern] = sorted(pth for pth in self.files.union(self.dirs.keys())
+				if pth and regex.match(pth))
+		return list(self._patterns[pattern])
+
+
+class DirectoryIndex(FileListing):
+	"""
+	All files and directories below `path`, found in a single scandir pass, to answer glob patterns, existence checks
+	and file listings from memory. It stays valid while no directory modification time changes.
+	"""
+	def __init__(self, path):
+		super(DirectoryIndex, self).__init__(path)
+		self._scan()
+
+	def _scan(self):
+		"""
+		Like `os.walk`, symlinks to directories are listed but not followed.
+		"""
+		self.dirs[''] = stat(self.path).st_mtime_ns
+		todo = ['']
+		while todo:
+			reldir = todo.pop()
+			with scandir(join(self.path, reldir)) as entries:
+				for entry in entries:
+					relpth = '{0:s}/{1:s}'.format(reldir, entry.name) if reldir else entry.name
+					if entry.is_dir():
+						if entry.is_symlink():
+							self.dirs[relpth] = None
+						else:
+							self.dirs[relpth] = entry.stat().st_mtime_ns
+							todo.append(relpth)
+					else:
+						self.files.add(relpth)
+
+	def is_valid(self):
+		for reldir, mtime in self.dirs.items():
+			if mtime is None:
+				continue
+			try:
+				if stat(join(self.path, reldir)).st_mtime_ns != mtime:
+					return False
+			except FileNotFoundError:
+				return False
+		return True
+
+
+_INDEXES = {}
+_INDEXES_LOCK = RLock()
+
+
+def get_directory_index(path):
+	"""
+	Get the (process-wide) index for `path`, rescanning it if a directory in it changed.
+	"""
+	with _INDEXES_LOCK:
+		index = _INDEXES.get(path, None)
+		if index is None or not index.is_valid():
+			index = _INDEXES[path] = DirectoryIndex(path)
+		return index
+
+
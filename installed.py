@@ -0,0 +1,198 @@
+
+from json import load, dump
+from os import listdir, stat, replace, remove, makedirs
+from os.path import join
+from threading import RLock
+from .locking import temp_path
+from .utils import unique_package_name
+from .zip_package import ARCHIVE_EXT
+
+
+INDEX_DIR = '.index'
+INDEX_NAME = 'installed.json'
+INDEX_VERSION = 1
+
+
+class InstalledIndex:
+	"""
+	Index of installed packages and versions in a packages directory, keyed by unique package name.
+
+	The index is stored on disk (in a subdirectory, so writing it does not change the packages directory) and kept
+	in memory. It remains valid while the modification times of the packages directory and of the package's own
+	directory are unchanged; stale entries are relisted and the index is rewritten.
+	"""
+	def __init__(self, packages_dir):
+		self.packages_dir = packages_dir
+		self.index_path = join(packages_dir, INDEX_DIR, INDEX_NAME)
+		self.mtime = None
+		self.packages = {}
+		self.lock = RLock()
+		self._read()
+
+	def __repr__(self):
+		return '<{0:s} for "{1:s}": {2:d} packages>'.format(self.__class__.__name__, self.packages_dir,
+			len(self.packages))
+
+	def _read(self):
+		try:
+			with open(self.index_path, 'r') as fh:
+				data = load(fh)
+		except (FileNotFoundError, ValueError):
+			return
+		if data.get('version', None) != INDEX_VERSION:
+			return
+		self.mtime = data['mtime']
+		self.packages = data['packages']
+
+	def _write(self):
+		"""
+		Write to a temporary file and rename it, so other processes see either the old or the new index.
+		"""
+		tmp_pth = temp_path(self.index_path)
+		try:
+			makedirs(join(self.packages_dir, INDEX_DIR), exist_ok=True)
+			with open(tmp_pth, 'w+') as fh:
+				dump({'version': INDEX_VERSION, 'mtime': self.mtime, 'packages': self.packages}, fh, indent=1)
+			replace(tmp_pth, self.index_path)
+		except OSError:
+			# a read-only (e.g. shared) packages directory; keep the index in memory
+			try:
+				remove(tmp_pth)
+			except OSError:
+				pass
+
+	def _list_versions(self, dirname):
+		"""
+		Versions are directories, or archives named `<version>.zip` (see `PackageArchive`).
+		"""
+		return sorted({version[:-len(ARCHIVE_EXT)] if version.endswith(ARCHIVE_EXT) else version
+			for version in listdir(join(self.packages_dir, dirname)) if not version.startswith('.')})
+
+	def _mtime(self, *parts):
+		return stat(join(self.packages_dir, *parts)).st_mtime_ns
+
+	def _refresh(self):
+		"""
+		Relist the packages directory if it changed, keeping entries for package directories that did not change.
+		"""
+		mtime = self._mtime()
+		if mtime == self.mtime:
+			return False
+		packages = {}
+		for dirname in listdir(self.packages_dir):
+			if dirname.startswith('.'):
+				continue
+			try:
+				name = unique_package_name(dirname)
+			except AssertionError:
+				continue
+			try:
+				pkg_mtime = self._mtime(dirname)
+			except FileNotFoundError:
+				continue
+			known = self.packages.get(name, None)
+			if known and known['dir'] == dirname and known['mtime'] == pkg_mtime:
+				packages[name] = known
+			else:
+				packages[name] = {'dir': dirname, 'mtime': pkg_mtime, 'versions': self._list_versions(dirname)}
+		self.mtime, self.packages = mtime, packages
+		return True
+
+	def _get_entry(self, name):
+		try:
+			name = unique_package_name(name)
+		except AssertionError:
+			return None
+		with self.lock:
+			changed = self._refresh()
+			entry = self.packages.get(name, None)
+			if entry is not None:
+				try:
+					pkg_mtime = self._mtime(entry['dir'])
+				except FileNotFoundError:
+					pkg_mtime = None
+				if pkg_mtime is None:
+					del self.packages[name]
+					entry, changed = None, True
+				elif pkg_mtime != entry['mtime']:
+					entry['mtime'], entry['versions'] = pkg_mtime, self._list_versions(entry['dir'])
+					changed = True
+			if changed:
+				self._write()
+			return entry
+
+	def get_versions(self, name):
+		"""
+		Get the sorted installed versions of package `name`, or None if it is not installed.
+		"""
+		entry = self._get_entry(name)
+		if entry is None:
+			return None
+		return list(entry['versions'])
+
+	def names(self):
+		with self.lock:
+			if self._refresh():
+				self._write()
+			return sorted(entry['dir'] for entry in self.packages.values())
+
+	def fingerprint(self):
+		"""
+		A string that changes whenever the set of installed packages or versions changes.
+		"""
+		with self.lock:
+			if self._refresh():
+				self._write()
+			for name in tuple(self.packages.keys()):
+				self._get_entry(name)
+			return '\n'.join('{0:s}\t{1:s}'.format(name, ','.join(self.packages[name]['versions']))
+				for name in sorted(self.packages.keys()))
+
+	def _update(self, name, version, add):
+		name_dir = name
+		name = unique_package_name(name)
+		with self.lock:
+			self._refresh()
+			entry = self.packages.setdefault(name, {'dir': name_dir, 'mtime': None, 'versions': []})
+			versions = set(entry['versions'])
+			if add:
+				versions.add(version)
+			else:
+				versions.discard(version)
+			entry['versions'] = sorted(versions)
+			try:
+				entry['mtime'] = self._mtime(entry['dir'])
+			except FileNotFoundError:
+				entry['mtime'] = None
+			if not entry['versions']:
+				del self.packages[name]
+			self.mtime = self._mtime()
+			self._write()
+
+	def add(self, name, version):
+		"""
+		Register a newly installed version (call after the version directory is in place).
+		"""
+		self._update(name, version, add=True)
+
+	def remove(self, name, version):
+		"""
+		Unregister a version (call after the version directory has been removed).
+		"""
+		self._update(name, version, add=False)
+
+
+_INDEXES = {}
+_INDEXES_LOCK = RLock()
+
+
+def get_installed_index(packages_dir):
+	"""
+	Get the (process-wide) installed package index for `packages_dir`.
+	"""
+	with _INDEXES_LOCK:
+		if packages_dir not in _INDEXES:
+			_INDEXES[packages_dir] = InstalledIndex(packages_dir)
+		return _INDEXES[packages_dir]
+
+
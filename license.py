@@ -1,14 +1,45 @@
 
+from collections.abc import Mapping
 from os import listdir
 from os.path import join, dirname
 
 
 dir = join(dirname(__file__), 'licenses')
-files = listdir(dir)
 
-LICENSES = {}
-for file in listdir(dir):
-	with open(join(dir, file)) as fh:
-		LICENSES[file] = fh.read()
+
+class LicenseTexts(Mapping):
+	"""
+	License texts by name, read from the licenses directory when they are first used.
+	"""
+	def __init__(self, dir):
+		self.dir = dir
+		self._names = None
+		self._texts = {}
+
+	@property
+	def names(self):
+		if self._names is None:
+			self._names = sorted(listdir(self.dir))
+		return self._names
+
+	def __getitem__(self, name):
+		if name not in self._texts:
+			if name not in self.names:
+				raise KeyError(name)
+			with open(join(self.dir, name)) as fh:
+				self._texts[name] = fh.read()
+		return self._texts[name]
+
+	def __contains__(self, name):
+		return name in self.names
+
+	def __iter__(self):
+		return iter(self.names)
+
+	def __len__(self):
+		return len(self.names)
+
+
+LICENSES = LicenseTexts(dir)
 
 
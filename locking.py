@@ -0,0 +1,101 @@
+
+from contextlib import contextmanager
+from errno import EISDIR, ENOTDIR, ENOTEMPTY, EEXIST
+from os import getpid, replace, rename, remove, makedirs
+from os.path import dirname, islink, isdir, lexists
+from shutil import rmtree
+from threading import get_ident
+try:
+	from fcntl import flock, LOCK_EX, LOCK_UN
+except ImportError:
+	flock = None
+
+
+def temp_path(pth):
+	"""
+	A temporary path next to `pth` that is unique per process and thread, to write to before moving it into place.
+	"""
+	return '{0:s}.{1:d}-{2:d}.tmp'.format(pth, getpid(), get_ident())
+
+
+@contextmanager
+def file_lock(pth):
+	"""
+	Hold an exclusive lock on file `pth` (created if needed), which excludes other processes as well as other
+	threads. Without `fcntl` (i.e. on Windows), this does not lock.
+	"""
+	makedirs(dirname(pth), exist_ok=True)
+	with open(pth, 'a+') as fh:
+		if flock is not None:
+			flock(fh.fileno(), LOCK_EX)
+		try:
+			yield
+		finally:
+			if flock is not None:
+				flock(fh.fileno(), LOCK_UN)
+
+
+def remove_path(pth):
+	"""
+	Remove a file, symlink or directory tree.
+	"""
+	if isdir(pth) and not islink(pth):
+		rmtree(pth)
+	else:
+		remove(pth)
+
+
+def publish(tmp_pth, pth):
+	"""
+	Move `tmp_pth` to `pth`, replacing what is there. Files and symlinks are replaced atomically, so readers see
+	either the old or the new one. A directory cannot be replaced in one step, so an existing one is moved aside
+	first (leaving `pth` missing very briefly) and removed afterwards.
+	"""
+	try:
+		replace(tmp_pth, pth)
+	except OSError as err:
+		if err.errno not in (EISDIR, ENOTDIR, ENOTEMPTY, EEXIST):
+			raise
+		old_pth = temp_path(pth + '.old')
+		rename(pth, old_pth)
+		replace(tmp_pth, pth)
+		remove_path(old_pth)
+
+
+def create_atomic(pth, create):
+	"""
+	Call `create(tmp_pth)` to make a file, directory or symlink at a temporary path, then `publish` it at `pth`.
+	"""
+	tmp_pth = temp_path(pth)
+	try:
+		create(tmp_pth)
+		publish(tmp_pth, pth)
+	finally:
+		if lexists(tmp_pth):
+			remove_path(tmp_pth)
+	return pth
+
+
+def create_once(pth, create):
+	"""
+	Like `create_atomic`, unless `pth` already exists. Existing paths are used without locking; creating is done
+	under a lock, so concurrent processes do not replace each other's result while it may be in use.
+	"""
+	if lexists(pth):
+		return pth
+	with file_lock(pth + '.lock'):
+		if not lexists(pth):
+			create_atomic(pth, create)
+	return pth
+
+
+def write_atomic(pth, text):
+	"""
+	Write text file `pth` through a temporary file, so readers never see it half written.
+	"""
+	def write(tmp_pth):
+		with open(tmp_pth, 'w+') as fh:
+			fh.write(text)
+	return create_atomic(pth, write)
+
+
@@ -3,19 +3,25 @@ from datetime import datetime
 from inspect import isclass
 from collections import OrderedDict
 from copy import copy
-from sys import stderr
-from json_tricks.nonp import load
-from os import listdir, walk, remove
-from os.path import join, relpath, exists
-from package_versions import VersionRange, VersionRangeMismatch
-from shutil import rmtree
-from compiler.utils import hash_str, hash_file, import_obj, link_or_copy
+from importlib.util import spec_from_loader, module_from_spec
+from sys import stderr, modules
+from threading import Lock
+from os import remove, stat
+from os.path import join, exists
+from zipimport import zipimporter, ZipImportError
+from compiler.utils import hash_str, import_obj, link_or_copy
 from notexp.bases import Configuration
-from notexp.utils import PackageNotInstalledError, InvalidPackageConfigError
+from notexp.utils import PackageError, PackageNotInstalledError, InvalidPackageConfigError
 from frozenobj import frozen
 from .license import LICENSES
+from .config_cache import get_cached
+from .file_index import get_directory_index
+from .installed import get_installed_index
+from .locking import file_lock, create_atomic, write_atomic
 from .resource import get_resources
+from .signatures import MANIFEST_NAME, read_manifest, write_manifest, verify_manifest, hash_files
 from .utils import get_package_dir
+from .zip_package import ARCHIVE_EXT, get_package_archive, version_path, config_path
 
 
 CONFIG_REQUIRED = {'name', 'version', 'license',}
@@ -49,8 +55,69 @@ CONFIG_FUNCTIONAL = {'command_arguments', 'pre_processors', 'parser', 'tags', 'c
 	'post_processors', 'renderer', 'template', 'static', 'styles', 'scripts',}
 
 
+# cached configs are invalidated when the validation rules change
+CONFIG_CACHE_VERSION = repr((sorted(CONFIG_REQUIRED), sorted(CONFIG_DEFAULTS.items()), sorted(CONFIG_FUNCTIONAL)))
+
+
+def forget_modules(name):
+	"""
+	Remove package `name` and its submodules from `sys.modules`, so they are imported again (e.g. from another version).
+	"""
+	for module in [module for module in modules if module == name or module.startswith(name + '.')]:
+		del modules[module]
+
+
+class LazyAction:
+	"""
+	Stand-in for an action, which is imported and instantiated when it is first called or inspected. Type checks see
+	the action's class (`isinstance(action, LazyAction)` is still true, without importing it).
+	"""
+	def __init__(self, package, imp_path, create):
+		self._package = package
+		self._imp_path = imp_path
+		self._create = create
+		self._action = None
+		self._lock = Lock()
+
+	def __repr__(self):
+		return '<{0:s} {1:s}{2:s}>'.format(type(self).__name__, self._imp_path,
+			'' if self._action is None else ' (loaded)')
+
+	def __str__(self):
+		if self._action is None:
+			return self._imp_path
+		return str(self._action)
+
+	def resolve(self):
+		if self._action is None:
+			with self._lock:
+				if self._action is None:
+					self._package.logger.info('lazily loading {0:s} for {1:}'.format(self._imp_path, self._package),
+						level=3)
+					self._action = self._create(self._package._import_from_package(self._imp_path))
+		return self._action
+
+	def __call__(self, *args, **kwargs):
+		return self.resolve()(*args, **kwargs)
+
+	@property
+	def __class__(self):
+		return self.resolve().__class__
+
+	def __getattr__(self, name):
+		# special names are looked up on the type; before __init__ (e.g. while copying) there is nothing to resolve
+		if (name.startswith('__') and name.endswith('__')) or '_create' not in self.__dict__:
+			raise AttributeError(name)
+		return getattr(self.resolve(), name)
+
+
 class Package:
-	def __init__(self, name, version, options, logger, cache, compile_conf, *, packages=None, packages_dir=None):
+	def __init__(self, name, version, options, logger, cache, compile_conf, *, packages=None, packages_dir=None,
+			lazy_actions=False, locked=None):
+		"""
+		:param lazy_actions: Only import and instantiate actions (tags, compilers, ...) when they are first used.
+		:param locked: The (version, path) to use, e.g. from a lockfile, instead of choosing from installed versions.
+		"""
 		self.loaded = False
 		self.name = name
 		self.logger = logger
@@ -60,34 +127,94 @@ class Package:
 		if packages_dir is None:
 			packages_dir = get_package_dir()
 		self.packages_dir = packages_dir
+		self.lazy_actions = lazy_actions
+		self.restored = False  # set for packages recreated by `from_snapshot`
 		if not options:
 			options = {}
 		self.options = options
 		self.version_request = version
 		self.path = self.version = None
-		self.choose_version()
-		# initialize actions
+		if locked is None:
+			self.choose_version()
+		else:
+			self.version, self.path = locked
+		self.package_conf = None
+		self._init_actions()
+
+	def _init_actions(self):
 		self.config = self.parser = self.renderer = None
 		self.pre_processors = self.compilers = self.linkers = self.post_processors = ()
 		self.tags = OrderedDict()
 		self.substitutions = OrderedDict()
 
+	SNAPSHOT_ATTRS = ('name', 'version_request', 'version', 'path', 'packages_dir', 'options', 'package_conf', 'date',
+		'author', 'signature', 'is_approved', 'approved_on', 'template', 'styles', 'scripts', 'static')
+
+	def snapshot(self):
+		"""
+		Get the state of a prepared package (without actions, which are stored as import paths in `package_conf`).
+		"""
+		assert self.package_conf is not None, 'only prepared packages can be stored ({0:})'.format(self)
+		state = {attr: getattr(self, attr) for attr in self.SNAPSHOT_ATTRS}
+		state['config_mtime'] = stat(self.config_file(self.path)).st_mtime_ns
+		# resources come from patterns, so files being added or removed also invalidate the snapshot
+		state['index'] = None if self.is_archive else get_directory_index(self.path)
+		return state
+
+	@classmethod
+	def from_snapshot(cls, state, logger, cache, compile_conf, *, packages=None):
+		"""
+		Recreate a prepared package from the state made by `snapshot`, without choosing a version or reading files.
+		Actions are loaded lazily, so only the ones that are used get imported.
+
+		:return: The package, or None if its config.json changed or files were added or removed since the snapshot
+			was made.
+		"""
+		try:
+			if stat(cls.config_file(state['path'])).st_mtime_ns != state['config_mtime']:
+				return None
+		except FileNotFoundError:
+			return None
+		if state['index'] is not None and not state['index'].is_valid():
+			return None
+		package = cls.__new__(cls)
+		for attr in cls.SNAPSHOT_ATTRS:
+			setattr(package, attr, state[attr])
+		package.loaded = False
+		package.logger = logger
+		package.cache = cache
+		package.compile_conf = compile_conf
+		package.packages = packages
+		package.lazy_actions = True
+		package.restored = True
+		package._init_actions()
+		package.config_load_textfiles(package.package_conf)
+		for resource in [package.template] + package.styles + package.scripts + package.static:
+			if resource is not None:
+				resource.attach(logger=logger, cache=cache, compile_conf=compile_conf)
+		package._set_up_import_dir()
+		return package
+
 	def __repr__(self):
 		return '<{0:}.{1:s}: {2:s} {3:s}>'.format(self.__class__.__module__, self.__class__.__name__, self.name,
 			self.version or self.version_request)
 
 	def get_versions(self):
-		try:
-			vdirs = sorted(listdir(join(self.packages_dir, self.name)))
-		except FileNotFoundError:
+		"""
+		Get the installed versions from the installed package index (which only lists directories if they changed).
+		"""
+		index = get_installed_index(self.packages_dir)
+		vdirs = index.get_versions(self.name)
+		if vdirs is None:
 			raise PackageNotInstalledError('package {0:s} not found (checked "{1:s}" which contains: [{2:s}])' \
-				.format(self.name, self.packages_dir, ', '.join(listdir(self.packages_dir))))
+				.format(self.name, self.packages_dir, ', '.join(index.names())))
 		return vdirs
 
 	def choose_version(self):
 		"""
 		Choose from among the available versions, or raise a VersionRangeMismatch if there are no candidates.
 		"""
+		from package_versions import VersionRange, VersionRangeMismatch
 		versions = self.get_versions()
 		try:
 			choice = VersionRange(self.version_request).choose(versions, conflict='error')
@@ -95,32 +222,83 @@ class Package:
 			raise VersionRangeMismatch('package {0:s} has no installed version that satisfies {1:s} [it has {2:s}]' \
 				.format(self.name, self.version_request, ', '.join(versions)))  #todo: add note about installing?
 		self.version = choice
-		self.path = join(self.packages_dir, self.name, self.version)
+		self.path = version_path(self.packages_dir, self.name, self.version)
 		# print('chose version', choice, 'from', versions, 'because of', self.version_request)
 
-	def load(self):
+	@property
+	def is_archive(self):
+		"""
+		Whether this version is installed as a zip archive rather than a directory (see `PackageArchive`).
+		"""
+		return self.path.endswith(ARCHIVE_EXT)
+
+	@staticmethod
+	def config_file(path):
+		return config_path(path)
+
+	def get_index(self):
+		"""
+		The listing of files in the package: the opened archive, or an index of the version directory.
+		"""
+		if self.is_archive:
+			return get_package_archive(self.path)
+		return get_directory_index(self.path)
+
+	def read_file(self, relpth):
+		"""
+		Read a text file from the package (directory or archive).
+		"""
+		if self.is_archive:
+			return get_package_archive(self.path).read(relpth).decode('utf-8')
+		with open(join(self.path, relpth)) as fh:
+			return fh.read()
+
+	def load(self, full_verify=False):
 		"""
 		Loading should not be automatic because it should also work for untrusted packages (e.g. to get the signature).
+
+		:param full_verify: Rehash all files instead of trusting the signature manifest for unchanged files.
+		"""
+		if self.package_conf is None:
+			self.prepare(full_verify=full_verify)
+		self.load_actions(self.package_conf)
+		self.loaded = True
+		return self
+
+	def prepare(self, full_verify=False):
+		"""
+		The part of loading that does not depend on other packages (mostly file access), so that packages can be
+		prepared concurrently. Actions are loaded afterwards, in order, by `load`.
 		"""
 		# link_or_copy(self.path, join(self.compile_conf.PACKAGE_DIR, self.name))
+		conf = self.load_config()
+		# print(self.get_signature()[:8])
+		self.load_meta(conf, full_verify=full_verify)
+		self.config_load_textfiles(conf)
+		self.load_resources(conf)
+		self._set_up_import_dir()
+		self.package_conf = conf
+		return self
+
+	def load_config(self):
+		"""
+		Read and validate config.json and add defaults. The result is cached (across processes) until the file changes.
+		"""
 		try:
-			with open(join(self.path, 'config.json')) as fh:
-				conf = load(fh)
+			return get_cached(self.config_file(self.path), self._read_config, version=CONFIG_CACHE_VERSION)
 		except FileNotFoundError:
 			raise InvalidPackageConfigError('config.json was not found in "{0:s}"'.format(self.path))
+
+	def _read_config(self, pth):
+		from json_tricks.nonp import loads
+		try:
+			conf = loads(self.read_file('config.json'))
 		except ValueError as err:
 			raise InvalidPackageConfigError('config file for {0:} is not valid json'.format(self, str(err)))
 		if not (conf.get('name', None) == self.name and conf.get('version', None) == self.version):
 			raise InvalidPackageConfigError(('Package config for {0:} contains mismatching name and/or version '
 				'{1:s} {2:s}').format(self, conf.get('name', None), conf.get('version', None)))
-		# print(self.get_signature()[:8])
-		self.load_meta(conf)
-		conf = self.config_add_defaults(conf)
-		self.config_load_textfiles(conf)
-		self.load_resources(conf)
-		self.load_actions(conf)
-		self.loaded = True
-		return self
+		return self.config_add_defaults(conf)
 
 	def load_resources(self, conf):
 		"""
@@ -129,39 +307,85 @@ class Package:
 		self.template, self.styles, self.scripts, self.static = get_resources(group_name=self.name, path=self.path,
 			logger=self.logger, cache=self.cache, compile_conf=self.compile_conf, template_conf=conf['template'],
 			style_conf=conf['styles'], script_conf=conf['scripts'], static_conf=conf['static'],
-			note='from package {0:s}'.format(self.name)
+			note='from package {0:s}'.format(self.name), package_archive=self.path if self.is_archive else None
 		)
 
-	def load_meta(self,  conf):
+	def load_meta(self,  conf, full_verify=False):
 		"""
 		Load meta data file which is added by the package index server.
 		"""
 		self.date = datetime.now()  #todo: tmp
 		self.author = '??'  # todo
-		self.signature = self.get_signature()  #todo: this should be the one from meta file; can't hash the whole project every load
+		self.signature = self.get_manifest_signature(full_verify=full_verify)
 		self.is_approved = True
 		self.approved_on = datetime.now()  # todo (None if not approved)
 
+	@staticmethod
+	def _get_import_dir_version(imp_dir, version_pth):
+		if not exists(imp_dir):
+			return None
+		try:
+			with open(version_pth, 'r') as fh:
+				return fh.read()
+		except IOError:
+			return None
+
 	def _set_up_import_dir(self):
+		"""
+		Link (or copy) the package into the import dir, unless that version is already there. Checking does not lock,
+		so compiles using the installed version never wait. Changes are made under a lock per package: the version file
+		is removed, the new directory is published by renaming, and the version file is written again.
+		"""
+		if self.is_archive:
+			self._set_up_archive_module()
+			return
 		imp_dir = join(self.compile_conf.PACKAGE_DIR, self.name)
-		if exists(imp_dir):
-			try:
-				with open(join(self.compile_conf.PACKAGE_DIR, '{0:s}.version'.format(self.name)), 'r') as fh:
-					stored_version = fh.read()
-			except IOError:
-				stored_version = None
-			if self.version != stored_version:
-				self.logger.info('removing wrong version {2:} of package {0:s} from "{1:s}"'.format(self.name,
+		version_pth = join(self.compile_conf.PACKAGE_DIR, '{0:s}.version'.format(self.name))
+		if self._get_import_dir_version(imp_dir, version_pth) == self.version:
+			return
+		with file_lock(join(self.compile_conf.PACKAGE_DIR, '.{0:s}.lock'.format(self.name))):
+			stored_version = self._get_import_dir_version(imp_dir, version_pth)
+			if stored_version == self.version:
+				return
+			if stored_version is not None:
+				self.logger.info('replacing wrong version {2:} of package {0:s} in "{1:s}"'.format(self.name,
 					imp_dir, stored_version), level=3)
-				try:
-					remove(imp_dir)
-				except IsADirectoryError:
-					rmtree(imp_dir)
-		if not exists(imp_dir):
+			try:
+				remove(version_pth)
+			except FileNotFoundError:
+				pass
 			self.logger.info('copy package {0:} to "{1:}"'.format(self.name, imp_dir), level=3)
-			link_or_copy(self.path, join(self.compile_conf.PACKAGE_DIR, self.name), exist_ok=True, allow_linking=True)
-			with open(join(self.compile_conf.PACKAGE_DIR, '{0:s}.version'.format(self.name)), 'w+') as fh:
-				fh.write(self.version)
+			create_atomic(imp_dir, lambda tmp_pth: link_or_copy(self.path, tmp_pth, exist_ok=True, allow_linking=True))
+			write_atomic(version_pth, self.version)
+
+	def _set_up_archive_module(self):
+		"""
+		Make the package importable under its name straight from its archive (submodules are found by zipimport,
+		since the archive is the package's `__path__`), instead of linking it into the import dir.
+
+		If the package was imported from elsewhere (e.g. another version), its modules are replaced; objects imported
+		from them before stay in use until the packages holding them are reloaded (which the daemon and watcher do).
+		"""
+		module = modules.get(self.name, None)
+		if module is not None and list(getattr(module, '__path__', ())) == [self.path]:
+			return
+		if module is not None:
+			self.logger.info(('package {0:} was imported from "{1:}"; objects imported from there stay in use until '
+				'they are reloaded').format(self.name, ', '.join(getattr(module, '__path__', ()))), level=1)
+		self.logger.info('importing package {0:} from "{1:}"'.format(self.name, self.path), level=3)
+		forget_modules(self.name)
+		importer = zipimporter(self.path)
+		spec = spec_from_loader(self.name, importer, origin=join(self.path, '__init__.py'), is_package=True)
+		spec.submodule_search_locations.append(self.path)
+		module = module_from_spec(spec)
+		module.__file__ = spec.origin
+		modules[self.name] = module
+		try:
+			code = importer.get_code('__init__')
+		except ZipImportError:
+			code = None
+		if code is not None:
+			exec(code, module.__dict__)
 
 	def _import_from_package(self, imp_path):
 		"""
@@ -191,8 +415,12 @@ class Package:
 
 			return action
 
+		def load_action(obj_imp_path, create=instantiate_action):
+			if self.lazy_actions:
+				return LazyAction(self, obj_imp_path, create)
+			return create(self._import_from_package(obj_imp_path))
+
 		#todo: better errors, also logging
-		self._set_up_import_dir()
 		if conf['config']:
 			Config = Configuration
 			if conf['config'] is True:
@@ -201,31 +429,31 @@ class Package:
 				Config = self._import_from_package(conf['config'])
 			self.config = Config(self.options, logger=frozen(self.logger), cache=frozen(self.cache),
 				compile_conf=frozen(self.compile_conf), parser=frozen(self.packages.get_parser()))
-		self.pre_processors = tuple(instantiate_action(self._import_from_package(obj_imp_path))
-			for obj_imp_path in conf['pre_processors'])
+		self.pre_processors = tuple(load_action(obj_imp_path) for obj_imp_path in conf['pre_processors'])
 		if conf['parser']:
-			Parser = self._import_from_package(conf['parser'])
-			self.parser = Parser(self.config)
+			self.parser = load_action(conf['parser'], lambda Parser: Parser(self.config))
 		# cache tags which are known under two names, for performance and so that they are identical
 		_tag_alias_cache = {}
 		for name, obj_imp_path in conf['tags'].items():
 			if obj_imp_path not in _tag_alias_cache:
-				_tag_alias_cache[obj_imp_path] = instantiate_action(
-					self._import_from_package(obj_imp_path))
+				_tag_alias_cache[obj_imp_path] = load_action(obj_imp_path)
 			self.tags[name] = _tag_alias_cache[obj_imp_path]
-		self.compilers = tuple(instantiate_action(self._import_from_package(obj_imp_path))
-			for obj_imp_path in conf['compilers'])
-		self.linkers = tuple(instantiate_action(self._import_from_package(obj_imp_path))
-			for obj_imp_path in conf['linkers'])
+		self.compilers = tuple(load_action(obj_imp_path) for obj_imp_path in conf['compilers'])
+		self.linkers = tuple(load_action(obj_imp_path) for obj_imp_path in conf['linkers'])
 		if conf['substitutions']:  #todo (maybe)
 			raise NotImplementedError('substitutions')
-		self.post_processors = tuple(instantiate_action(self._import_from_package(obj_imp_path))
-			for obj_imp_path in conf['post_processors'])
+		self.post_processors = tuple(load_action(obj_imp_path) for obj_imp_path in conf['post_processors'])
 		if conf['renderer']:
-			Renderer = self._import_from_package(conf['renderer'])
-			self.renderer = Renderer(self.config)
+			self.renderer = load_action(conf['renderer'], lambda Renderer: Renderer(self.config))
 
 
+	def reload_actions(self):
+		"""
+		Create all actions again (e.g. after one of the package's modules was reloaded).
+		"""
+		self._init_actions()
+		self.load_actions(self.package_conf)
+
 	def config_add_defaults(self, config):
 		"""
 		Add default values for all parameters that have defaults, check that all parameters
@@ -252,39 +480,89 @@ class Package:
 		return conf
 
 	def config_load_textfiles(self, conf):
-		try:
-			with open(join(self.path, conf['readme'])) as fh:
-				self.readme = fh.read()
-		except FileNotFoundError:
-			self.readme = None
-		try:
-			with open(join(self.path, conf['credits'])) as fh:
-				self.credits = fh.read()
-		except FileNotFoundError:
-			self.credits = None
-		if conf['license'] in LICENSES:
-			self.license_text = LICENSES[conf['license']].format(name=self.author, year=self.date.year)
-		else:
-			self.license_text = '??'
-			stderr.write('not an approved package (wrong license)')
+		"""
+		Remember where readme, credits and license are; the texts are only read when they are accessed.
+		"""
+		self._textfiles = {'readme': conf['readme'], 'credits': conf['credits'], 'license': conf['license']}
+		self._texts = {}
+
+	def _get_textfile(self, key):
+		if key not in self._texts:
+			try:
+				self._texts[key] = self.read_file(self._textfiles[key])
+			except FileNotFoundError:
+				self._texts[key] = None
+		return self._texts[key]
+
+	@property
+	def readme(self):
+		return self._get_textfile('readme')
+
+	@property
+	def credits(self):
+		return self._get_textfile('credits')
+
+	@property
+	def license_text(self):
+		if 'license' not in self._texts:
+			if self._textfiles['license'] in LICENSES:
+				self._texts['license'] = LICENSES[self._textfiles['license']].format(name=self.author, year=self.date.year)
+			else:
+				self._texts['license'] = '??'
+				stderr.write('not an approved package (wrong license)')
+		return self._texts['license']
 
 	def yield_files_list(self):
-		for root, directories, filenames in walk(self.path):
-			for filename in filenames:
-				yield relpath(join(root, filename), self.path)
+		for filename in self.get_index().list_files():
+			if filename != MANIFEST_NAME:
+				yield filename
 
-	def get_file_signatures(self):
-		file_sigs = OrderedDict()
-		for file in  sorted(self.yield_files_list()):
-			file_sigs[file] = hash_file(join(self.path, file))
-		return file_sigs
+	def get_file_signatures(self, workers=None):
+		"""
+		Hash all files concurrently (using at most `workers` threads, or one to hash serially); sorted by name.
+		"""
+		if self.is_archive:
+			return get_package_archive(self.path).hash_members(self.yield_files_list(), workers=workers)
+		return hash_files(self.path, self.yield_files_list(), workers=workers)
 
-	def get_file_signatures_string(self):
-		return '\n'.join('{0:s}\t{1:s}'.format(name, hash) for name, hash in self.get_file_signatures().items())
+	def get_file_signatures_string(self, file_sigs=None, workers=None):
+		if file_sigs is None:
+			file_sigs = self.get_file_signatures(workers=workers)
+		return '\n'.join('{0:s}\t{1:s}'.format(name, hash) for name, hash in file_sigs.items())
 
-	def get_signature(self):
+	def get_signature(self, workers=None):
 		#on installing, not all the time
-		return hash_str(self.get_file_signatures_string())
+		return hash_str(self.get_file_signatures_string(workers=workers))
+
+	def get_manifest_signature(self, full_verify=False):
+		"""
+		Get the signature using the manifest written at install time, only rehashing files whose size or modification
+		time changed (or all of them if `full_verify` is set). Hashes everything if there is no manifest.
+		"""
+		archive = get_package_archive(self.path) if self.is_archive else None
+		manifest = read_manifest(self.path) if archive is None else archive.read_manifest()
+		if manifest is None:
+			self.logger.info('no signature manifest for {0:}; hashing all files'.format(self), level=2)
+			return self.get_signature()
+		if archive is None:
+			file_sigs, changed = verify_manifest(self.path, manifest, self.yield_files_list(), full_verify=full_verify)
+		else:
+			file_sigs, changed = archive.verify_manifest(manifest, self.yield_files_list(), full_verify=full_verify)
+		if changed:
+			self.logger.info('{0:} has changed since it was installed: {1:s}'.format(self, ', '.join(changed)), level=1)
+		return hash_str(self.get_file_signatures_string(file_sigs))
+
+	def write_signature_manifest(self):
+		"""
+		Hash all files and store the result next to config.json (when installing), so loading can skip the hashing.
+		Archives cannot be changed, so their manifest should be added when they are made.
+		"""
+		if self.is_archive:
+			raise PackageError('cannot write a signature manifest into archive "{0:s}" of {1:}'.format(
+				self.path, self))
+		file_sigs = self.get_file_signatures()
+		write_manifest(self.path, file_sigs)
+		return hash_str(self.get_file_signatures_string(file_sigs))
 
 	def check_filenames(self):
 		#on installing, not all the time
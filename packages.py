@@ -1,72 +1,264 @@
 
-from notex_pkgs.lxml_pr.parser import LXML_Parser
-from notex_pkgs.lxml_pr.renderer import LXML_Renderer
+from collections.abc import Mapping
 from notexp.resource import Resource
+from notexp.utils import PackageLoadError, ResourceProcessingError, DependencyError, run_parallel, \
+	unique_package_name
+from .bundle import bundle_resources
 from .package import Package
+from .resolver import version_matches
+
+
+class TagIndex(Mapping):
+	"""
+	Read-only mapping from tag name to its handlers. Handlers registered after a final handler are left out when the
+	tag is first looked up (rather than when it is registered, so lazy actions are not imported before dispatch).
+	"""
+	def __init__(self, handlers, logger):
+		self._handlers = handlers
+		self._applied = {}
+		self.logger = logger
+
+	def __getitem__(self, tag_name):
+		if tag_name not in self._applied:
+			handlers = self._handlers[tag_name]
+			for k, handler in enumerate(handlers[:-1]):
+				if getattr(handler, 'final_handler', False):
+					self.logger.info(('  tag handler(s) {0:s} for {1:} not used because final_handler tag {2:} was '
+						'registered before').format(', '.join(str(tag) for tag in handlers[k + 1:]), tag_name, handler),
+						level=2)
+					handlers = handlers[:k + 1]
+					break
+			self._applied[tag_name] = handlers
+		return self._applied[tag_name]
+
+	def __iter__(self):
+		return iter(self._handlers)
+
+	def __len__(self):
+		return len(self._handlers)
+
+	def __contains__(self, tag_name):
+		return tag_name in self._handlers
 
 
 class PackageList:
 	"""
 	An ordered collection of packages.
 	"""
-	def __init__(self, packages, logger, cache, compile_conf, document_conf):
+	def __init__(self, packages, logger, cache, compile_conf, document_conf, *, workers=None, downloader=None):
+		"""
+		:param workers: The maximum number of threads used to prepare packages and process resources concurrently
+			(1 to do everything serially). With more than one, `logger` is called from several threads, so it should
+			be thread-safe (like a `logging.Logger`); `cache` is only used under a lock (see `Resource._download`).
+		:param downloader: A Downloader used to fetch all remote resources concurrently when making them offline.
+		"""
 		#todo: PackageList gets document_conf but individual packages do not
 		self.packages = []
 		self.logger = logger
 		self.cache = cache
 		self.compile_conf = compile_conf
+		self.workers = workers
+		self.downloader = downloader
+		self._tags = {}
+		self._tags_snapshot = None
+		self._singles = {}
+		self.add_packages(packages)
+
+	def add_packages(self, packages):
+		"""
+		Prepare packages concurrently (the file access part of loading), then load their actions and add them in the
+		given order. If any package fails, none of them are added. A single error is raised as it is (e.g. an
+		InvalidPackageConfigError); several are raised together as a PackageLoadError.
+		"""
+		packages = list(packages)
+		failures = []
+		pending = [package for package in packages if not package.loaded and package.package_conf is None]
+		for package, _, err in run_parallel(lambda package: package.prepare(), pending, workers=self.workers):
+			if err is not None:
+				failures.append((package, err))
+		if failures:
+			self._raise_failures(failures)
+		count = len(self.packages)
 		for package in packages:
-			self.add_package(package)
+			try:
+				self.add_package(package)
+			except Exception as err:
+				failures.append((package, err))
+		if not failures:
+			failures.extend(self._missing_requirements(packages))
+		if failures:
+			del self.packages[count:]
+			self.reindex()
+			self._raise_failures(failures)
+
+	@staticmethod
+	def _raise_failures(failures):
+		if len(failures) == 1:
+			raise failures[0][1]
+		raise PackageLoadError(failures)
 
 	def add_package(self, package):
-		#todo: check dependencies and conflicts
+		"""
+		Load the package if needed and add it, after checking that it is compatible with the packages already added.
+		Requirements that are missing are only checked by `add_packages`, since they may be added later (to get all
+		of them in a consistent version, use `resolve_versions`).
+		"""
 		assert isinstance(package, Package)
 		if not package.loaded:
-			self.logger.info('auto-loading {0:s}'.format(package), level=2)
+			self.logger.info('auto-loading {0:}'.format(package), level=2)
 			package.load()
+		self.check_compatible(package)
 		self.packages.append(package)
+		self._singles = {}
+		self._index_tags(package)
+
+	def check_compatible(self, package, others=None):
+		"""
+		Raise a DependencyError if `package` and an added package (or one of `others`) require another version of
+		each other, or if either is in a range that the other conflicts with.
+		"""
+		for other in self.packages if others is None else others:
+			for first, second in ((package, other), (other, package)):
+				second_name = unique_package_name(second.name)
+				for name, spec in first.package_conf['requirements'].items():
+					if unique_package_name(name) == second_name and not version_matches(second.version, spec):
+						raise DependencyError('{0:} requires {1:s} {2:s}, but {3:} is loaded'.format(
+							first, name, spec, second))
+				for name, spec in first.package_conf['conflicts_with'].items():
+					if unique_package_name(name) == second_name and version_matches(second.version, spec):
+						raise DependencyError('{0:} conflicts with {1:}'.format(first, second))
+
+	def _missing_requirements(self, packages):
+		names = {unique_package_name(package.name) for package in self.packages}
+		for package in packages:
+			missing = sorted(name for name in package.package_conf['requirements'].keys()
+				if unique_package_name(name) not in names)
+			if missing:
+				yield package, DependencyError('{0:} requires {1:s}, which is not loaded'.format(package,
+					', '.join(missing)))
+
+	def replace_package(self, old, new):
+		"""
+		Put `new` (e.g. a reloaded version of a package) in the place of `old`, and update the tag index. Raises a
+		DependencyError (keeping `old`) if `new` is not compatible with the other packages.
+		"""
+		position = self.packages.index(old)
+		new.packages = self
+		if not new.loaded:
+			new.load()
+		self.check_compatible(new, self.packages[:position] + self.packages[position + 1:])
+		self.packages[position] = new
+		self.reindex()
+
+	def reindex(self):
+		"""
+		Rebuild the tag index and forget resolved parser, renderer and template (after packages changed in place).
+		"""
+		self._singles = {}
+		self._tags = {}
+		self._tags_snapshot = None
+		for package in self.packages:
+			self._index_tags(package)
 
 	def _get_single(self, attr_name, fallback=None):
+		"""
+		Get the object provided by the last package that has it, or else `fallback()` (only called when needed). The
+		result is cached until another package is added.
+		"""
+		if attr_name in self._singles:
+			return self._singles[attr_name]
 		chosen = None
 		for package in self.packages:
 			self.logger.info('  getting {1:s} for {0:s}'.format(package.name, attr_name), level=3)
 			if getattr(package, attr_name) is not None:
 				if chosen is not None:
-					self.logger.info('{2:s} {0:s} overridden by {1:}'.format(
-						chosen.template, getattr(package, attr_name), attr_name), level=2)
+					self.logger.info('{2:s} {0:} overridden by {1:}'.format(
+						chosen, getattr(package, attr_name), attr_name), level=2)
 				chosen = getattr(package, attr_name)
-		if chosen is None:
-			chosen = fallback
+		if chosen is None and fallback is not None:
+			chosen = fallback()
 			self.logger.info('no package provided {1:s}; falling back to the default {0:}'.format(
 				chosen, attr_name), level=2)
+		self._singles[attr_name] = chosen
 		return chosen
 
 	def get_parser(self):
-		return self._get_single('parser', LXML_Parser(None))
+		def fallback():
+			# imported here, since lxml is slow to import and only needed if no package provides a parser
+			from notex_pkgs.lxml_pr.parser import LXML_Parser
+			return LXML_Parser(None)
+		return self._get_single('parser', fallback)
 
 	def get_renderer(self):
-		return self._get_single('renderer', LXML_Renderer(None))
+		def fallback():
+			from notex_pkgs.lxml_pr.renderer import LXML_Renderer
+			return LXML_Renderer(None)
+		return self._get_single('renderer', fallback)
 
 	def get_template(self):
-		fallback = Resource(logger=self.logger, cache=self.cache, compile_conf=self.compile_conf, group_name='fallback',
-		                    resource_dir=self.compile_conf.code_dir, local_path='fallback_template.html')
-		return self._get_single('template', fallback)
+		return self._get_single('template', lambda: Resource(logger=self.logger, cache=self.cache,
+			compile_conf=self.compile_conf, group_name='fallback', resource_dir=self.compile_conf.code_dir,
+			local_path='fallback_template.html'))
 
 	def _yield_resources(self, attr_name, offline, minify=False):
+		"""
+		Make resources available offline and/or minify them on a thread pool (at most `workers` at a time), yielding
+		each one, in the original order, as soon as it and those before it are done. Failures are logged per resource
+		and raised together as a ResourceProcessingError after the other resources have been yielded.
+		"""
+		resources = []
 		for package in self.packages:
 			self.logger.info('  getting {0:s} for {1:s}'.format(attr_name, package.name), level=4)
-			for resource in getattr(package, attr_name, ()):
-				if offline:
-					resource.make_offline()
-				if minify:
-					resource.minify()
+			resources.extend(getattr(package, attr_name, ()))
+		if not offline and not minify:
+			yield from resources
+			return
+		fetch_errors = {}
+		if offline and self.downloader is not None:
+			for resource in resources:
+				resource.downloader = self.downloader
+			# the downloader already retried failed urls, so those resources fail without downloading again
+			_, fetch_errors = self.downloader.fetch_all(resource.offline_url for resource in resources
+				if resource.offline_url)
+		def process(resource):
+			if offline:
+				if resource.offline_url in fetch_errors:
+					raise fetch_errors[resource.offline_url]
+				resource.make_offline()
+			if minify:
+				resource.minify()
+		failures = []
+		for resource, _, err in run_parallel(process, resources, workers=self.workers):
+			if err is None:
 				yield resource
+			else:
+				self.logger.info('could not process {0:}: {1:}'.format(resource, err), level=1)
+				failures.append((resource, err))
+		if failures:
+			raise ResourceProcessingError(failures)
+
+	def _yield_linked(self, attr_name, offline, minify, bundle, internalize):
+		resources = self._yield_resources(attr_name, offline=offline, minify=minify)
+		if bundle:
+			resources = bundle_resources(resources)
+		if internalize:
+			resources = internalize.apply(resources)
+		return resources
 
-	def yield_styles(self, offline=False, minify=False):
-		return self._yield_resources('styles', offline=offline, minify=minify)
+	def yield_styles(self, offline=False, minify=False, bundle=False, internalize=None):
+		"""
+		:param bundle: Merge consecutive local styles into bundles with source maps (see `bundle_resources`).
+		:param internalize: An InternalizePolicy that chooses which styles are inlined (share it with scripts so
+			they use the same budget).
+		"""
+		return self._yield_linked('styles', offline=offline, minify=minify, bundle=bundle, internalize=internalize)
 
-	def yield_scripts(self, offline=False, minify=False):
-		return self._yield_resources('scripts', offline=offline, minify=minify)
+	def yield_scripts(self, offline=False, minify=False, bundle=False, internalize=None):
+		"""
+		:param bundle: Merge consecutive local scripts into bundles with source maps (see `bundle_resources`).
+		:param internalize: An InternalizePolicy that chooses which scripts are inlined.
+		"""
+		return self._yield_linked('scripts', offline=offline, minify=minify, bundle=bundle, internalize=internalize)
 
 	def yield_static(self, offline=False, minify=False):
 		return self._yield_resources('static', offline=offline, minify=minify)
@@ -80,20 +272,31 @@ class PackageList:
 	def yield_pre_processors(self):
 		return self._yield_series('pre_processors')
 
+	def _index_tags(self, package):
+		"""
+		Add the tags of a newly added package to the tag index. Final handlers are applied by `TagIndex` when a tag is
+		looked up, since checking whether a handler is final imports it (for lazy actions).
+		"""
+		for base_name, tag in package.tags.items():
+			for tag_name in (base_name, '{0:s}-{1:s}'.format(package.name, base_name)):
+				self._tags.setdefault(tag_name, []).append(tag)
+		self._tags_snapshot = None
+
 	def get_tags(self):
-		tags = {}
-		for package in self.packages:
-			for base_name, tag in package.tags.items():
-				for tag_name in (base_name, '{0:s}-{1:s}'.format(package.name, base_name)):
-					if tag_name in tags:
-						if getattr(tags[tag_name][-1], 'final_handler', False):
-							self.logger(('  tag handler {0:} for {1:} not registered because final_handler tag {2:} was '
-								'registered before').format(tag, tag_name, tags[tag_name][-1]), level=2)
-						else:
-							tags[tag_name].append(tag)
-					else:
-						tags[tag_name] = [tag]
-		return tags
+		"""
+		Get a read-only mapping from tag name to its handlers (in order, with final handlers applied). The mapping is
+		only rebuilt after packages are added, so it can be kept by the compiler.
+		"""
+		if self._tags_snapshot is None:
+			self._tags_snapshot = TagIndex({tag_name: tuple(handlers) for tag_name, handlers in self._tags.items()},
+				self.logger)
+		return self._tags_snapshot
+
+	def get_tag_handlers(self, tag_name):
+		"""
+		Get the handlers for a single tag, or an empty tuple if there are none.
+		"""
+		return self.get_tags().get(tag_name, ())
 
 	def yield_compilers(self):
 		return self._yield_series('compilers')
@@ -0,0 +1,289 @@
+
+from collections import OrderedDict, namedtuple
+from hashlib import sha256
+from json import load, dumps
+from os import stat
+from os.path import join
+from .config_cache import get_cached
+from .installed import get_installed_index
+from .locking import write_atomic
+from .utils import DependencyError, InvalidPackageConfigError, get_cache_dir, get_package_dir, unique_package_name
+from .zip_package import ARCHIVE_EXT, get_package_archive, version_path, config_path
+
+
+LOCK_VERSION = 1
+DEPENDENCY_CACHE_VERSION = 'dependencies-1'
+
+
+Resolved = namedtuple('Resolved', ('name', 'version_request', 'version', 'path', 'options'))
+
+
+_RANGES = {}
+
+
+def parse_range(spec):
+	from package_versions import VersionRange
+	if spec not in _RANGES:
+		_RANGES[spec] = VersionRange(spec)
+	return _RANGES[spec]
+
+
+def version_number(version):
+	from package_versions import VERSION_MAX, str2nr
+	return str2nr(version, mx=VERSION_MAX)
+
+
+def _version_key(version):
+	from package_versions import VERSION_MAX, str2nrrest
+	return str2nrrest(version, mx=VERSION_MAX)
+
+
+def version_matches(version, spec):
+	"""
+	Whether `version` is in the range given by selection string `spec` (like '>=1.3,<2.0').
+	"""
+	rng = parse_range(spec)
+	return rng.min <= version_number(version) <= rng.max
+
+
+def _read_dependencies(config_pth):
+	from json_tricks.nonp import loads
+	try:
+		if config_pth.endswith(ARCHIVE_EXT):
+			conf = loads(get_package_archive(config_pth).read('config.json').decode('utf-8'))
+		else:
+			with open(config_pth, 'r') as fh:
+				conf = loads(fh.read())
+	except ValueError as err:
+		raise InvalidPackageConfigError('config file "{0:s}" is not valid json: {1:}'.format(config_pth, err))
+	return dict(conf.get('requirements', None) or {}), dict(conf.get('conflicts_with', None) or {})
+
+
+class Resolver:
+	"""
+	Chooses a version of every requested package and of everything they (indirectly) require, such that all
+	`requirements` are satisfied and nothing is in a range listed in `conflicts_with` of a chosen package.
+
+	Candidates are tried in order of preference (usually highest first), backtracking when a choice leads to a
+	conflict. Installed versions, dependencies and failed partial solutions are memoized.
+	"""
+	def __init__(self, packages_dir=None, logger=None):
+		self.packages_dir = packages_dir or get_package_dir()
+		self.logger = logger
+		self.index = get_installed_index(self.packages_dir)
+		self._dirnames = None
+		self._versions = {}
+		self._dependencies = {}
+		self._failed = set()
+		self._problems = OrderedDict()
+
+	def __repr__(self):
+		return '<{0:s} for "{1:s}">'.format(self.__class__.__name__, self.packages_dir)
+
+	def dirname(self, name):
+		"""
+		The directory name of installed package `name` (which may differ in case or separators).
+		"""
+		if self._dirnames is None:
+			self._dirnames = {unique_package_name(dirname): dirname for dirname in self.index.names()}
+		return self._dirnames.get(unique_package_name(name), name)
+
+	def versions(self, name):
+		"""
+		The installed versions of `name`, highest first (empty if it is not installed).
+		"""
+		if name not in self._versions:
+			self._versions[name] = sorted(self.index.get_versions(name) or (), key=_version_key, reverse=True)
+		return self._versions[name]
+
+	def dependencies(self, name, version):
+		"""
+		The `requirements` and `conflicts_with` of a version, keyed by unique package name. These are read from the
+		config (which is cached between processes until it changes).
+		"""
+		if (name, version) not in self._dependencies:
+			config_pth = config_path(version_path(self.packages_dir, self.dirname(name), version))
+			try:
+				requirements, conflicts = get_cached(config_pth, _read_dependencies, version=DEPENDENCY_CACHE_VERSION,
+					cache_dir=join(get_cache_dir(), 'dependencies'))
+			except FileNotFoundError:
+				raise InvalidPackageConfigError('config.json was not found for {0:s} {1:s} in "{2:s}"'.format(
+					name, version, config_pth))
+			self._dependencies[(name, version)] = (
+				OrderedDict((unique_package_name(dep), spec) for dep, spec in sorted(requirements.items())),
+				OrderedDict((unique_package_name(dep), spec) for dep, spec in sorted(conflicts.items())))
+		return self._dependencies[(name, version)]
+
+	def _candidates(self, name, constraints, conflicts):
+		candidates = [version for version in self.versions(name)
+			if all(version_matches(version, spec) for spec, source in constraints)
+			and not any(version_matches(version, spec) for spec, source in conflicts)]
+		if not candidates:
+			self._problems[name] = 'no installed version of {0:s} [{1:s}] satisfies {2:s}{3:s}'.format(
+				self.dirname(name), ', '.join(self.versions(name)) or 'none',
+				', '.join('{0:s} (from {1:s})'.format(spec, source) for spec, source in constraints),
+				''.join(' and conflicts with {0:s} (from {1:s})'.format(spec, source) for spec, source in conflicts))
+		if not all(parse_range(spec).prefer_highest for spec, source in constraints):
+			candidates.reverse()
+		return candidates
+
+	def _search(self, chosen, constraints, conflicts, pending):
+		"""
+		Choose versions for the `pending` names (in order), given the versions `chosen` so far.
+
+		:return: The complete choice of versions, or None if there is none.
+		"""
+		while pending and pending[0] in chosen:
+			pending = pending[1:]
+		if not pending:
+			return chosen
+		name, pending = pending[0], pending[1:]
+		# constraints and conflicts follow from what was chosen, so this identifies the state
+		state = (frozenset(chosen.items()), name, pending)
+		if state in self._failed:
+			return None
+		for version in self._candidates(name, constraints.get(name, ()), conflicts.get(name, ())):
+			source = '{0:s} {1:s}'.format(self.dirname(name), version)
+			requirements, conflicts_with = self.dependencies(name, version)
+			problem = None
+			for dep, spec in requirements.items():
+				if dep in chosen and not version_matches(chosen[dep], spec):
+					problem = '{0:s} requires {1:s} {2:s} but {3:s} was chosen'.format(source, self.dirname(dep), spec,
+						chosen[dep])
+			for dep, spec in conflicts_with.items():
+				if dep in chosen and version_matches(chosen[dep], spec):
+					problem = '{0:s} conflicts with {1:s} {2:s}'.format(source, self.dirname(dep), chosen[dep])
+			if problem is not None:
+				self._problems[name] = problem
+				continue
+			sub_constraints, sub_conflicts = dict(constraints), dict(conflicts)
+			for dep, spec in requirements.items():
+				sub_constraints[dep] = sub_constraints.get(dep, ()) + ((spec, source),)
+			for dep, spec in conflicts_with.items():
+				sub_conflicts[dep] = sub_conflicts.get(dep, ()) + ((spec, source),)
+			sub_chosen = OrderedDict(chosen)
+			sub_chosen[name] = version
+			found = self._search(sub_chosen, sub_constraints, sub_conflicts,
+				pending + tuple(dep for dep in requirements.keys() if dep not in chosen))
+			if found is not None:
+				return found
+		self._failed.add(state)
+		return None
+
+	def _order(self, names, chosen):
+		"""
+		Requirements before the packages that need them, otherwise in the requested order.
+		"""
+		order, seen = [], set()
+		def visit(name):
+			if name in seen:
+				return
+			seen.add(name)
+			for dep in self.dependencies(name, chosen[name])[0].keys():
+				visit(dep)
+			order.append(name)
+		for name in names:
+			visit(name)
+		return order
+
+	def resolve(self, requests):
+		"""
+		:param requests: Sequence of (name, version range, options) tuples.
+		:return: A list of `Resolved` tuples, in the order the packages should be loaded.
+		"""
+		requests = tuple(requests)
+		self._failed, self._problems = set(), OrderedDict()
+		names = tuple(unique_package_name(name) for name, version, options in requests)
+		constraints = {}
+		for name, (_, version, options) in zip(names, requests):
+			constraints[name] = constraints.get(name, ()) + ((version or '==*', 'request'),)
+		chosen = self._search(OrderedDict(), constraints, {}, names)
+		if chosen is None:
+			raise DependencyError('could not find consistent versions for {0:s}: {1:s}'.format(
+				', '.join(str(name) for name, version, options in requests), '; '.join(self._problems.values())))
+		requested = {name: (version or '==*', options) for name, (_, version, options) in zip(names, requests)}
+		resolved = []
+		for name in self._order(names, chosen):
+			dirname, version = self.dirname(name), chosen[name]
+			if name in requested:
+				version_request, options = requested[name]
+			else:
+				version_request, options = ','.join(spec for other in chosen
+					for dep, spec in self.dependencies(other, chosen[other])[0].items() if dep == name), None
+			resolved.append(Resolved(dirname, version_request, version,
+				version_path(self.packages_dir, dirname, version), options))
+		if self.logger is not None:
+			self.logger.info('resolved versions: {0:s}'.format(', '.join('{0:s} {1:s}'.format(item.name, item.version)
+				for item in resolved)), level=2)
+		return resolved
+
+
+def _stat(pth):
+	info = stat(pth)
+	return [info.st_mtime_ns, info.st_size]
+
+
+def lock_key(requests, packages_dir):
+	"""
+	Identifies the requests that a lockfile was made for.
+	"""
+	text = '{0:d}\n{1:s}\n{2:s}'.format(LOCK_VERSION, packages_dir, repr([(name, version, sorted(
+		(options or {}).items())) for name, version, options in requests]))
+	return sha256(text.encode('utf-8')).hexdigest()
+
+
+def write_lockfile(pth, requests, resolved, packages_dir):
+	"""
+	Store resolved versions and paths, with the modification time and size of each config (or archive) so that a
+	changed package invalidates the lockfile.
+	"""
+	write_atomic(pth, dumps({'version': LOCK_VERSION, 'key': lock_key(requests, packages_dir), 'packages': [
+		dict(item._asdict(), config_stat=_stat(config_path(item.path))) for item in resolved]}, indent=1))
+
+
+def read_lockfile(pth, requests, packages_dir):
+	"""
+	Get the resolved packages from a lockfile, or None if it is missing, was made for other requests, or a locked
+	package changed or was removed. Checking takes one stat per package and does not list any directories.
+	"""
+	try:
+		with open(pth, 'r') as fh:
+			data = load(fh)
+	except (FileNotFoundError, ValueError):
+		return None
+	if data.get('version', None) != LOCK_VERSION or data.get('key', None) != lock_key(requests, packages_dir):
+		return None
+	resolved = []
+	for item in data['packages']:
+		try:
+			if _stat(config_path(item['path'])) != item['config_stat']:
+				return None
+		except FileNotFoundError:
+			return None
+		resolved.append(Resolved(*(item[field] for field in Resolved._fields)))
+	return resolved
+
+
+def resolve_versions(requests, *, packages_dir=None, lockfile=None, logger=None):
+	"""
+	Resolve versions for `requests`, using `lockfile` if it is valid, or resolving and (re)writing it otherwise.
+
+	:param requests: Sequence of (name, version range, options) tuples.
+	:return: A list of `Resolved` tuples, in the order the packages should be loaded.
+	"""
+	requests = tuple(requests)
+	packages_dir = packages_dir or get_package_dir()
+	if lockfile is not None:
+		resolved = read_lockfile(lockfile, requests, packages_dir)
+		if resolved is not None:
+			return resolved
+	resolved = Resolver(packages_dir, logger=logger).resolve(requests)
+	if lockfile is not None:
+		try:
+			write_lockfile(lockfile, requests, resolved, packages_dir)
+		except OSError as err:
+			if logger is not None:
+				logger.info('could not write lockfile "{0:s}": {1:}'.format(lockfile, err), level=1)
+	return resolved
+
+
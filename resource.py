@@ -1,18 +1,32 @@
 
-from functools import partial
+from collections import OrderedDict
+from copy import copy as shallow_copy
 from glob import glob
-from css_html_js_minify import process_single_css_file, process_single_js_file
-from genericpath import isfile, getmtime
-from os import makedirs
-from os.path import join, exists, basename, splitext, abspath, relpath
+from hashlib import sha256
+from json import dump
+from genericpath import isfile, getmtime, getsize
+from os import makedirs, stat
+from os.path import join, exists, basename, splitext, abspath, relpath, isabs
 from re import findall
+from shutil import copyfileobj
+from threading import Lock
 from compiler.utils import hash_str, link_or_copy
 from notexp.utils import InvalidPackageConfigError
+from .archive import extract_members
+from .content_cache import get_content_cache
+from .file_index import get_directory_index
+from .locking import create_once
+from .signatures import hash_file_streaming
 from .utils import is_external
+from .zip_package import get_package_archive
+
+
+# the compiler's cache is shared by all resources but not made for concurrent use (see `PackageList.workers`)
+_SHARED_CACHE_LOCK = Lock()
 
 
 def get_resources(*, group_name, path, logger, cache, compile_conf, template_conf=None, style_conf=None,
-		script_conf=None, static_conf=None, note=None):
+		script_conf=None, static_conf=None, note=None, package_archive=None):
 	"""
 	Get resource instances based on configuration such as a package's config.json or a <resource> tag.
 
@@ -22,8 +36,22 @@ def get_resources(*, group_name, path, logger, cache, compile_conf, template_con
 	:param style_conf: Style configuration (a list of either str paths or dict options).
 	:param script_conf: Similar to style.
 	:param static_conf: Similar to style, but only included, not copied.
+	:param package_archive: The archive the package is installed as, if it is not a directory (`path` is then the
+		archive path as well).
 	:return: template, styles, scripts, static
 	"""
+	indexes = []
+	def get_index():
+		# a single scan of `path` is shared by all patterns and existence checks (and cached between loads)
+		if not indexes:
+			indexes.append(get_directory_index(path) if package_archive is None else get_package_archive(path))
+		return indexes[0]
+
+	def local_exists(resource):
+		if resource.local_path and resource.resource_dir == path and not resource.archive_dir:
+			return get_index().exists(resource.local_path)
+		return resource.exists
+
 	def expand(res_info, cls, logger):
 		collected = []
 		for opts in res_info:
@@ -34,49 +62,83 @@ def get_resources(*, group_name, path, logger, cache, compile_conf, template_con
 					opts = dict(local_path=opts)
 			if 'local_path' in opts:
 				full_paths = abspath(join(path, opts['local_path']))
-				#todo: recursive glob requires python 3.5 (and use ** for recursion)
-				expanded = tuple(relpath(pth, path) for pth in glob(full_paths))
+				if isabs(opts['local_path']) or '..' in opts['local_path'].replace('\\', '/').split('/'):
+					if package_archive is not None:
+						raise InvalidPackageConfigError(('local_path "{0:s}" points outside package archive "{1:s}"')
+							.format(opts['local_path'], package_archive))
+					expanded = tuple(relpath(pth, path) for pth in glob(full_paths, recursive=True))
+				else:
+					expanded = tuple(get_index().glob(opts['local_path']))
 				if 'remote_path' in opts and '*' in opts['local_path']:
 					raise InvalidPackageConfigError(('wildcard in local_path "{0:s}" not allowed if remote_path is set '
 						'("{1:s}"), since remote_path cannot have wildcards').format(
-							opts['local_path'], opts['path_path']))
+							opts['local_path'], opts['remote_path']))
 				if not expanded:
 					logger.info('no match for "{0:}" (expected in "{1:s}")'.format(opts, full_paths), level=2)
 				del opts['local_path']
 				for pth in expanded:
 					collected.append(cls(logger=logger, cache=cache, compile_conf=compile_conf, group_name=group_name,
-						resource_dir=path, local_path=pth, note=note, **opts))
+						resource_dir=path, local_path=pth, note=note, package_archive=package_archive, **opts))
 			else:
 				collected.append(cls(logger=logger, cache=cache, compile_conf=compile_conf, group_name=group_name,
-					resource_dir=path, note=note, **opts))
+					resource_dir=path, note=note, package_archive=package_archive, **opts))
 		return collected
 
 	template, styles, scripts, static = None, [], [], []
 	if template_conf:
 		template = HtmlResource(logger=logger, cache=cache, compile_conf=compile_conf, group_name=group_name,
-			resource_dir=path, local_path=template_conf, note=note)
-		assert isfile(join(path, template.local_path)), \
+			resource_dir=path, local_path=template_conf, note=note, package_archive=package_archive)
+		assert get_index().isfile(template.local_path), \
 			'template {0:s} does not exist'.format(template.local_path)
 	if style_conf:
 		styles = expand(style_conf, cls=StyleResource, logger=logger)
 		for resource in styles:
-			assert resource.exists, 'style {0:} does not exist at {1:s}'.format(resource, resource.full_file_path)
+			assert local_exists(resource), 'style {0:} does not exist at {1:s}'.format(resource, resource.full_file_path)
 	if script_conf:
 		scripts = expand(script_conf, cls=ScriptResource, logger=logger)
 		for resource in scripts:
-			assert resource.exists, 'scripts {0:} does not exist at {1:s}'.format(resource, resource.full_file_path)
+			assert local_exists(resource), 'scripts {0:} does not exist at {1:s}'.format(resource, resource.full_file_path)
 	if static_conf:
 		static = expand(static_conf, cls=StaticResource, logger=logger)
 		for resource in static:
-			assert resource.exists, 'static {0:} does not exist at {1:s}'.format(resource, resource.full_file_path)
+			assert local_exists(resource), 'static {0:} does not exist at {1:s}'.format(resource, resource.full_file_path)
 	return template, styles, scripts, static
 
 
+GZIP_MIN_SIZE = 1024
+GZIP_EXTENSIONS = {'.css', '.js', '.html', '.htm', '.svg', '.json', '.map', '.txt', '.xml', '.csv', '.md', '.rst'}
+
+
+INTERNALIZE_MAX_SIZE = 4 * 1024
+INTERNALIZE_BUDGET = 64 * 1024
+RELATIVE_CSS_REF = r'url\((?!\s*[\'"]?(?:[a-zA-Z][a-zA-Z0-9+.-]*:|/|#))|@import'
+
+
+def fingerprint_name(pth, digest):
+	"""
+	Insert (the start of) a content hash before the extension, e.g. style.css -> style.1a2b3c4d5e.css
+	"""
+	base, ext = splitext(pth)
+	return '{0:s}.{1:.10s}{2:s}'.format(base, digest, ext)
+
+
+def write_asset_manifest(resources, pth):
+	"""
+	Write a json file that maps the original output paths of copied resources to their fingerprinted paths.
+	"""
+	mapping = OrderedDict()
+	for resource in resources:
+		if resource is not None:
+			mapping.update(sorted(resource.fingerprints.items()))
+	with open(pth, 'w+') as fh:
+		dump(mapping, fh, indent=1)
+
+
 #todo: should this be in compiler or here? it's used by Package and Section
 class Resource:
 	def __init__(self, logger, cache, compile_conf, group_name, resource_dir=None, *, local_path=None, remote_path=None,
 			allow_make_offline=True, download_archive=None, downloaded_path=None, copy_map=None, allow_minify=True,
-			tag_type=None, internalize=None, note=None):
+			tag_type=None, internalize=None, note=None, package_archive=None):
 		"""
 		There are basically three options:
 
@@ -96,8 +158,10 @@ class Resource:
 		:param copy_map: A mapping from original to final file paths for either local or archive data. Can be used to copy extra files or set the location of the main archive file.
 		:param allow_minify: Allow (not guarantee) automatic minifying of resources (should be False if already minified; True by default).
 		:param tag_type: Value of the tag's `type` parameter (if not standard) for scripts and styles.
-		:param internalize: If `True`, put the file content inside the tag within the document, rather than linking it (the default `None` allows the compiler to choose).
+		:param internalize: If `True`, put the file content inside the tag within the document, rather than linking it (the default `None` allows the compiler to choose, see `InternalizePolicy`).
 		:param note: A simple text note that may be included.
+		:param package_archive: Path of the zip archive that local files are read from (instead of `resource_dir`);
+			they are only extracted when a real path is needed, e.g. to copy them.
 		"""
 		self.logger = logger
 		self.cache = cache
@@ -130,10 +194,16 @@ class Resource:
 		self.resource_dir = resource_dir
 		self.archive_dir = None
 		self.group_name = group_name
+		self.downloader = None
+		self.package_archive = package_archive
 		if not self.local_path and not self.remote_path:
 			self.make_offline()
 		self.allow_minify = allow_minify
 		self.processed_path = None
+		self._processing = []
+		self.fingerprinted_path = None
+		self.fingerprints = {}
+		self.content_named = False  # set if the output name already depends on the content (no fingerprint needed)
 		self.tag_type = tag_type
 		if internalize:
 			assert local_path or allow_make_offline, 'To internalize a resource, it must be available offline ' \
@@ -145,6 +215,26 @@ class Resource:
 		# assert hasattr(downloaded_copy, '__iter__') and not isinstance(downloaded_copy, str), \
 		# 	'{0:}: downloaded_copy should be a list'.format(self)
 
+	def __getstate__(self):
+		"""
+		Resources can be pickled (e.g. in snapshots) without their logger, cache and settings; use `attach` after
+		unpickling.
+		"""
+		state = self.__dict__.copy()
+		for attr in ('logger', 'cache', 'compile_conf', 'downloader', '_content', '_processing'):
+			state.pop(attr, None)
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.logger = self.cache = self.compile_conf = self.downloader = None
+		self._processing = []
+
+	def attach(self, logger, cache, compile_conf):
+		self.logger = logger
+		self.cache = cache
+		self.compile_conf = compile_conf
+
 	def __str__(self):
 		pth_str = ('"{0:s}" & "{1:s}"' if (self.local_path and self.remote_path) else '"{0:s}{1:s}"')\
 			.format((self.local_path or ''), (self.remote_path or ''))
@@ -159,6 +249,7 @@ class Resource:
 			return
 		if not self.allow_make_offline:
 			return
+		self.package_archive = None
 		self.resource_dir = join(self.compile_conf.TMP_DIR, 'offline', self.group_name)
 		makedirs(self.resource_dir, exist_ok=True, mode=0o700)
 		if self.download_archive:
@@ -175,16 +266,33 @@ class Resource:
 			return pth, ''
 		return parts[0][0], parts[0][1]
 
+	@property
+	def offline_url(self):
+		"""
+		The url that `make_offline` would download, if any.
+		"""
+		if self.local_path or not self.allow_make_offline:
+			return None
+		return self.download_archive or self.remote_path
+
+	def _download(self, url):
+		"""
+		Download using the `downloader` if one was set (e.g. by PackageList, which prefetches concurrently).
+		"""
+		if self.downloader is not None:
+			return self.downloader.fetch(url)
+		with _SHARED_CACHE_LOCK:
+			return self.cache.get_or_create_file(url=url)
+
 	def _make_offline_from_file(self):
 		self.logger.info(' making file available offline: {0:}'.format(self.remote_path), level=2)
 		prefix = hash_str('{0:s}.{1:s}'.format(self.group_name, self.remote_path))
 		pth, self.local_params = self.split_params(self.remote_path)
 		self.local_path = '{0:.6s}{1:s}'.format(prefix, basename(pth))
-		link_or_copy(
-			src=self.cache.get_or_create_file(url=self.remote_path),
-			dst=join(self.resource_dir, self.local_path),
-			exist_ok=True,
-		)
+		src = self._download(self.remote_path)
+		# TMP_DIR may be shared by concurrent compiles, so the file is published atomically (and only once)
+		create_once(join(self.resource_dir, self.local_path), lambda tmp_pth: link_or_copy(src=src, dst=tmp_pth,
+			exist_ok=True))
 		self.notes.append('downloaded from "{0:s}"'.format(self.remote_path))
 
 	def _make_offline_from_archive(self):
@@ -192,10 +300,17 @@ class Resource:
 		prefix = hash_str('{0:s}.{1:s}'.format(self.group_name, self.download_archive))
 		self.archive_dir = '{0:.8s}_{1:s}'.format(prefix,
 			splitext(basename(self.split_params(self.download_archive)[0]))[0])
-		archive = self.cache.get_or_create_file(url=self.download_archive)
-		dir = self.cache.get_or_create_file(rzip=archive)
-		link_or_copy(dir, join(self.resource_dir, self.archive_dir), exist_ok=True)
+		archive = self._download(self.download_archive)
 		self.local_path, self.local_params = self.split_params(self.downloaded_path)
+		from zipfile import is_zipfile  # imported here, since only downloaded archives need it
+		if is_zipfile(archive):
+			# only extract the main file and the copy_map sources, rather than the whole archive
+			dir = extract_members(archive, [self.local_path] + [src for src in self.copy_map.keys() if src])
+		else:
+			with _SHARED_CACHE_LOCK:
+				dir = self.cache.get_or_create_file(rzip=archive)
+		create_once(join(self.resource_dir, self.archive_dir), lambda tmp_pth: link_or_copy(dir, tmp_pth,
+			exist_ok=True))
 
 	def minify(self):
 		"""
@@ -206,16 +321,52 @@ class Resource:
 			return
 		self.notes = []
 
+	def _local_file(self, relpth):
+		"""
+		Real path of local file `relpth`; files in a package archive are extracted (once) to get one.
+		"""
+		if self.package_archive is not None:
+			return join(get_package_archive(self.package_archive).extract([relpth]), relpth)
+		assert self.resource_dir, 'cannot get file path for {0:s} since `resource_dir` is not set'.format(self)
+		return join(self.resource_dir, self.archive_dir or '', relpth)
+
 	@property
 	def full_file_path(self):
 		"""
 		Full path to where the local file, if set, can be loaded (so no GET parameters etc).
 		"""
 		if self.local_path:
-			assert self.resource_dir, 'cannot get file path for {0:s} since `resource_dir` is not set'.format(self)
-			return join(self.resource_dir, self.archive_dir or '', self.local_path)
+			return self._local_file(self.local_path)
 		return None
 
+	def _in_archive(self):
+		"""
+		Whether the file itself (not a processed version) is still only in the package archive.
+		"""
+		return self.package_archive is not None and self.processed_path is None
+
+	def _source_hash(self):
+		"""
+		Content hash of the processed file, or the original file if there is none.
+		"""
+		if self._in_archive():
+			return get_package_archive(self.package_archive).hash(self.local_path)
+		return hash_file_streaming(self._processed_file())
+
+	def _processed_file(self):
+		"""
+		Path of the processed file, or of the original file if there is none. Processed files are kept in a content
+		cache, which may have evicted them since (e.g. in a long-running daemon or watcher); they are then processed
+		again.
+		"""
+		if self.processed_path is not None and not exists(self.processed_path):
+			self.logger.info(' processed file "{0:s}" for {1:} is gone; processing again'.format(self.processed_path,
+				self), level=2)
+			steps, self.processed_path, self._processing = self._processing, None, []
+			for func, name, version in steps:
+				self._do_process(func, name, version)
+		return self.processed_path or self.full_file_path
+
 	@property
 	def full_path(self):
 		"""
@@ -230,6 +381,8 @@ class Resource:
 		"""
 		Path relative to the document, including parameters.
 		"""
+		if self.fingerprinted_path:
+			return self.fingerprinted_path + self.local_params
 		if self.local_path:
 			return self.local_path + self.local_params
 		return self.remote_path
@@ -238,22 +391,32 @@ class Resource:
 	def exists(self):
 		if self.remote_path:
 			return True
+		if self.package_archive is not None:
+			return get_package_archive(self.package_archive).exists(self.local_path)
 		return exists(self.full_file_path)
 
 	@property
 	def html(self):
 		raise NotImplementedError('generic resource cannot be linked from html; use a subclass')
 
-	def copy(self, to, allow_symlink=False):
+	def copy(self, to, allow_symlink=False, fingerprint=False, gzip_level=None, gzip_min_size=GZIP_MIN_SIZE):
 		"""
 		Copy necessary files to `to` if they are local.
+
+		:param fingerprint: Add a content hash to the name of the main copied file (so it can be cached indefinitely);
+			`relative_path` (and thereby `html`) then refers to the fingerprinted file, and `fingerprints` maps
+			original to fingerprinted names (see `write_asset_manifest`). Extra files from `copy_map` keep their
+			names, since the main file refers to them by name.
+		:param gzip_level: If set, also write precompressed `.gz` files next to copied text files (for servers that
+			can serve those directly), compressed at this level (1-9).
+		:param gzip_min_size: Files smaller than this many bytes are not compressed.
 		"""
 		self.logger.info(' {0:} {2:} for {1:s}'.format(self.__class__.__name__,
 			self.group_name, id(self) % 100000), level=3)
 		if self.local_path is None:
 			return
 		if self.processed_path is None:
-			self.processed_path = self.full_file_path
+			self.processed_path, self._processing = self.full_file_path, []
 		if self.copy_map:
 			allow_symlink = False  # this may be too aggressive
 		else:
@@ -262,47 +425,139 @@ class Resource:
 			if src:
 				assert '*' not in src, '{0:}: wildcards not allowed in copy_map'.format(self)
 				assert self.resource_dir is not None, 'local resources should have resource_dir specified'
-				srcpth = join(self.resource_dir, self.archive_dir or '', src)
+				srcpth = self._local_file(src)
 			else:
-				srcpth = self.processed_path
+				srcpth = self._processed_file()
+			if fingerprint and not src and not self.content_named and isfile(srcpth):
+				self.fingerprints[dst] = self.fingerprinted_path = fingerprint_name(dst, hash_file_streaming(srcpth))
+				dst = self.fingerprinted_path
 			dstpth = join(to, dst)
 			if self.logger.get_level() >= 3:
 				self.logger.info('  copying {0:s} {1:s} -> {2:}'.format(self.__class__.__name__, srcpth, dstpth), level=3)
 			else:
 				self.logger.info(' copying {0:s} {1:}'.format(self.__class__.__name__, dstpth), level=2)
-			if exists(dstpth) and getmtime(dstpth) >= getmtime(srcpth):
+			if exists(dstpth) and (dst in self.fingerprints.values() or getmtime(dstpth) >= getmtime(srcpth)):
 				self.logger.info('  {0:s} {1:s} seems unchanged'.format(self.__class__.__name__, dstpth), level=3)
 			else:
 				link_or_copy(src=srcpth, dst=dstpth, follow_symlinks=True, allow_linking=allow_symlink, create_dirs=True, exist_ok=True)
+			if gzip_level:
+				self._copy_gzipped(srcpth, dstpth, level=gzip_level, min_size=gzip_min_size)
 
-	def _do_process(self, func, name='res_proc'):
+	def _copy_gzipped(self, srcpth, dstpth, level, min_size):
+		"""
+		Place a compressed copy of `srcpth` at `dstpth`.gz. Compressed files are cached by content and level.
+		"""
+		if not isfile(srcpth) or splitext(dstpth)[1].lower() not in GZIP_EXTENSIONS or getsize(srcpth) < min_size:
+			return
+		gzpth = '{0:s}.gz'.format(dstpth)
+		if exists(gzpth) and getmtime(gzpth) >= getmtime(srcpth):
+			return
+		from gzip import GzipFile
+		def compress(outpth):
+			with open(srcpth, 'rb') as fin, GzipFile(outpth, 'wb', compresslevel=level, mtime=0) as fout:
+				copyfileobj(fin, fout)
+		key = sha256('{0:d}\t{1:s}'.format(level, hash_file_streaming(srcpth)).encode('utf-8')).hexdigest() + '.gz'
+		self.logger.info('  compressing {0:s} {1:}'.format(self.__class__.__name__, gzpth), level=3)
+		link_or_copy(src=get_content_cache('gzip').get_or_create(key, compress), dst=gzpth, follow_symlinks=True,
+			allow_linking=False, create_dirs=True, exist_ok=True, allow_overwrite=True)
+
+	def _do_process(self, func, name='res_proc', version=''):
+		"""
+		Process the file with `func(inpath, outpath)`. Results are cached by input content, resource type, `name`
+		and `version`, so identical files (e.g. the same library in several packages) are only processed once.
+		"""
 		if not self.allow_minify:
 			return
 		self.notes = []
 		if self.local_path is None:
 			return
 		if self.processed_path is None:
-			self.processed_path = self.full_file_path
+			self._processing = []
+		else:
+			self._processed_file()
 		src = self.processed_path
-		makedirs(self.resource_dir, exist_ok=True, mode=0o700)
-		self.processed_path = join(self.compile_conf.TMP_DIR, name, self.group_name, self.local_path)
+		key = sha256('{0:s}\t{1:s}\t{2:s}\t{3:s}'.format(self.__class__.__name__, name, version,
+			self._source_hash()).encode('utf-8')).hexdigest() + splitext(self.local_path)[1]
+		# the input path is only needed (and files in an archive only extracted) if the result is not cached
+		self.processed_path = get_content_cache(name).get_or_create(key,
+			lambda outpth: func(src or self.full_file_path, outpth))
+		# remembered so the result can be made again if the cache evicts it
+		self._processing.append((func, name, version))
 		if self.logger.get_level() >= 3:
-			self.logger.info('  processing {0:s} {1:s} -> {2:}'.format(self.__class__.__name__, src, self.processed_path), level=3)
+			self.logger.info('  processing {0:s} {1:s} -> {2:}'.format(self.__class__.__name__, src or self.local_path,
+				self.processed_path), level=3)
 		else:
 			self.logger.info(' processing {0:s} {1:}'.format(self.__class__.__name__, self.processed_path), level=2)
-		link_or_copy(src=self.cache.get_or_create_file(func=partial(func, src), dependencies=(src,)),
-			dst=self.processed_path, exist_ok=False, allow_overwrite=True)
 
 
 class LinkedResource(Resource):
 	def file_content(self):
 		"""
-		Get the content of a file if it is available locally (e.g. for internalizing).
+		Get the content of a file if it is available locally (e.g. for internalizing). This is the processed (e.g.
+		minified) file if there is one. The content is read once per file version (path, modification time and
+		size), so files edited in place are read again.
 		"""
-		assert self.local_path, ('resource ({0:s}) must be local or have already been localized in order to get '
+		assert self.local_path, ('resource ({0:}) must be local or have already been localized in order to get '
 			'file content').format(self)
-		with open(self.local_path, 'r') as fh:
-			return fh.read()
+		if self._in_archive():
+			key = (self.package_archive, self.local_path)
+			if getattr(self, '_content', (None, None))[0] != key:
+				self._content = (key, get_package_archive(self.package_archive).read(self.local_path).decode('utf-8'))
+			return self._content[1]
+		pth = self._processed_file()
+		info = stat(pth)
+		key = (pth, info.st_mtime_ns, info.st_size)
+		if getattr(self, '_content', (None, None))[0] != key:
+			with open(pth, 'r') as fh:
+				self._content = (key, fh.read())
+		return self._content[1]
+
+	@property
+	def file_size(self):
+		if self._in_archive():
+			return get_package_archive(self.package_archive).size(self.local_path)
+		return getsize(self._processed_file())
+
+
+class InternalizePolicy:
+	"""
+	Chooses whether to put the content of styles and scripts with `internalize=None` in the document: files up to
+	`max_size` bytes are inlined as long as the total inlined size stays within `budget` (per document), others are
+	linked. Styles with relative `url(...)` or `@import` references are always linked, since those would break.
+
+	Resources are shared between builds (e.g. in watch mode), so the choice is made on a copy of the resource for this
+	build, and a new policy chooses again for every resource.
+	"""
+	def __init__(self, max_size=INTERNALIZE_MAX_SIZE, budget=INTERNALIZE_BUDGET):
+		self.max_size = max_size
+		self.budget = budget
+		self.used = 0
+
+	def should_internalize(self, resource):
+		if resource.local_path is None or resource.copy_map:
+			return False
+		size = resource.file_size
+		if size > self.max_size or self.used + size > self.budget:
+			return False
+		if isinstance(resource, StyleResource) and findall(RELATIVE_CSS_REF, resource.file_content()):
+			return False
+		self.used += size
+		return True
+
+	def choose(self, resource):
+		"""
+		:return: The resource itself if its `internalize` was set explicitly, or else a copy with the choice.
+		"""
+		if resource.internalize is not None or not isinstance(resource, LinkedResource):
+			return resource
+		chosen = shallow_copy(resource)
+		chosen.fingerprints = dict(resource.fingerprints)
+		chosen.internalize = self.should_internalize(resource)
+		return chosen
+
+	def apply(self, resources):
+		for resource in resources:
+			yield self.choose(resource)
 
 
 class NonLinkedResource(Resource):
@@ -346,9 +601,10 @@ class StyleResource(LinkedResource):
 		"""
 		Minimize the tag if possible (strip whitespace and things like that).
 		"""
+		from css_html_js_minify import process_single_css_file, __version__
 		def min_css(inpath, outpath):
 			process_single_css_file(css_file_path=inpath, output_path=outpath, overwrite=False)
-		return self._do_process(min_css, 'minify')
+		return self._do_process(min_css, 'minify', version=__version__)
 
 
 class ScriptResource(LinkedResource):
@@ -359,7 +615,7 @@ class ScriptResource(LinkedResource):
 		"""
 		tag_type = self.tag_type or 'text/javascript'
 		if self.internalize:
-			return '<script type="{1:s}" >{0:s}</script>'.format(self.file_content(), self.tag_type) + \
+			return '<script type="{1:s}" >{0:s}</script>'.format(self.file_content(), tag_type) + \
 				(' <!-- file content inserted; {0:s} -->'.format('; '.join(self.notes)) if self.notes else '')
 		return '<script src="{0:s}" type="{1:s}"></script>'.format(self.relative_path, tag_type) + \
 			(' <!-- {0:s} -->'.format('; '.join(self.notes)) if self.notes else '')
@@ -368,9 +624,10 @@ class ScriptResource(LinkedResource):
 		"""
 		Minimize the tag if possible (strip whitespace and things like that).
 		"""
+		from css_html_js_minify import process_single_js_file, __version__
 		def min_js(inpath, outpath):
 			process_single_js_file(js_file_path=inpath, output_path=outpath, overwrite=False)
-		return self._do_process(min_js, 'minify')
+		return self._do_process(min_js, 'minify', version=__version__)
 
 
 class StaticResource(NonLinkedResource):
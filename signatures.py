@@ -0,0 +1,124 @@
+
+from collections import OrderedDict
+from hashlib import sha256
+from json import load, dump
+from os import stat, replace, remove, fstat
+from os.path import join
+from .locking import temp_path
+from .utils import run_parallel
+
+
+MANIFEST_NAME = 'signatures.json'
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 256 * 1024
+MMAP_THRESHOLD = 4 * 1024 * 1024
+
+
+def hash_file_streaming(pth, chunk_size=CHUNK_SIZE, mmap_threshold=MMAP_THRESHOLD):
+	"""
+	Hash a file without reading it into memory at once: large files are mapped, others read in chunks. The digest is
+	the same as that of `compiler.utils.hash_file`, so existing signatures remain valid.
+	"""
+	hasher = sha256()
+	with open(pth, 'rb') as fh:
+		if fstat(fh.fileno()).st_size >= mmap_threshold:
+			from mmap import mmap, ACCESS_READ
+			with mmap(fh.fileno(), 0, access=ACCESS_READ) as mapped:
+				hasher.update(mapped)
+		else:
+			for chunk in iter(lambda: fh.read(chunk_size), b''):
+				hasher.update(chunk)
+	return hasher.hexdigest()
+
+
+def hash_files(path, names, workers=None):
+	"""
+	Hash files `names` (relative to `path`) concurrently; hashing releases the GIL, so threads use multiple cores.
+
+	:return: Mapping from name to hash, sorted by name regardless of the order in which hashing finished.
+	"""
+	file_sigs = OrderedDict()
+	for name, hash, err in run_parallel(lambda name: hash_file_streaming(join(path, name)), sorted(names),
+			workers=workers):
+		if err is not None:
+			raise err
+		file_sigs[name] = hash
+	return file_sigs
+
+
+def read_manifest(path):
+	"""
+	Read the signature manifest stored in package directory `path`, or return None if there is no (valid) manifest.
+	"""
+	try:
+		with open(join(path, MANIFEST_NAME), 'r') as fh:
+			manifest = load(fh)
+	except (FileNotFoundError, ValueError):
+		return None
+	return manifest_files(manifest)
+
+
+def manifest_files(manifest):
+	"""
+	Get the file entries from a parsed manifest, or None if it is not a (current) manifest.
+	"""
+	if not isinstance(manifest, dict) or manifest.get('version', None) != MANIFEST_VERSION:
+		return None
+	return manifest.get('files', None)
+
+
+def file_stats(path, names):
+	"""
+	Get the size and modification time (as stored in the manifest) of each of `names`, relative to `path`.
+	"""
+	stats = OrderedDict()
+	for name in names:
+		info = stat(join(path, name))
+		stats[name] = (info.st_size, info.st_mtime_ns)
+	return stats
+
+
+def write_manifest(path, file_sigs):
+	"""
+	Store the size, modification time and hash of each file in `file_sigs` (a mapping from relative path to hash).
+	The manifest is written to a temporary file first and then moved into place, so readers never see half of it.
+	"""
+	files = OrderedDict()
+	for name, (size, mtime) in file_stats(path, file_sigs.keys()).items():
+		files[name] = [size, mtime, file_sigs[name]]
+	tmp_pth = temp_path(join(path, MANIFEST_NAME))
+	try:
+		with open(tmp_pth, 'w+') as fh:
+			dump({'version': MANIFEST_VERSION, 'files': files}, fh, indent=1)
+		replace(tmp_pth, join(path, MANIFEST_NAME))
+	except:
+		try:
+			remove(tmp_pth)
+		except FileNotFoundError:
+			pass
+		raise
+
+
+def verify_manifest(path, manifest, files, full_verify=False, workers=None):
+	"""
+	Get the hashes of `files` in `path`, taking them from `manifest` when the size and modification time match,
+	and rehashing the others (or all, if `full_verify` is set).
+
+	:return: The file signatures (sorted by name) and a list of files that differ from the manifest.
+	"""
+	file_sigs, rehash = OrderedDict(), []
+	for name in sorted(files):
+		known = manifest.get(name, None)
+		if known is not None and not full_verify:
+			info = stat(join(path, name))
+			if info.st_size == known[0] and info.st_mtime_ns == known[1]:
+				file_sigs[name] = known[2]
+				continue
+		file_sigs[name] = None
+		rehash.append(name)
+	file_sigs.update(hash_files(path, rehash, workers=workers))
+	changed = [name for name in rehash if name not in manifest or file_sigs[name] != manifest[name][2]]
+	changed.extend(sorted(set(manifest.keys()) - set(file_sigs.keys())))
+	return file_sigs, changed
+
+
@@ -0,0 +1,103 @@
+
+from hashlib import sha256
+from os import makedirs, replace, remove
+from os.path import join, exists
+from pickle import load, dump, HIGHEST_PROTOCOL, UnpicklingError
+from .installed import get_installed_index
+from .locking import temp_path
+from .package import Package
+from .packages import PackageList
+from .resolver import resolve_versions
+from .utils import get_cache_dir, get_package_dir
+
+
+SNAPSHOT_VERSION = 3
+
+
+def snapshot_key(requests, packages_dir):
+	"""
+	Key for a set of requested packages, which changes when the requests or the installed packages change.
+
+	:param requests: Sequence of (name, version range, options) tuples.
+	"""
+	text = '{0:d}\n{1:s}\n{2:s}\n{3:s}'.format(SNAPSHOT_VERSION, packages_dir, repr([(name, version, sorted(
+		(options or {}).items())) for name, version, options in requests]),
+		get_installed_index(packages_dir).fingerprint())
+	return sha256(text.encode('utf-8')).hexdigest()
+
+
+def save_snapshot(package_list, pth):
+	"""
+	Store the prepared state of all packages (metadata, config, resources with resolved paths; actions as import
+	paths), in order.
+	"""
+	state = {'version': SNAPSHOT_VERSION, 'packages': [package.snapshot() for package in package_list.packages]}
+	tmp_pth = temp_path(pth)
+	try:
+		with open(tmp_pth, 'wb+') as fh:
+			dump(state, fh, protocol=HIGHEST_PROTOCOL)
+		replace(tmp_pth, pth)
+	finally:
+		if exists(tmp_pth):
+			remove(tmp_pth)
+
+
+def read_snapshot(pth, logger, cache, compile_conf):
+	"""
+	Recreate the packages stored by `save_snapshot`, or return None if the snapshot is missing or outdated.
+	"""
+	try:
+		with open(pth, 'rb') as fh:
+			state = load(fh)
+	except (OSError, EOFError, ValueError, AttributeError, ImportError, UnpicklingError):
+		return None
+	if state.get('version', None) != SNAPSHOT_VERSION:
+		return None
+	packages = []
+	for package_state in state['packages']:
+		package = Package.from_snapshot(package_state, logger=logger, cache=cache, compile_conf=compile_conf)
+		if package is None:
+			return None
+		packages.append(package)
+	return packages
+
+
+def load_package_list(requests, logger, cache, compile_conf, document_conf, *, packages_dir=None,
+		snapshot_dir=None, lockfile=None, **kwargs):
+	"""
+	Get a PackageList for `requests` from a snapshot if there is a valid one, otherwise resolve versions (including
+	required packages), load the packages and store a snapshot for the next time.
+
+	:param requests: Sequence of (name, version range, options) tuples.
+	:param lockfile: Path of a lockfile with the resolved versions, used if valid and (re)written otherwise.
+	:param kwargs: Passed on to PackageList.
+	"""
+	if packages_dir is None:
+		packages_dir = get_package_dir()
+	if snapshot_dir is None:
+		snapshot_dir = join(get_cache_dir(), 'snapshots')
+	requests = tuple(requests)
+	pth = join(snapshot_dir, '{0:s}.pickle'.format(snapshot_key(requests, packages_dir)))
+	packages = read_snapshot(pth, logger=logger, cache=cache, compile_conf=compile_conf)
+	if packages is not None:
+		logger.info('loading packages from snapshot "{0:s}"'.format(pth), level=2)
+		package_list = PackageList([], logger=logger, cache=cache, compile_conf=compile_conf,
+			document_conf=document_conf, **kwargs)
+		for package in packages:
+			package.packages = package_list
+		package_list.add_packages(packages)
+		return package_list
+	package_list = PackageList([], logger=logger, cache=cache, compile_conf=compile_conf, document_conf=document_conf,
+		**kwargs)
+	resolved = resolve_versions(requests, packages_dir=packages_dir, lockfile=lockfile, logger=logger)
+	package_list.add_packages([Package(item.name, item.version_request, item.options, logger=logger, cache=cache,
+		compile_conf=compile_conf, packages=package_list, packages_dir=packages_dir,
+		locked=(item.version, item.path)) for item in resolved])
+	try:
+		makedirs(snapshot_dir, exist_ok=True)
+		save_snapshot(package_list, pth)
+	except OSError as err:
+		logger.info('could not store package snapshot "{0:s}": {1:}'.format(pth, err), level=1)
+	return package_list
+
+
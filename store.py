@@ -0,0 +1,150 @@
+
+from collections import OrderedDict
+from errno import EEXIST
+from os import makedirs, link, replace, remove, rename, chmod, scandir, rmdir
+from os.path import join, exists, dirname
+from shutil import copyfile, rmtree
+from .file_index import DirectoryIndex
+from .installed import get_installed_index
+from .locking import temp_path, file_lock
+from .signatures import MANIFEST_NAME, read_manifest, write_manifest, verify_manifest, hash_files
+from .utils import PackageError
+
+
+STORE_DIR = '.store'
+
+
+class ContentStore:
+	"""
+	Stores the files of installed packages once per content hash, below `packages_dir` (in a hidden directory, so it
+	is not taken for a package). Version directories are built from hardlinks to the stored files, so versions with
+	mostly the same files take little extra disk space or page cache, and installing them copies only new content.
+
+	Stored files are shared by every version that contains them, so they are made read-only; if the store is on
+	another filesystem than the version directory (or hardlinks are not supported), files are copied instead.
+	Installing and collecting garbage take a lock on the store, so no stored file is removed while it is linked.
+	"""
+	def __init__(self, packages_dir):
+		self.packages_dir = packages_dir
+		self.dir = join(packages_dir, STORE_DIR, 'objects')
+		self.lock_path = join(packages_dir, STORE_DIR, 'lock')
+		makedirs(self.dir, exist_ok=True)
+
+	def __repr__(self):
+		return '<{0:s} "{1:s}">'.format(self.__class__.__name__, self.dir)
+
+	def object_path(self, hash):
+		return join(self.dir, hash[:2], hash[2:])
+
+	def add_file(self, pth, hash):
+		"""
+		Store the content of file `pth` (which has sha256 `hash`) unless it is already stored.
+
+		:return: The path of the stored file.
+		"""
+		obj_pth = self.object_path(hash)
+		if exists(obj_pth):
+			return obj_pth
+		makedirs(dirname(obj_pth), exist_ok=True)
+		tmp_pth = temp_path(obj_pth)
+		try:
+			copyfile(pth, tmp_pth)
+			chmod(tmp_pth, 0o444)
+			replace(tmp_pth, obj_pth)
+		finally:
+			if exists(tmp_pth):
+				remove(tmp_pth)
+		return obj_pth
+
+	def _place(self, obj_pth, dst):
+		makedirs(dirname(dst), exist_ok=True)
+		try:
+			link(obj_pth, dst)
+		except OSError as err:
+			if err.errno == EEXIST:
+				raise
+			copyfile(obj_pth, dst)
+			chmod(dst, 0o444)
+
+	def _hash_files(self, src, files, workers=None):
+		"""
+		Get the hashes of `files` in `src`. The signature manifest in `src` (if up to date) is only trusted for
+		content that is already stored; files that would be added to the store are hashed, so that a stale manifest
+		(e.g. after an edit that kept the size and modification time) cannot store content under the wrong hash.
+
+		:return: The file signatures (sorted by name) and the files whose content was found in the store.
+		"""
+		manifest = read_manifest(src) or {}
+		stored = {relpth: manifest[relpth] for relpth in files
+			if relpth in manifest and exists(self.object_path(manifest[relpth][2]))}
+		file_sigs, changed = verify_manifest(src, stored, stored.keys(), workers=workers)
+		file_sigs.update(hash_files(src, [relpth for relpth in files if relpth not in stored], workers=workers))
+		return OrderedDict(sorted(file_sigs.items())), [relpth for relpth in stored if relpth not in changed]
+
+	def install(self, src, name, version, workers=None):
+		"""
+		Install the files in directory `src` as version `version` of package `name` (see `_hash_files` for how
+		hashes are found). The version directory is assembled next to its final location and renamed into place,
+		so it is never seen half-installed.
+
+		:return: The path of the installed version directory.
+		"""
+		target = join(self.packages_dir, name, version)
+		if exists(target):
+			raise PackageError('version {1:s} of package {0:s} is already installed at "{2:s}"'.format(
+				name, version, target))
+		files = [relpth for relpth in DirectoryIndex(src).list_files() if relpth != MANIFEST_NAME]
+		file_sigs, trusted = self._hash_files(src, files, workers=workers)
+		tmp_dir = temp_path(join(self.packages_dir, name, '.' + version))
+		try:
+			with file_lock(self.lock_path):
+				# stored content may have been collected as garbage since it was checked
+				file_sigs.update(hash_files(src, [relpth for relpth in trusted
+					if not exists(self.object_path(file_sigs[relpth]))], workers=workers))
+				for relpth, hash in file_sigs.items():
+					self._place(self.add_file(join(src, relpth), hash), join(tmp_dir, relpth))
+				makedirs(tmp_dir, exist_ok=True)
+				write_manifest(tmp_dir, file_sigs)
+				rename(tmp_dir, target)
+		finally:
+			if exists(tmp_dir):
+				rmtree(tmp_dir)
+		get_installed_index(self.packages_dir).add(name, version)
+		return target
+
+	def uninstall(self, name, version):
+		"""
+		Remove an installed version; its stored files remain until `collect_garbage`.
+		"""
+		target = join(self.packages_dir, name, version)
+		tmp_dir = temp_path(join(self.packages_dir, name, '.' + version + '.del'))
+		rename(target, tmp_dir)
+		rmtree(tmp_dir)
+		get_installed_index(self.packages_dir).remove(name, version)
+
+	def collect_garbage(self):
+		"""
+		Remove stored files that are not linked from any version directory anymore (so only the store has them).
+		Stored files that were copied rather than linked are never in use, so this only frees space with hardlinks.
+
+		:return: The number of removed files.
+		"""
+		count = 0
+		with file_lock(self.lock_path), scandir(self.dir) as subdirs:
+			for subdir in subdirs:
+				if not subdir.is_dir():
+					continue
+				with scandir(subdir.path) as entries:
+					for entry in entries:
+						if entry.name.endswith('.tmp'):
+							continue
+						if entry.stat().st_nlink == 1:
+							remove(entry.path)
+							count += 1
+				try:
+					rmdir(subdir.path)
+				except OSError:
+					pass
+		return count
+
+
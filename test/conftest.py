@@ -0,0 +1,90 @@
+
+from json import dumps
+from os import makedirs
+from os.path import join, dirname
+from sys import modules
+from types import SimpleNamespace
+from pytest import fixture
+
+
+class Logger:
+	def __init__(self):
+		self.messages = []
+
+	def info(self, msg, level=1):
+		self.messages.append((level, msg))
+
+	def get_level(self):
+		return 1
+
+
+class PackageEnv:
+	"""
+	A packages directory and import dir in a temporary directory, to install small packages into and load them.
+	"""
+	def __init__(self, root):
+		self.packages_dir = join(root, 'packages')
+		self.logger = Logger()
+		self.compile_conf = SimpleNamespace(PACKAGE_DIR=join(root, 'imports'), TMP_DIR=join(root, 'tmp'),
+			code_dir=root)
+		self.names = set()
+		for pth in (self.packages_dir, self.compile_conf.PACKAGE_DIR, self.compile_conf.TMP_DIR):
+			makedirs(pth, exist_ok=True)
+
+	def write(self, name, version, files):
+		for relpth, content in files.items():
+			pth = join(self.packages_dir, name, version, *relpth.split('/'))
+			makedirs(dirname(pth), exist_ok=True)
+			with open(pth, 'w+') as fh:
+				fh.write(content)
+
+	def install(self, name, version, files=None, **conf):
+		"""
+		Write a package version with the given files (relative path to text) and config.json entries.
+		"""
+		self.names.add(name)
+		conf = dict({'name': name, 'version': version, 'license': 'MIT'}, **conf)
+		self.write(name, version, dict({'__init__.py': '', 'config.json': dumps(conf)}, **(files or {})))
+		return join(self.packages_dir, name, version)
+
+	def package(self, name, version='==*', **kwargs):
+		from notexp.package import Package
+		return Package(name, version, None, self.logger, None, self.compile_conf, packages_dir=self.packages_dir,
+			**kwargs)
+
+	def package_list(self, packages=(), **kwargs):
+		from notexp.packages import PackageList
+		package_list = PackageList([], self.logger, None, self.compile_conf, None, **kwargs)
+		for package in packages:
+			package.packages = package_list
+		package_list.add_packages(packages)
+		return package_list
+
+	def resource(self, cls, local_path, content, **kwargs):
+		"""
+		Write a file to the static directory and make a resource of type `cls` for it.
+		"""
+		static_dir = join(self.compile_conf.code_dir, 'static')
+		makedirs(dirname(join(static_dir, local_path)), exist_ok=True)
+		with open(join(static_dir, local_path), 'w+') as fh:
+			fh.write(content)
+		return cls(logger=self.logger, cache=None, compile_conf=self.compile_conf, group_name='demo',
+			resource_dir=static_dir, local_path=local_path, **kwargs)
+
+	def loaded_modules(self, name):
+		return sorted(module for module in modules if module == name or module.startswith(name + '.'))
+
+
+@fixture
+def package_env(tmpdir, monkeypatch):
+	"""
+	Packages installed here are importable (from the import dir); their modules are forgotten after the test.
+	"""
+	monkeypatch.setenv('NOTEX_CACHE_DIR', str(tmpdir.mkdir('cache')))
+	monkeypatch.setattr('notexp.content_cache._CACHES', {})
+	env = PackageEnv(str(tmpdir))
+	monkeypatch.syspath_prepend(env.compile_conf.PACKAGE_DIR)
+	yield env
+	for name in env.names:
+		for module in env.loaded_modules(name):
+			del modules[module]
@@ -0,0 +1,57 @@
+
+from os import listdir, utime
+from os.path import join, isfile
+from zipfile import ZipFile
+from pytest import raises
+from notexp.archive import archive_hash, select_members, extract_members
+from notexp.utils import InvalidPackageConfigError
+
+
+NAMES = ['stuff-v1/', 'stuff-v1/dist/floep/stuff.js', 'stuff-v1/dist/floep/stuff.css', 'stuff-v1/src/big.js',
+	'stuff-v1/docs/index.html']
+
+
+def test_select_members():
+	assert select_members(NAMES, ['stuff-v1/dist/floep/stuff.js']) == ['stuff-v1/dist/floep/stuff.js']
+	assert select_members(NAMES, ['stuff-v1/dist/']) == ['stuff-v1/dist/floep/stuff.css',
+		'stuff-v1/dist/floep/stuff.js']
+	with raises(InvalidPackageConfigError) as err:
+		select_members(NAMES, ['stuff-v1/dist', 'stuff-v1/dis', 'stuff-v1/src/small.js'])
+	assert '"stuff-v1/dis", "stuff-v1/src/small.js"' in str(err.value)
+
+
+def test_extract_missing_member(tmpdir):
+	archive = join(str(tmpdir), 'stuff.zip')
+	with ZipFile(archive, 'w') as zh:
+		zh.writestr('stuff-v1/dist/stuff.js', 'x')
+	with raises(InvalidPackageConfigError) as err:
+		extract_members(archive, ['stuff-v1/dist/stuff.css'], cache_dir=join(str(tmpdir), 'cache'))
+	assert archive in str(err.value) and 'stuff-v1/dist/stuff.css' in str(err.value)
+
+
+def test_extract_selected(tmpdir):
+	archive = join(str(tmpdir), 'stuff.zip')
+	with ZipFile(archive, 'w') as zh:
+		for name in NAMES[1:]:
+			zh.writestr(name, name * 10)
+	dest = extract_members(archive, ['stuff-v1/dist/floep/stuff.js'], cache_dir=join(str(tmpdir), 'cache'))
+	assert isfile(join(dest, 'stuff-v1/dist/floep/stuff.js'))
+	assert listdir(join(dest, 'stuff-v1')) == ['dist']
+	assert extract_members(archive, ['stuff-v1/docs'], cache_dir=join(str(tmpdir), 'cache')) == dest
+	assert sorted(listdir(join(dest, 'stuff-v1'))) == ['dist', 'docs']
+
+
+
+
+def test_archive_hash_remembered_between_processes(tmpdir, monkeypatch):
+	archive = join(str(tmpdir), 'stuff.zip')
+	with ZipFile(archive, 'w') as zh:
+		zh.writestr(NAMES[1], 'content')
+	cache_dir = join(str(tmpdir), 'cache')
+	first = archive_hash(archive, cache_dir=cache_dir)
+	# a new process only has the cache directory
+	monkeypatch.setattr('notexp.archive._HASHES', {})
+	monkeypatch.setattr('notexp.archive.hash_file_streaming', lambda pth: 'rehashed')
+	assert archive_hash(archive, cache_dir=cache_dir) == first
+	utime(archive, ns=(0, 10**9))
+	assert archive_hash(archive, cache_dir=cache_dir) == 'rehashed'
@@ -0,0 +1,43 @@
+
+from json import loads
+from notexp.bundle import Bundler, bundle_resources, encode_vlq
+from notexp.resource import StyleResource, ScriptResource
+
+
+def test_encode_vlq():
+	assert [encode_vlq(value) for value in (0, 1, -1, 15, 16, -17, 1000)] == ['A', 'C', 'D', 'e', 'gB', 'jB', 'w+B']
+
+
+def test_mappings_and_charset(package_env):
+	first = package_env.resource(StyleResource, 'styles/a.css', '@charset "utf-8";a{}\nb{}\n')
+	second = package_env.resource(StyleResource, 'styles/b.css', '@charset "utf-8";c{}\n')
+	content, source_map = Bundler([first, second]).build('bundle.css.map')
+	assert content.split('\n') == ['@charset "utf-8";a{}', 'b{}', 'c{}', '/*# sourceMappingURL=bundle.css.map */', '']
+	source_map = loads(source_map)
+	assert source_map['mappings'] == 'AAAA;AACA;ACDA'
+	assert source_map['sources'] == ['../styles/a.css', '../styles/b.css']
+	assert source_map['sourcesContent'][1] == '@charset "utf-8";c{}\n'
+
+
+def test_script_separator(package_env):
+	scripts = [package_env.resource(ScriptResource, name, 'f()') for name in ('a.js', 'b.js')]
+	content, source_map = Bundler(scripts).build('bundle.js.map')
+	assert content.split('\n')[:4] == ['f()', ';', 'f()', ';']
+	assert loads(source_map)['mappings'] == 'AAAA;;ACAA;'
+
+
+def test_consecutive_groups(package_env):
+	resources = [
+		package_env.resource(StyleResource, 'a.css', 'a{}'),
+		package_env.resource(StyleResource, 'b.css', 'b{}'),
+		package_env.resource(ScriptResource, 'x.js', 'x()'),
+		package_env.resource(StyleResource, 'c.css', 'c{background:url(img/c.png)}'),
+		package_env.resource(StyleResource, 'd.css', 'd{background:url("https://example.com/d.png")}'),
+		package_env.resource(StyleResource, 'e.css', 'e{}'),
+		package_env.resource(StyleResource, 'f.css', '@import "g.css";'),
+	]
+	bundled = list(bundle_resources(resources))
+	assert [resource.local_path.split('/')[0] for resource in bundled] == ['bundles', 'x.js', 'c.css', 'bundles',
+		'f.css']
+	assert bundled[0].file_content().split('\n')[:2] == ['a{}', 'b{}']
+	assert bundled[3].notes == ['bundle of d.css, e.css']
@@ -0,0 +1,68 @@
+
+from concurrent.futures import ThreadPoolExecutor
+from os import utime, stat, listdir
+from os.path import join
+from threading import Barrier
+from notexp.content_cache import ContentCache
+
+
+def write(content):
+	def create(pth):
+		with open(pth, 'w+') as fh:
+			fh.write(content)
+	return create
+
+
+def test_create_once(tmpdir):
+	cache = ContentCache('test', cache_dir=str(tmpdir))
+	calls = []
+	def create(pth):
+		calls.append(pth)
+		write('body{}')(pth)
+	first = cache.get_or_create('abc123.css', create)
+	assert cache.get_or_create('abc123.css', create) == first
+	assert len(calls) == 1
+	with open(first) as fh:
+		assert fh.read() == 'body{}'
+	assert cache.get('other.css') is None
+
+
+def test_lru_eviction(tmpdir):
+	cache = ContentCache('test', max_size=25, cache_dir=str(tmpdir))
+	old = cache.get_or_create('aa1', write('x' * 10))
+	used = cache.get_or_create('aa2', write('y' * 10))
+	for k, pth in enumerate((old, used)):
+		utime(pth, ns=(k * 10**9, stat(pth).st_mtime_ns))
+	cache.get_or_create('aa3', write('z' * 10))
+	assert cache.get('aa1') is None
+	assert cache.get('aa2') is not None
+	assert cache.get('aa3') is not None
+
+
+
+
+def test_size_counted_without_rescanning(tmpdir, monkeypatch):
+	cache = ContentCache('test', max_size=1000, cache_dir=str(tmpdir))
+	scans = []
+	scan = cache._scan
+	monkeypatch.setattr(cache, '_scan', lambda: scans.append(1) or scan())
+	for k in range(20):
+		cache.get_or_create('key{0:d}'.format(k), write('x' * 10))
+	assert len(scans) == 1 and cache._size == 200
+	for k in range(20, 120):
+		cache.get_or_create('key{0:d}'.format(k), write('x' * 10))
+	assert 1 < len(scans) < 20
+
+
+def test_concurrent_create_same_key(tmpdir):
+	cache = ContentCache('test', cache_dir=str(tmpdir))
+	barrier = Barrier(8)
+	def create(pth):
+		barrier.wait()
+		write('a{color:red}' * 1000)(pth)
+	with ThreadPoolExecutor(max_workers=8) as pool:
+		paths = list(pool.map(lambda _: cache.get_or_create('samekey.css', create), range(8)))
+	assert len(set(paths)) == 1
+	with open(paths[0]) as fh:
+		assert fh.read() == 'a{color:red}' * 1000
+	assert listdir(join(cache.dir, 'sa')) == ['samekey.css']
@@ -0,0 +1,136 @@
+
+from os import utime, stat
+from os.path import join
+from stat import S_IMODE
+from threading import Thread
+from time import sleep
+from notexp.daemon import CompileDaemon, send_request
+
+
+TAGS_MODULE = ('from notexp.bases import TagHandler\n\n\nclass Tag(TagHandler):\n\tdef __call__(self, element, '
+	'**kwargs):\n\t\treturn {0:}\n')
+
+
+def _install(package_env, version, result):
+	return package_env.install('delta', version, files={'code/__init__.py': '', 'code/tags.py':
+		TAGS_MODULE.format(repr(result))}, tags={'t': 'code.tags.Tag'})
+
+
+def _install_named(package_env, name, version, **conf):
+	package_env.install(name, version, files={'code/__init__.py': '', 'code/tags.py': TAGS_MODULE.format(
+		repr(name))}, tags={name: 'code.tags.Tag'}, **conf)
+
+
+def _edit(path, content):
+	"""
+	Change a file in place (which does not change directory modification times), with a newer modification time.
+	"""
+	mtime = stat(path).st_mtime_ns
+	with open(path, 'w') as fh:
+		fh.write(content)
+	utime(path, ns=(mtime + 10 ** 10, mtime + 10 ** 10))
+
+
+def _call_tag(package_list, request):
+	return package_list.get_tag_handlers('t')[0](None)
+
+
+def _daemon(package_env, socket_path=None, requests=(('delta', '==*', None),), **kwargs):
+	return CompileDaemon(socket_path, _call_tag, requests, package_env.logger, None, package_env.compile_conf, None,
+		packages_dir=package_env.packages_dir, **kwargs)
+
+
+def test_reload_new_version(package_env):
+	_install(package_env, '1.0', 'v1')
+	daemon = _daemon(package_env)
+	daemon.load()
+	assert _call_tag(daemon.package_list, None) == 'v1'
+	assert daemon.reload_changed() == []
+	_install(package_env, '2.0', 'v2')
+	assert [package.version for package in daemon.reload_changed()] == ['2.0']
+	assert _call_tag(daemon.package_list, None) == 'v2'
+
+
+def test_reload_keeps_resolved_version(package_env):
+	for name, version, conf in (('base', '1.0', {}), ('widget', '1.0', {'requirements': {'base': '>=1.0'}}),
+			('plugin', '1.0', {'conflicts_with': {'base': '>=2.0'}})):
+		_install_named(package_env, name, version, **conf)
+	daemon = _daemon(package_env, requests=[('widget', '==*', None), ('plugin', '==*', None)])
+	daemon.load()
+	_install_named(package_env, 'base', '2.0')
+	assert daemon.reload_changed() == [], 'plugin conflicts with the newly installed base 2.0'
+	assert {package.name: package.version for package in daemon.package_list.packages} == \
+		{'base': '1.0', 'widget': '1.0', 'plugin': '1.0'}
+
+
+def test_reload_uses_lockfile(package_env, tmpdir):
+	lockfile = str(tmpdir.join('packages.lock'))
+	_install(package_env, '1.0', 'v1')
+	daemon = _daemon(package_env, lockfile=lockfile)
+	daemon.load()
+	_install(package_env, '2.0', 'v2')
+	assert daemon.reload_changed() == []
+	assert _call_tag(daemon.package_list, None) == 'v1'
+
+
+def test_reload_edited_code(package_env):
+	path = _install(package_env, '1.0', 'v1')
+	daemon = _daemon(package_env)
+	daemon.load()
+	_edit(join(path, 'code', 'tags.py'), TAGS_MODULE.format(repr('v1 edited')))
+	assert len(daemon.reload_changed()) == 1
+	assert _call_tag(daemon.package_list, None) == 'v1 edited'
+	assert daemon.reload_changed() == []
+
+
+def test_reload_edited_config(package_env):
+	path = _install(package_env, '1.0', 'v1')
+	package_env.write('delta', '1.0', {'code/other.py': TAGS_MODULE.format(repr('other'))})
+	daemon = _daemon(package_env)
+	daemon.load()
+	with open(join(path, 'config.json'), 'r') as fh:
+		config = fh.read()
+	_edit(join(path, 'config.json'), config.replace('code.tags.Tag', 'code.other.Tag'))
+	assert len(daemon.reload_changed()) == 1
+	assert _call_tag(daemon.package_list, None) == 'other'
+
+
+def test_edited_resource_keeps_package(package_env):
+	path = _install(package_env, '1.0', 'v1')
+	package_env.write('delta', '1.0', {'readme.txt': 'hello'})
+	daemon = _daemon(package_env)
+	daemon.load()
+	_edit(join(path, 'readme.txt'), 'changed')
+	assert daemon.reload_changed() == []
+
+
+def _request(socket_path, request, attempts=100):
+	for _ in range(attempts):
+		try:
+			return send_request(socket_path, request, timeout=10)
+		except (FileNotFoundError, ConnectionRefusedError):
+			sleep(0.05)
+	raise AssertionError('daemon did not start')
+
+
+def test_requests(package_env, tmpdir):
+	_install(package_env, '1.0', 'v1')
+	socket_path = str(tmpdir.join('daemon.sock'))
+	daemon = _daemon(package_env, socket_path)
+	thread = Thread(target=daemon.serve_forever)
+	thread.start()
+	try:
+		assert _request(socket_path, {'action': 'ping'}) == {'ok': True, 'result': 'pong'}
+		assert S_IMODE(stat(socket_path).st_mode) == 0o600
+		assert _request(socket_path, {'action': 'compile'}) == {'ok': True, 'result': 'v1'}
+		_install(package_env, '2.0', 'v2')
+		response = _request(socket_path, {'action': 'reload'})
+		assert response['ok'] and len(response['result']) == 1
+		assert _request(socket_path, {'action': 'compile'}) == {'ok': True, 'result': 'v2'}
+		daemon.handler = lambda package_list, request: 1 / 0
+		response = _request(socket_path, {'action': 'compile'})
+		assert not response['ok'] and 'ZeroDivisionError' in response['traceback']
+	finally:
+		assert _request(socket_path, {'action': 'stop'})['ok']
+		thread.join(10)
+	assert not thread.is_alive()
@@ -0,0 +1,96 @@
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+from pytest import fixture, raises
+from notexp.download import Downloader
+from notexp.utils import DownloadError, ResourceProcessingError
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+	"""
+	Local stand-in for a CDN: serves fixed content with an ETag, and fails the first request to /flaky.js.
+	"""
+	protocol_version = 'HTTP/1.1'
+	files = {'/lib.js': b'var lib = 1;', '/style.css': b'body { margin: 0; }', '/flaky.js': b'var flaky = 1;'}
+
+	def do_GET(self):
+		self.server.requests.append((self.path, self.headers.get('If-None-Match', None)))
+		self.server.connections.add(self.client_address)
+		if self.path == '/flaky.js' and not self.server.failed:
+			self.server.failed = True
+			return self.reply(503, b'')
+		if self.path not in self.files:
+			return self.reply(404, b'')
+		etag = '"{0:d}"'.format(hash(self.files[self.path]))
+		if self.headers.get('If-None-Match', None) == etag:
+			return self.reply(304, b'')
+		self.reply(200, self.files[self.path], etag=etag)
+
+	def reply(self, status, body, etag=None):
+		self.send_response(status)
+		if etag:
+			self.send_header('ETag', etag)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+@fixture
+def server():
+	httpd = HTTPServer(('127.0.0.1', 0), StandInHandler)
+	httpd.requests, httpd.connections, httpd.failed = [], set(), False
+	thread = Thread(target=httpd.serve_forever, daemon=True)
+	thread.start()
+	yield httpd
+	httpd.shutdown()
+	httpd.server_close()
+
+
+def url(server, path):
+	return 'http://127.0.0.1:{0:d}{1:s}'.format(server.server_address[1], path)
+
+
+def test_fetch_all_reuses_connections(server, tmpdir):
+	downloader = Downloader(str(tmpdir), per_host=1, backoff=0.01, max_age=0)
+	urls = [url(server, pth) for pth in ('/lib.js', '/style.css', '/flaky.js')]
+	paths, errors = downloader.fetch_all(urls)
+	assert not errors
+	with open(paths[urls[0]], 'rb') as fh:
+		assert fh.read() == b'var lib = 1;'
+	assert len(server.requests) == 4, 'one retry expected'
+	assert len(server.connections) <= 2, 'connection should be reused except after the failure'
+
+
+def test_revalidate_with_etag(server, tmpdir):
+	downloader = Downloader(str(tmpdir), max_age=0)
+	first = downloader.fetch(url(server, '/lib.js'))
+	assert downloader.fetch(url(server, '/lib.js')) == first
+	assert server.requests[-1][1] is not None, 'second request should be conditional'
+	assert Downloader(str(tmpdir), max_age=3600).fetch(url(server, '/lib.js')) == first
+	assert len(server.requests) == 2, 'fresh copies should not be revalidated'
+
+
+def test_missing(server, tmpdir):
+	downloader = Downloader(str(tmpdir), backoff=0.01)
+	with raises(DownloadError):
+		downloader.fetch(url(server, '/missing.js'))
+	paths, errors = downloader.fetch_all([url(server, '/missing.js')])
+	assert list(errors.keys()) == [url(server, '/missing.js')]
+
+
+
+
+def test_package_list_fails_fast(server, package_env):
+	package_env.install('alpha', '1.0', scripts=[url(server, '/lib.js'), url(server, '/missing.js')])
+	downloader = Downloader(str(package_env.compile_conf.TMP_DIR), backoff=0.01, retries=2)
+	package_list = package_env.package_list([package_env.package('alpha')], downloader=downloader)
+	scripts = package_list.packages[0].scripts
+	with raises(ResourceProcessingError) as err:
+		list(package_list.yield_scripts(offline=True))
+	assert [resource for resource, _ in err.value.failures] == [scripts[1]]
+	assert isinstance(err.value.failures[0][1], DownloadError)
+	assert sorted(pth for pth, etag in server.requests) == ['/lib.js', '/missing.js'], 'no second attempt expected'
+	assert scripts[0].local_path is not None
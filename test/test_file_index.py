@@ -0,0 +1,44 @@
+
+from glob import glob
+from os import makedirs
+from os.path import join, relpath
+from time import sleep
+from notexp.file_index import DirectoryIndex, get_directory_index
+
+
+def make_tree(root):
+	for name in ('style.css', 'script.js', 'template.html', '.hidden.css', 'static/a.png', 'static/b.txt',
+			'static/deep/c.css', 'tjielp/x.js', 'tjielp/y.js'):
+		makedirs(join(root, name.rpartition('/')[0]), exist_ok=True)
+		open(join(root, name), 'w+').close()
+
+
+def test_glob_like_stdlib(tmpdir):
+	root = str(tmpdir)
+	make_tree(root)
+	index = DirectoryIndex(root)
+	for pattern in ('static/*', '*.css', '*.js', '*.html', 'tjielp/*.js', 'style.css', 'missing.css', 's*/?.png',
+			'[st]*.js'):
+		assert index.glob(pattern) == sorted(relpath(pth, root) for pth in glob(join(root, pattern))), pattern
+
+
+def test_recursive_glob(tmpdir):
+	root = str(tmpdir)
+	make_tree(root)
+	index = DirectoryIndex(root)
+	assert index.glob('**/*.css') == ['static/deep/c.css', 'style.css']
+	assert index.glob('static/**') == ['static/a.png', 'static/b.txt', 'static/deep', 'static/deep/c.css']
+
+
+def test_exists_and_invalidation(tmpdir):
+	root = str(tmpdir)
+	make_tree(root)
+	index = get_directory_index(root)
+	assert index.isfile('static/a.png') and index.exists('./static') and not index.isfile('static')
+	assert get_directory_index(root) is index
+	sleep(0.01)
+	open(join(root, 'static', 'deep', 'new.css'), 'w+').close()
+	assert not index.is_valid()
+	assert get_directory_index(root).isfile('static/deep/new.css')
+
+
@@ -0,0 +1,64 @@
+
+from json import loads
+from os import environ, pathsep
+from subprocess import run, PIPE
+from sys import executable, path
+from pytest import mark
+
+
+HEAVY_MODULES = ('lxml', 'notex_pkgs', 'css_html_js_minify', 'json_tricks', 'package_versions')
+# only imported where they are used: minifiers, network, zip and memory map modules
+DEFERRED_MODULES = ('csscompressor', 'jsmin', 'http', 'urllib.request', 'socket', 'ssl', 'zipfile', 'gzip', 'mmap')
+# the number of modules importing notexp.packages may add to those loaded at interpreter startup
+IMPORT_COUNT_BUDGET = int(environ.get('NOTEX_IMPORT_COUNT_BUDGET', 150))
+
+
+def _run_python(code):
+	env = dict(environ, PYTHONPATH=pathsep.join(pth for pth in path if pth))
+	proc = run([executable, '-X', 'importtime', '-c', code], stdout=PIPE, stderr=PIPE, universal_newlines=True,
+		env=env)
+	assert proc.returncode == 0, 'running "{0:s}" failed:\n{1:s}'.format(code, proc.stderr)
+	return proc
+
+
+def import_times(module):
+	"""
+	Import `module` in a fresh interpreter with `-X importtime`, returning {module: (self us, cumulative us)}.
+	"""
+	proc = _run_python('import {0:s}'.format(module) if module else 'pass')
+	times = {}
+	for line in proc.stderr.splitlines():
+		if not line.startswith('import time:') or '[us]' in line:
+			continue
+		self_us, cumulative_us, name = line[len('import time:'):].split('|')
+		times[name.strip()] = (int(self_us), int(cumulative_us))
+	return times
+
+
+def loaded_modules(module):
+	"""
+	Import `module` in a fresh interpreter and return the names in its `sys.modules` afterwards.
+	"""
+	proc = _run_python('import json, sys, {0:s}; print(json.dumps(sorted(sys.modules)))'.format(module))
+	return loads(proc.stdout)
+
+
+@mark.parametrize('module', ['notexp.license', 'notexp.utils', 'notexp.resource', 'notexp.package',
+	'notexp.packages'])
+def test_no_heavy_imports(module):
+	times = import_times(module)
+	heavy = sorted(name for name in times if name.split('.')[0] in HEAVY_MODULES)
+	assert not heavy, 'importing {0:s} should not import {1:s}'.format(module, ', '.join(heavy))
+
+
+@mark.parametrize('module', ['notexp', 'notexp.package', 'notexp.packages'])
+def test_no_deferred_imports(module):
+	deferred = sorted(name for name in loaded_modules(module) if any(name == prefix or name.startswith(prefix + '.')
+		for prefix in DEFERRED_MODULES))
+	assert not deferred, 'importing {0:s} should not import {1:s}'.format(module, ', '.join(deferred))
+
+
+def test_import_count_budget():
+	added = sorted(set(import_times('notexp.packages')) - set(import_times('')))
+	assert len(added) <= IMPORT_COUNT_BUDGET, 'importing notexp.packages imported {0:d} modules (budget {1:d}): ' \
+		'{2:s}'.format(len(added), IMPORT_COUNT_BUDGET, ', '.join(added))
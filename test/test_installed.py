@@ -0,0 +1,33 @@
+
+from os import makedirs
+from os.path import join
+from shutil import rmtree
+from notexp.installed import InstalledIndex
+
+
+def test_index_versions(tmpdir):
+	root = str(tmpdir)
+	makedirs(join(root, 'demo', '1.0'))
+	makedirs(join(root, 'demo', '1.2'))
+	index = InstalledIndex(root)
+	assert index.get_versions('demo') == ['1.0', '1.2']
+	assert index.get_versions('DEMO') == ['1.0', '1.2']
+	assert index.get_versions('absent') is None
+	assert InstalledIndex(root).packages == index.packages, 'index should be read from disk'
+
+
+def test_index_install_remove(tmpdir):
+	root = str(tmpdir)
+	makedirs(join(root, 'demo', '1.0'))
+	index = InstalledIndex(root)
+	assert index.get_versions('demo') == ['1.0']
+	makedirs(join(root, 'demo', '2.0'))
+	index.add('demo', '2.0')
+	assert index.get_versions('demo') == ['1.0', '2.0']
+	rmtree(join(root, 'demo', '1.0'))
+	index.remove('demo', '1.0')
+	assert InstalledIndex(root).get_versions('demo') == ['2.0']
+	makedirs(join(root, 'other', '0.1'))
+	assert index.names() == ['demo', 'other']
+
+
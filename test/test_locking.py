@@ -0,0 +1,57 @@
+
+from multiprocessing import Process
+from os import makedirs, symlink, readlink
+from os.path import join, isdir
+from pytest import mark
+from notexp.locking import flock, file_lock, publish, create_atomic, create_once, write_atomic
+
+
+def _increment(pth, times):
+	for k in range(times):
+		with file_lock(pth + '.lock'):
+			with open(pth, 'r') as fh:
+				value = int(fh.read())
+			with open(pth, 'w') as fh:
+				fh.write(str(value + 1))
+
+
+@mark.skipif(flock is None, reason='file locks need fcntl')
+def test_file_lock_excludes_processes(tmpdir):
+	pth = join(str(tmpdir), 'counter')
+	write_atomic(pth, '0')
+	procs = [Process(target=_increment, args=(pth, 50)) for k in range(4)]
+	for proc in procs:
+		proc.start()
+	for proc in procs:
+		proc.join()
+	with open(pth, 'r') as fh:
+		assert fh.read() == '200'
+
+
+def test_publish_replaces_directories_and_links(tmpdir):
+	root = str(tmpdir)
+	makedirs(join(root, 'old', 'sub'))
+	makedirs(join(root, 'new'))
+	publish(join(root, 'new'), join(root, 'old'))
+	assert isdir(join(root, 'old')) and not isdir(join(root, 'old', 'sub'))
+	symlink(join(root, 'a'), join(root, 'link'))
+	create_atomic(join(root, 'link'), lambda tmp_pth: symlink(join(root, 'b'), tmp_pth))
+	assert readlink(join(root, 'link')) == join(root, 'b')
+	assert sorted(pth.basename for pth in tmpdir.listdir()) == ['link', 'old'], 'no temporary files should remain'
+
+
+def test_create_once(tmpdir):
+	pth = join(str(tmpdir), 'file')
+	create_once(pth, lambda tmp_pth: write_atomic(tmp_pth, 'first'))
+	create_once(pth, lambda tmp_pth: write_atomic(tmp_pth, 'second'))
+	with open(pth, 'r') as fh:
+		assert fh.read() == 'first'
+	def fail(tmp_pth):
+		write_atomic(tmp_pth, 'partial')
+		raise ValueError('failed')
+	try:
+		create_atomic(pth, fail)
+	except ValueError:
+		pass
+	with open(pth, 'r') as fh:
+		assert fh.read() == 'first', 'a failed creation should not replace the file'
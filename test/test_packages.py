@@ -0,0 +1,121 @@
+
+from functools import partial
+from sys import modules
+from threading import Barrier
+from time import sleep
+from pytest import raises
+from notexp.package import LazyAction
+from notexp.utils import DependencyError, InvalidPackageConfigError, PackageLoadError
+
+
+TAGS_MODULE = '''
+from notexp.bases import TagHandler
+
+
+class Tag(TagHandler):
+	final_handler = {final}
+	_secret = 'hidden'
+'''
+
+
+def _install_tagged(package_env, name, final=False, **conf):
+	package_env.install(name, '1.0', files={'code/__init__.py': '', 'code/tags.py': TAGS_MODULE.format(final=final)},
+		tags={'t': 'code.tags.Tag', 'tee': 'code.tags.Tag'}, **conf)
+
+
+def test_lazy_actions_not_imported_before_dispatch(package_env):
+	_install_tagged(package_env, 'alpha', final=True)
+	_install_tagged(package_env, 'beta')
+	packages = [package_env.package('alpha', lazy_actions=True), package_env.package('beta', lazy_actions=True)]
+	package_list = package_env.package_list(packages)
+	tags = package_list.get_tags()
+	assert 't' in tags and len(tags['alpha-t']) == 1
+	assert package_env.loaded_modules('alpha.code') == [] and package_env.loaded_modules('beta.code') == []
+	handlers = package_list.get_tag_handlers('t')
+	assert len(handlers) == 1 and handlers[0] is packages[0].tags['t']
+	assert package_env.loaded_modules('alpha.code') == ['alpha.code', 'alpha.code.tags']
+	assert package_env.loaded_modules('beta.code') == []
+
+
+def test_lazy_action_aliases(package_env):
+	_install_tagged(package_env, 'alpha')
+	package = package_env.package('alpha', lazy_actions=True)
+	package_list = package_env.package_list([package])
+	assert package.tags['t'] is package.tags['tee']
+	assert package_list.get_tag_handlers('t')[0] is package_list.get_tag_handlers('alpha-tee')[0]
+	action = package.tags['t'].resolve()
+	assert package.tags['tee'].resolve() is action
+	assert type(action).__module__ == 'alpha.code.tags' and action.final_handler is False
+
+
+def test_final_handler_blocks_later_handlers(package_env):
+	_install_tagged(package_env, 'alpha')
+	_install_tagged(package_env, 'beta', final=True)
+	_install_tagged(package_env, 'gamma')
+	packages = [package_env.package(name) for name in ('alpha', 'beta', 'gamma')]
+	package_list = package_env.package_list(packages)
+	assert package_list.get_tag_handlers('t') == (packages[0].tags['t'], packages[1].tags['t'])
+	assert package_list.get_tag_handlers('gamma-t') == (packages[2].tags['t'],)
+
+
+def test_lazy_action_type_checks(package_env):
+	_install_tagged(package_env, 'alpha')
+	package = package_env.package('alpha', lazy_actions=True)
+	package_env.package_list([package])
+	lazy = package.tags['t']
+	assert isinstance(lazy, LazyAction) and package_env.loaded_modules('alpha.code') == []
+	from notexp.bases import TagHandler
+	assert isinstance(lazy, TagHandler)
+	assert isinstance(lazy, modules['alpha.code.tags'].Tag) and lazy.__class__ is type(lazy.resolve())
+
+
+def test_lazy_action_private_attributes(package_env):
+	_install_tagged(package_env, 'alpha')
+	package = package_env.package('alpha', lazy_actions=True)
+	package_env.package_list([package])
+	lazy = package.tags['t']
+	assert lazy._secret == 'hidden'
+	with raises(AttributeError):
+		lazy._missing
+
+
+def test_failed_add_is_rolled_back(package_env):
+	_install_tagged(package_env, 'alpha')
+	_install_tagged(package_env, 'beta')
+	_install_tagged(package_env, 'gamma', conflicts_with={'alpha': '==*'})
+	package_list = package_env.package_list([package_env.package('alpha')])
+	with raises(DependencyError):
+		package_list.add_packages([package_env.package('beta'), package_env.package('gamma')])
+	assert [package.name for package in package_list.packages] == ['alpha']
+	assert 'beta-t' not in package_list.get_tags()
+
+
+def test_single_failure_keeps_error_type(package_env):
+	package_env.install('alpha', '1.0')
+	with raises(InvalidPackageConfigError):
+		package_env.package_list([package_env.package('alpha')])
+
+
+def test_several_failures_collected(package_env):
+	_install_tagged(package_env, 'alpha', requirements={'missing': '==*'})
+	_install_tagged(package_env, 'beta', requirements={'absent': '==*'})
+	with raises(PackageLoadError) as err:
+		package_env.package_list([package_env.package('alpha'), package_env.package('beta')])
+	assert [type(failure) for _, failure in err.value.failures] == [DependencyError, DependencyError]
+
+
+def test_resources_processed_concurrently_in_order(package_env):
+	package_env.install('alpha', '1.0', files={'styles/s{0:d}.css'.format(k): 'a{}' for k in range(6)},
+		styles=['styles/*.css'])
+	package_list = package_env.package_list([package_env.package('alpha')], workers=3)
+	styles = package_list.packages[0].styles
+	barrier, finished = Barrier(3, timeout=5), []
+	def slow_minify(position):
+		if position < 3:
+			barrier.wait()  # the first three only get past this when they run at the same time
+		sleep(0.05 * (len(styles) - position))
+		finished.append(position)
+	for position, style in enumerate(styles):
+		style.minify = partial(slow_minify, position)
+	assert list(package_list.yield_styles(minify=True)) == styles
+	assert finished != sorted(finished)
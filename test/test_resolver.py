@@ -0,0 +1,80 @@
+
+from json import dumps
+from os import makedirs
+from os.path import join
+from pytest import raises
+from notexp.resolver import Resolver, resolve_versions, read_lockfile, version_matches
+from notexp.utils import DependencyError
+
+
+def _install(root, name, version, requirements=None, conflicts_with=None):
+	makedirs(join(root, name, version))
+	with open(join(root, name, version, 'config.json'), 'w+') as fh:
+		fh.write(dumps({'name': name, 'version': version, 'license': 'MIT', 'requirements': requirements or {},
+			'conflicts_with': conflicts_with or {}}))
+
+
+def _versions(resolved):
+	return [(item.name, item.version) for item in resolved]
+
+
+def test_version_matches():
+	assert version_matches('1.2', '>=1.0,<2.0')
+	assert not version_matches('2.0', '>=1.0,<2.0')
+	assert version_matches('3.1', '==*')
+
+
+def test_resolve_requirements_first(tmpdir, monkeypatch):
+	monkeypatch.setenv('NOTEX_CACHE_DIR', str(tmpdir.mkdir('cache')))
+	root = str(tmpdir.mkdir('packages'))
+	_install(root, 'base', '1.0')
+	_install(root, 'base', '2.0')
+	_install(root, 'theme', '1.0', requirements={'base': '<2.0'})
+	resolved = Resolver(root).resolve([('theme', '==*', {'dark': True})])
+	assert _versions(resolved) == [('base', '1.0'), ('theme', '1.0')]
+	assert resolved[1].options == {'dark': True} and resolved[0].version_request == '<2.0'
+
+
+def test_resolve_backtracks(tmpdir, monkeypatch):
+	monkeypatch.setenv('NOTEX_CACHE_DIR', str(tmpdir.mkdir('cache')))
+	root = str(tmpdir.mkdir('packages'))
+	_install(root, 'base', '1.0')
+	_install(root, 'base', '2.0')
+	# the newest widget needs base 2, which the plugin conflicts with, so an older widget has to be chosen
+	_install(root, 'widget', '1.0', requirements={'base': '>=1.0'})
+	_install(root, 'widget', '2.0', requirements={'base': '>=2.0'})
+	_install(root, 'plugin', '1.0', conflicts_with={'base': '>=2.0'})
+	resolved = Resolver(root).resolve([('plugin', '==*', None), ('widget', '==*', None)])
+	assert sorted(_versions(resolved)) == [('base', '1.0'), ('plugin', '1.0'), ('widget', '1.0')]
+
+
+def test_resolve_impossible(tmpdir, monkeypatch):
+	monkeypatch.setenv('NOTEX_CACHE_DIR', str(tmpdir.mkdir('cache')))
+	root = str(tmpdir.mkdir('packages'))
+	_install(root, 'base', '1.0')
+	_install(root, 'theme', '1.0', requirements={'base': '>=2.0'})
+	with raises(DependencyError) as err:
+		Resolver(root).resolve([('theme', '==*', None)])
+	assert 'base' in str(err.value)
+	with raises(DependencyError):
+		Resolver(root).resolve([('absent', '==*', None)])
+
+
+def test_lockfile(tmpdir, monkeypatch):
+	monkeypatch.setenv('NOTEX_CACHE_DIR', str(tmpdir.mkdir('cache')))
+	root = str(tmpdir.mkdir('packages'))
+	lockfile = join(str(tmpdir), 'packages.lock')
+	_install(root, 'base', '1.0')
+	_install(root, 'theme', '1.0', requirements={'base': '==*'})
+	requests = [('theme', '>=1.0', None)]
+	resolved = resolve_versions(requests, packages_dir=root, lockfile=lockfile)
+	assert read_lockfile(lockfile, requests, root) == resolved
+	assert read_lockfile(lockfile, [('theme', '>=0.5', None)], root) is None, 'other requests need resolving'
+	_install(root, 'base', '2.0')
+	assert _versions(resolve_versions(requests, packages_dir=root, lockfile=lockfile)) == \
+		[('base', '1.0'), ('theme', '1.0')], 'a valid lockfile keeps the locked versions'
+	with open(join(root, 'theme', '1.0', 'config.json'), 'w+') as fh:
+		fh.write(dumps({'name': 'theme', 'version': '1.0', 'license': 'MIT', 'requirements': {'base': '>=2.0'}}))
+	assert read_lockfile(lockfile, requests, root) is None, 'a changed config invalidates the lockfile'
+	assert _versions(resolve_versions(requests, packages_dir=root, lockfile=lockfile)) == \
+		[('base', '2.0'), ('theme', '1.0')]
@@ -0,0 +1,121 @@
+
+from gzip import decompress
+from json import load
+from os import listdir, stat, utime, remove
+from os.path import join, isfile
+from notexp.resource import StyleResource, InternalizePolicy, write_asset_manifest
+
+
+CSS = 'a { background: url(img/x.png); }\n' * 20
+
+
+def _style_with_image(package_env):
+	package_env.resource(StyleResource, 'styles/img/x.png', 'not really a png')
+	return package_env.resource(StyleResource, 'styles/main.css', CSS,
+		copy_map={None: 'styles/main.css', 'styles/img/x.png': 'styles/img/x.png'})
+
+
+def test_fingerprint_main_file_only(package_env, tmpdir):
+	out = str(tmpdir.mkdir('out'))
+	style = _style_with_image(package_env)
+	style.copy(out, fingerprint=True)
+	fingerprinted = style.fingerprinted_path
+	assert fingerprinted.startswith('styles/main.') and fingerprinted.endswith('.css') and len(fingerprinted) > 20
+	assert style.relative_path == fingerprinted and fingerprinted in style.html
+	assert style.fingerprints == {'styles/main.css': fingerprinted}
+	with open(join(out, fingerprinted)) as fh:
+		assert fh.read() == CSS
+	assert isfile(join(out, 'styles', 'img', 'x.png')) and not isfile(join(out, 'styles', 'main.css'))
+	write_asset_manifest([style, None], join(out, 'assets.json'))
+	with open(join(out, 'assets.json')) as fh:
+		assert load(fh) == {'styles/main.css': fingerprinted}
+
+
+def test_fingerprint_with_gzip(package_env, tmpdir):
+	out = str(tmpdir.mkdir('out'))
+	style = _style_with_image(package_env)
+	style.copy(out, fingerprint=True, gzip_level=6, gzip_min_size=1)
+	assert sorted(listdir(join(out, 'styles'))) == sorted(['img', style.fingerprinted_path.split('/')[-1],
+		style.fingerprinted_path.split('/')[-1] + '.gz'])
+	with open(join(out, style.fingerprinted_path + '.gz'), 'rb') as fh:
+		assert decompress(fh.read()).decode('utf-8') == CSS
+
+
+def test_gzip_only_configured_extensions(package_env, tmpdir):
+	out = str(tmpdir.mkdir('out'))
+	style = _style_with_image(package_env)
+	style.copy(out, gzip_level=9, gzip_min_size=1)
+	assert isfile(join(out, 'styles', 'main.css.gz'))
+	assert listdir(join(out, 'styles', 'img')) == ['x.png']
+	with open(join(out, 'styles', 'main.css.gz'), 'rb') as fh:
+		assert decompress(fh.read()).decode('utf-8') == CSS
+	small = package_env.resource(StyleResource, 'small.css', 'a{}')
+	small.copy(out, gzip_level=9)
+	assert isfile(join(out, 'small.css')) and not isfile(join(out, 'small.css.gz'))
+
+
+def test_gzip_skipped_when_unchanged(package_env, tmpdir):
+	out = str(tmpdir.mkdir('out'))
+	style = package_env.resource(StyleResource, 'main.css', CSS)
+	style.copy(out, gzip_level=6, gzip_min_size=1)
+	gzpth = join(out, 'main.css.gz')
+	before = stat(gzpth)
+	style.copy(out, gzip_level=6, gzip_min_size=1)
+	after = stat(gzpth)
+	assert (before.st_ino, before.st_mtime_ns) == (after.st_ino, after.st_mtime_ns)
+	with open(style.full_file_path, 'w') as fh:
+		fh.write(CSS * 2)
+	utime(style.full_file_path, ns=(after.st_mtime_ns + 10**9, after.st_mtime_ns + 10**9))
+	style.copy(out, gzip_level=6, gzip_min_size=1)
+	with open(gzpth, 'rb') as fh:
+		assert decompress(fh.read()).decode('utf-8') == CSS * 2
+
+
+def test_internalize_budget(package_env):
+	styles = [package_env.resource(StyleResource, '{0:d}.css'.format(k), 'a{}' * 10) for k in range(4)]
+	big = package_env.resource(StyleResource, 'big.css', 'a{}' * 100)
+	explicit = package_env.resource(StyleResource, 'explicit.css', 'a{}' * 100, internalize=True)
+	chosen = list(InternalizePolicy(max_size=100, budget=70).apply(styles + [big, explicit]))
+	assert [resource.internalize for resource in chosen] == [True, True, False, False, False, True]
+	assert chosen[-1] is explicit
+	assert all(resource.internalize is None for resource in styles + [big])
+	rebuilt = list(InternalizePolicy(max_size=100, budget=70).apply(styles[2:]))
+	assert [resource.internalize for resource in rebuilt] == [True, True]
+
+
+def test_internalize_skips_relative_references(package_env):
+	relative = package_env.resource(StyleResource, 'relative.css', 'a{background:url(img/x.png)}')
+	imported = package_env.resource(StyleResource, 'imported.css', '@import "other.css";')
+	absolute = package_env.resource(StyleResource, 'absolute.css', 'a{background:url("data:image/png;base64,")}')
+	policy = InternalizePolicy()
+	assert [policy.choose(resource).internalize for resource in (relative, imported, absolute)] == \
+		[False, False, True]
+	assert policy.used == absolute.file_size
+
+
+def _upper(inpath, outpath):
+	with open(inpath) as fh, open(outpath, 'w+') as out:
+		out.write(fh.read().upper())
+
+
+def test_evicted_processed_file_is_made_again(package_env, tmpdir):
+	out = str(tmpdir.mkdir('out'))
+	style = package_env.resource(StyleResource, 'styles/a.css', 'a{color:red}')
+	style._do_process(_upper, 'upper')
+	assert style.file_content() == 'A{COLOR:RED}'
+	remove(style.processed_path)
+	assert style.file_content() == 'A{COLOR:RED}' and isfile(style.processed_path)
+	remove(style.processed_path)
+	style.copy(out)
+	with open(join(out, 'styles', 'a.css')) as fh:
+		assert fh.read() == 'A{COLOR:RED}'
+
+
+def test_content_read_again_after_edit(package_env):
+	style = package_env.resource(StyleResource, 'styles/a.css', 'a{}')
+	assert style.file_content() == 'a{}'
+	info = stat(style.full_file_path)
+	with open(style.full_file_path, 'w') as fh:
+		fh.write('b{}')
+	utime(style.full_file_path, ns=(info.st_atime_ns, info.st_mtime_ns + 10 ** 9))
+	assert style.file_content() == 'b{}'
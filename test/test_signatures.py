@@ -0,0 +1,56 @@
+
+from hashlib import sha256
+from os import makedirs
+from os.path import join
+from pytest import importorskip
+from notexp.signatures import hash_file_streaming, hash_files, write_manifest, read_manifest, verify_manifest
+
+
+def make_tree(root):
+	makedirs(join(root, 'sub'))
+	for k, name in enumerate(('a.css', 'b.js', 'sub/c.txt', 'sub/d.bin')):
+		with open(join(root, name), 'wb') as fh:
+			fh.write(bytes(range(256)) * (k * 50 + 1))
+	return ['sub/d.bin', 'a.css', 'sub/c.txt', 'b.js']
+
+
+def test_streaming_hash(tmpdir):
+	pth = join(str(tmpdir), 'data')
+	with open(pth, 'wb') as fh:
+		fh.write(b'notex' * 10000)
+	expected = sha256(b'notex' * 10000).hexdigest()
+	assert hash_file_streaming(pth, chunk_size=7) == expected
+	assert hash_file_streaming(pth, mmap_threshold=1) == expected
+
+
+def test_same_digest_as_hash_file(tmpdir):
+	hash_file = importorskip('compiler.utils').hash_file
+	names = make_tree(str(tmpdir))
+	for name, hash in hash_files(str(tmpdir), names, workers=2).items():
+		assert hash == hash_file(join(str(tmpdir), name))
+	assert hash_file_streaming(join(str(tmpdir), 'sub/d.bin'), mmap_threshold=1) == \
+		hash_file(join(str(tmpdir), 'sub/d.bin'))
+
+
+def test_parallel_hash_order(tmpdir):
+	names = make_tree(str(tmpdir))
+	serial = hash_files(str(tmpdir), names, workers=1)
+	parallel = hash_files(str(tmpdir), names, workers=4)
+	assert list(serial.items()) == list(parallel.items())
+	assert list(parallel.keys()) == sorted(names)
+
+
+def test_manifest_incremental(tmpdir):
+	root = str(tmpdir)
+	names = make_tree(root)
+	write_manifest(root, hash_files(root, names))
+	manifest = read_manifest(root)
+	file_sigs, changed = verify_manifest(root, manifest, names)
+	assert not changed
+	with open(join(root, 'b.js'), 'wb') as fh:
+		fh.write(b'changed')
+	file_sigs, changed = verify_manifest(root, manifest, names[:-1] + ['b.js'])
+	assert changed == ['b.js']
+	assert file_sigs['b.js'] == sha256(b'changed').hexdigest()
+
+
@@ -0,0 +1,50 @@
+
+from os import utime
+from os.path import join
+from notexp.package import LazyAction
+from notexp.snapshot import load_package_list
+
+
+TAGS_MODULE = 'from notexp.bases import TagHandler\n\n\nclass Tag(TagHandler):\n\tpass\n'
+
+
+def _load(package_env):
+	return load_package_list([('alpha', '==*', None)], package_env.logger, None, package_env.compile_conf, None,
+		packages_dir=package_env.packages_dir, snapshot_dir=join(package_env.compile_conf.TMP_DIR, 'snapshots'))
+
+
+def _install(package_env):
+	path = package_env.install('alpha', '1.0', files={'code/__init__.py': '', 'code/tags.py': TAGS_MODULE,
+		'styles/a.css': 'a{}'}, styles=['styles/*.css'], tags={'t': 'code.tags.Tag'})
+	utime(join(path, 'styles'), ns=(0, 0))
+	return path
+
+
+def test_snapshot_round_trip(package_env):
+	_install(package_env)
+	first, second = _load(package_env), _load(package_env)
+	old, new = first.packages[0], second.packages[0]
+	assert not old.restored and new.restored
+	assert (new.name, new.version, new.path, new.signature) == (old.name, old.version, old.path, old.signature)
+	assert [style.local_path for style in new.styles] == ['styles/a.css']
+	assert isinstance(new.tags['t'], LazyAction)
+	assert type(second.get_tag_handlers('t')[0].resolve()).__name__ == 'Tag'
+
+
+def test_snapshot_invalidated_by_new_file(package_env):
+	_install(package_env)
+	_load(package_env)
+	package_env.write('alpha', '1.0', {'styles/b.css': 'b{}'})
+	package = _load(package_env).packages[0]
+	assert not package.restored
+	assert [style.local_path for style in package.styles] == ['styles/a.css', 'styles/b.css']
+	assert _load(package_env).packages[0].restored
+
+
+def test_snapshot_invalidated_by_config(package_env):
+	path = _install(package_env)
+	_load(package_env)
+	package_env.install('alpha', '1.0', styles=['styles/a.css'])
+	utime(join(path, 'config.json'), ns=(0, 10**9))
+	package = _load(package_env).packages[0]
+	assert not package.restored and package.tags == {}
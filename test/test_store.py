@@ -0,0 +1,75 @@
+
+from os import makedirs, stat, utime
+from os.path import join, exists
+from threading import Thread
+from notexp.installed import InstalledIndex
+from notexp.locking import file_lock
+from notexp.signatures import read_manifest, write_manifest, hash_files, hash_file_streaming
+from notexp.store import ContentStore
+
+
+def _make_source(root, files):
+	for relpth, content in files.items():
+		makedirs(join(root, *relpth.split('/')[:-1]), exist_ok=True)
+		with open(join(root, relpth), 'w+') as fh:
+			fh.write(content)
+	return root
+
+
+def test_store_shares_unchanged_files(tmpdir):
+	packages_dir = str(tmpdir.mkdir('packages'))
+	store = ContentStore(packages_dir)
+	src1 = _make_source(str(tmpdir.mkdir('src1')), {'config.json': '{"v": 1}', 'styles/main.css': 'a{}'})
+	src2 = _make_source(str(tmpdir.mkdir('src2')), {'config.json': '{"v": 2}', 'styles/main.css': 'a{}'})
+	pth1 = store.install(src1, 'demo', '1.0')
+	pth2 = store.install(src2, 'demo', '2.0')
+	assert stat(join(pth1, 'styles', 'main.css')).st_ino == stat(join(pth2, 'styles', 'main.css')).st_ino
+	assert stat(join(pth1, 'config.json')).st_ino != stat(join(pth2, 'config.json')).st_ino
+	assert sorted(read_manifest(pth2).keys()) == ['config.json', 'styles/main.css']
+	assert InstalledIndex(packages_dir).get_versions('demo') == ['1.0', '2.0']
+
+
+def test_store_garbage_collection(tmpdir):
+	packages_dir = str(tmpdir.mkdir('packages'))
+	store = ContentStore(packages_dir)
+	src1 = _make_source(str(tmpdir.mkdir('src1')), {'config.json': '{"v": 1}', 'shared.txt': 'same'})
+	src2 = _make_source(str(tmpdir.mkdir('src2')), {'config.json': '{"v": 2}', 'shared.txt': 'same'})
+	store.install(src1, 'demo', '1.0')
+	store.install(src2, 'demo', '2.0')
+	store.uninstall('demo', '1.0')
+	assert store.collect_garbage() == 1
+	with open(join(packages_dir, 'demo', '2.0', 'shared.txt')) as fh:
+		assert fh.read() == 'same'
+	assert InstalledIndex(packages_dir).get_versions('demo') == ['2.0']
+
+
+def test_store_hashes_new_content_despite_manifest(tmpdir):
+	packages_dir = str(tmpdir.mkdir('packages'))
+	store = ContentStore(packages_dir)
+	src = _make_source(str(tmpdir.mkdir('src')), {'config.json': '{"v": 1}', 'data.txt': 'old'})
+	write_manifest(src, hash_files(src, ['config.json', 'data.txt']))
+	stale_hash = read_manifest(src)['data.txt'][2]
+	info = stat(join(src, 'data.txt'))
+	_make_source(src, {'data.txt': 'new'})
+	utime(join(src, 'data.txt'), ns=(info.st_atime_ns, info.st_mtime_ns))
+	pth = store.install(src, 'demo', '1.0')
+	real_hash = hash_file_streaming(join(src, 'data.txt'))
+	assert read_manifest(pth)['data.txt'][2] == real_hash != stale_hash
+	assert exists(store.object_path(real_hash)) and not exists(store.object_path(stale_hash))
+	with open(join(pth, 'data.txt')) as fh:
+		assert fh.read() == 'new'
+
+
+def test_store_garbage_collection_waits_for_lock(tmpdir):
+	packages_dir = str(tmpdir.mkdir('packages'))
+	store = ContentStore(packages_dir)
+	store.install(_make_source(str(tmpdir.mkdir('src')), {'config.json': '{}'}), 'demo', '1.0')
+	store.uninstall('demo', '1.0')
+	results = []
+	with file_lock(store.lock_path):
+		collector = Thread(target=lambda: results.append(store.collect_garbage()))
+		collector.start()
+		collector.join(0.2)
+		assert collector.is_alive() and results == []
+	collector.join(10)
+	assert results == [1]
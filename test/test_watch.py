@@ -0,0 +1,128 @@
+
+from os import utime, stat, listdir
+from os.path import join
+from pytest import raises
+from notexp.utils import DependencyError
+from notexp.watch import Watcher
+
+
+TAGS_MODULE = ('from notexp.bases import TagHandler\n\n\nclass Tag(TagHandler):\n\tdef __call__(self, element, '
+	'**kwargs):\n\t\treturn {0:}\n')
+
+
+def _edit(path, content):
+	"""
+	Change a file, with a newer modification time (so the change is seen even within the timestamp resolution).
+	"""
+	try:
+		mtime = stat(path).st_mtime_ns
+	except FileNotFoundError:
+		mtime = None
+	with open(path, 'w+') as fh:
+		fh.write(content)
+	if mtime is not None:
+		utime(path, ns=(mtime + 10 ** 10, mtime + 10 ** 10))
+
+
+def _setup(package_env, tmpdir, **kwargs):
+	path = package_env.install('echo', '1.0', files={'code/__init__.py': '', 'code/tags.py':
+		TAGS_MODULE.format(repr('v1')), 'styles/a.css': 'a{}'}, styles=['styles/*.css'], tags={'t': 'code.tags.Tag'})
+	package_list = package_env.package_list([package_env.package('echo')])
+	output_dir = str(tmpdir.mkdir('output'))
+	return path, package_list, Watcher(package_list, output_dir=output_dir, **kwargs), output_dir
+
+
+def _call_tag(package_list):
+	return package_list.get_tag_handlers('t')[0](None)
+
+
+def test_no_changes(package_env, tmpdir):
+	path, package_list, watcher, output_dir = _setup(package_env, tmpdir)
+	assert watcher.poll() == ([], [], [])
+
+
+def test_module_reimported(package_env, tmpdir):
+	path, package_list, watcher, output_dir = _setup(package_env, tmpdir)
+	assert _call_tag(package_list) == 'v1'
+	_edit(join(path, 'code', 'tags.py'), TAGS_MODULE.format(repr('v2')))
+	changes = watcher.poll()
+	assert changes.packages == [] and changes.resources == []
+	assert changes.modules == [(package_list.packages[0], 'echo.code.tags')]
+	watcher.apply(changes)
+	assert _call_tag(package_list) == 'v2'
+
+
+def test_package_reloaded_with_modules(package_env, tmpdir):
+	path, package_list, watcher, output_dir = _setup(package_env, tmpdir)
+	old = package_list.packages[0]
+	_edit(join(path, 'styles', 'b.css'), 'b{}')
+	_edit(join(path, 'code', 'tags.py'), TAGS_MODULE.format(repr('v2')))
+	changes = watcher.poll()
+	assert changes.packages == [old] and changes.resources == []
+	assert changes.modules == [(old, 'echo.code.tags')]
+	watcher.apply(changes)
+	assert package_list.packages[0] is not old
+	assert [style.local_path for style in package_list.packages[0].styles] == ['styles/a.css', 'styles/b.css']
+	assert _call_tag(package_list) == 'v2'
+
+
+def test_config_change_reloads(package_env, tmpdir):
+	path, package_list, watcher, output_dir = _setup(package_env, tmpdir)
+	with open(join(path, 'config.json'), 'r') as fh:
+		config = fh.read()
+	_edit(join(path, 'config.json'), config.replace('"t"', '"u"'))
+	changes = watcher.poll()
+	assert changes.packages == package_list.packages and changes.modules == []
+	watcher.apply(changes)
+	assert list(package_list.packages[0].tags.keys()) == ['u']
+
+
+def test_reload_keeps_watched_version(package_env, tmpdir):
+	path, package_list, watcher, output_dir = _setup(package_env, tmpdir)
+	package_env.install('echo', '2.0', files={'code/__init__.py': '', 'code/tags.py': TAGS_MODULE.format(
+		repr('v2'))}, tags={'t': 'code.tags.Tag'})
+	_edit(join(path, 'styles', 'b.css'), 'b{}')
+	watcher.apply(watcher.poll())
+	assert package_list.packages[0].version == '1.0' and _call_tag(package_list) == 'v1'
+
+
+def test_incompatible_reload_keeps_package(package_env, tmpdir):
+	path, package_list, watcher, output_dir = _setup(package_env, tmpdir)
+	package_env.install('other', '1.0', files={'code/__init__.py': '', 'code/tags.py': TAGS_MODULE.format(
+		repr('other'))}, tags={'o': 'code.tags.Tag'})
+	package_list.add_package(package_env.package('other'))
+	old = package_list.packages[0]
+	with open(join(path, 'config.json'), 'r') as fh:
+		config = fh.read()
+	_edit(join(path, 'config.json'), config.replace('"license"', '"conflicts_with": {"other": ">=1.0"}, "license"'))
+	with raises(DependencyError):
+		watcher.apply(watcher.poll())
+	assert package_list.packages[0] is old
+
+
+def test_resource_copied_with_options(package_env, tmpdir):
+	path, package_list, watcher, output_dir = _setup(package_env, tmpdir, fingerprint=True, gzip_level=6,
+		gzip_min_size=0)
+	style = package_list.packages[0].styles[0]
+	style.copy(output_dir, fingerprint=True, gzip_level=6, gzip_min_size=0)
+	old_path = style.relative_path
+	_edit(join(path, 'styles', 'a.css'), 'a{color:red}')
+	changes = watcher.poll()
+	assert changes.packages == [] and changes.modules == [] and changes.resources == [style]
+	watcher.apply(changes)
+	assert style.relative_path != old_path and style.relative_path.startswith('styles/a.')
+	assert style.fingerprints == {'styles/a.css': style.relative_path}
+	with open(join(output_dir, style.relative_path), 'r') as fh:
+		assert fh.read() == 'a{color:red}'
+	assert style.relative_path.split('/')[-1] + '.gz' in listdir(join(output_dir, 'styles'))
+
+
+def test_resource_copied_without_fingerprint(package_env, tmpdir):
+	path, package_list, watcher, output_dir = _setup(package_env, tmpdir)
+	style = package_list.packages[0].styles[0]
+	style.copy(output_dir, fingerprint=True)
+	_edit(join(path, 'styles', 'a.css'), 'a{color:red}')
+	watcher.apply(watcher.poll())
+	assert style.relative_path == 'styles/a.css' and style.fingerprints == {}
+	with open(join(output_dir, 'styles', 'a.css'), 'r') as fh:
+		assert fh.read() == 'a{color:red}'
@@ -0,0 +1,103 @@
+
+from hashlib import sha256
+from importlib import import_module
+from json import dumps
+from os import makedirs, replace
+from os.path import join, isfile
+from sys import modules
+from zipfile import ZipFile
+from notexp.installed import InstalledIndex
+from notexp.signatures import MANIFEST_VERSION
+from notexp.zip_package import PackageArchive, get_package_archive
+
+
+FILES = {
+	'config.json': b'{"name": "demo", "version": "1.0"}',
+	'styles/main.css': b'body { color: red; }',
+	'styles/print.css': b'@media print {}',
+	'code/__init__.py': b'',
+}
+
+
+def _make_archive(pth, files=FILES, manifest=None):
+	with ZipFile(pth, 'w') as archive:
+		for name, content in files.items():
+			archive.writestr(name, content)
+		if manifest is not None:
+			archive.writestr('signatures.json', dumps(manifest))
+	return pth
+
+
+def test_archive_listing(tmpdir):
+	archive = PackageArchive(_make_archive(join(str(tmpdir), '1.0.zip')))
+	assert archive.list_files() == sorted(FILES.keys())
+	assert archive.glob('styles/*.css') == ['styles/main.css', 'styles/print.css']
+	assert archive.glob('**/*.py') == ['code/__init__.py']
+	assert archive.exists('styles') and archive.isfile('./styles/main.css') and not archive.isfile('styles')
+	assert archive.read('styles/main.css') == FILES['styles/main.css']
+	assert archive.size('styles/print.css') == len(FILES['styles/print.css'])
+	try:
+		archive.read('absent.css')
+	except FileNotFoundError:
+		pass
+	else:
+		raise AssertionError('missing members should raise FileNotFoundError')
+
+
+def test_archive_manifest(tmpdir):
+	hashes = {name: sha256(content).hexdigest() for name, content in FILES.items()}
+	manifest = {'version': MANIFEST_VERSION, 'files': {name: [len(content), 0, hashes[name]]
+		for name, content in FILES.items()}}
+	manifest['files']['styles/main.css'][2] = 'outdated'
+	archive = PackageArchive(_make_archive(join(str(tmpdir), '1.0.zip'), manifest=manifest))
+	files = [name for name in archive.list_files() if name != 'signatures.json']
+	file_sigs, changed = archive.verify_manifest(archive.read_manifest(), files)
+	assert changed == [] and file_sigs['styles/main.css'] == 'outdated', 'entries with matching size are trusted'
+	file_sigs, changed = archive.verify_manifest(archive.read_manifest(), files, full_verify=True)
+	assert changed == ['styles/main.css']
+	assert dict(file_sigs) == hashes == dict(archive.hash_members(files, workers=2))
+
+
+def test_archive_extract_and_reopen(tmpdir, monkeypatch):
+	monkeypatch.setenv('NOTEX_CACHE_DIR', str(tmpdir.mkdir('cache')))
+	pth = _make_archive(join(str(tmpdir), '1.0.zip'))
+	archive = get_package_archive(pth)
+	dest = archive.extract(['styles/main.css'])
+	assert isfile(join(dest, 'styles', 'main.css')) and not isfile(join(dest, 'styles', 'print.css'))
+	assert get_package_archive(pth) is archive
+	replace(_make_archive(pth + '.tmp', files={'config.json': b'{}'}), pth)
+	assert get_package_archive(pth) is not archive, 'a changed archive should be reopened'
+	assert archive._mapped.closed, 'the replaced archive should be closed'
+
+
+def test_index_lists_archives(tmpdir):
+	root = str(tmpdir)
+	makedirs(join(root, 'demo', '1.0'))
+	_make_archive(join(root, 'demo', '2.0.zip'))
+	assert InstalledIndex(root).get_versions('demo') == ['1.0', '2.0']
+
+
+TAGS_MODULE = b'''
+from notexp.bases import TagHandler
+
+
+class Tag(TagHandler):
+	def __call__(self, element, **kwargs):
+		return 'from archive'
+'''
+
+
+def test_import_action_from_archive(package_env):
+	package_env.names.add('zeta')
+	makedirs(join(package_env.packages_dir, 'zeta'))
+	pth = _make_archive(join(package_env.packages_dir, 'zeta', '1.0.zip'), files={
+		'config.json': dumps({'name': 'zeta', 'version': '1.0', 'license': 'MIT', 'tags': {'t': 'code.tags.Tag'}}),
+		'__init__.py': b'LOADED = True\n', 'code/__init__.py': b'', 'code/tags.py': TAGS_MODULE})
+	package_list = package_env.package_list([package_env.package('zeta')])
+	assert package_list.packages[0].path == pth
+	assert package_list.get_tag_handlers('t')[0](None) == 'from archive'
+	package_module = modules['zeta']
+	assert package_module.LOADED and package_module.__spec__.name == 'zeta'
+	assert package_module.__spec__.submodule_search_locations == [pth] and package_module.__path__ == [pth]
+	assert modules['zeta.code.tags'].__spec__.origin.startswith(pth)
+	assert import_module('zeta.code').__name__ == 'zeta.code'
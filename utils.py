@@ -1,6 +1,7 @@
 
+from concurrent.futures import ThreadPoolExecutor
 from sys import stderr
-from appdirs import user_data_dir
+from appdirs import user_data_dir, user_cache_dir
 from genericpath import isdir
 from os import getenv, makedirs
 from re import sub, match
@@ -22,6 +23,34 @@ class IncorrectPackageBehaviourError(PackageError):
 	pass
 
 
+class DownloadError(PackageError):
+	pass
+
+
+class DependencyError(PackageError):
+	pass
+
+
+class PackageLoadError(PackageError):
+	def __init__(self, failures):
+		"""
+		:param failures: A list of (package, exception) pairs.
+		"""
+		self.failures = failures
+		super(PackageLoadError, self).__init__('{0:d} package(s) could not be loaded:\n{1:s}'.format(len(failures),
+			'\n'.join('  {0:}: {1:}'.format(package, err) for package, err in failures)))
+
+
+class ResourceProcessingError(PackageError):
+	def __init__(self, failures):
+		"""
+		:param failures: A list of (resource, exception) pairs.
+		"""
+		self.failures = failures
+		super(ResourceProcessingError, self).__init__('{0:d} resource(s) could not be processed:\n{1:s}'.format(
+			len(failures), '\n'.join('  {0:}: {1:}'.format(resource, err) for resource, err in failures)))
+
+
 PACKAGE_NAME_INFO = 'Package names can consist of between 3 and 32 alphanumeric characters, starting with a letter.' + \
 	' They are case-insensitive and can contain "-_.," (not in sequence) which are all treated as "_".'
 
@@ -56,6 +85,38 @@ def get_package_dir():
 	return defpath
 
 
+def get_cache_dir():
+	"""
+	Get the directory for caches that are shared between compiles (can be removed at any time).
+	"""
+	envpath = getenv('NOTEX_CACHE_DIR', '')
+	if isdir(envpath):
+		return envpath
+	defpath = user_cache_dir('ntp')
+	makedirs(defpath, exist_ok=True)
+	return defpath
+
+
+def run_parallel(func, items, workers=None):
+	"""
+	Call `func` for each of `items` on a bounded thread pool, yielding `(item, result, error)` in the original order.
+	Exceptions are returned per item instead of being raised. Runs in the current thread if `workers` is 1.
+	"""
+	items = list(items)
+	if workers == 1 or len(items) <= 1:
+		for item in items:
+			try:
+				yield item, func(item), None
+			except Exception as err:
+				yield item, None, err
+		return
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		futures = [pool.submit(func, item) for item in items]
+		for item, future in zip(items, futures):
+			err = future.exception()
+			yield item, (None if err else future.result()), err
+
+
 #
 # curl_cache_dir = join(gettempdir(), 'notex_curl_cache')  # todo: to settings
 # makedirs(curl_cache_dir, exist_ok=True, mode=0o700)
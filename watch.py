@@ -0,0 +1,181 @@
+
+from collections import namedtuple
+from importlib import reload
+from os import scandir, stat
+from os.path import join, relpath, splitext
+from stat import S_ISDIR
+from sys import modules
+from time import sleep
+from .package import Package
+from .resource import GZIP_MIN_SIZE
+
+
+Changes = namedtuple('Changes', ('packages', 'resources', 'modules'))
+
+
+def scan_tree(path):
+	"""
+	Get the modification time and size of every file below `path` (or of `path` itself if it is a file, like a
+	package archive).
+	"""
+	try:
+		info = stat(path)
+	except FileNotFoundError:
+		return {}
+	if not S_ISDIR(info.st_mode):
+		return {path: (info.st_mtime_ns, info.st_size)}
+	state, todo = {}, [path]
+	while todo:
+		try:
+			entries = list(scandir(todo.pop()))
+		except FileNotFoundError:
+			continue
+		for entry in entries:
+			if entry.is_dir(follow_symlinks=False):
+				if entry.name != '__pycache__':
+					todo.append(entry.path)
+			else:
+				try:
+					info = entry.stat()
+				except FileNotFoundError:
+					continue
+				state[entry.path] = (info.st_mtime_ns, info.st_size)
+	return state
+
+
+def resource_sources(resource):
+	"""
+	The local files a resource depends on (its own file and copy_map sources).
+	"""
+	if resource.local_path is None or resource.resource_dir is None or resource.package_archive is not None:
+		# files in a package archive change with the archive, which reloads the package
+		return []
+	sources = [resource.full_file_path]
+	for src in resource.copy_map.keys():
+		if src:
+			sources.append(join(resource.resource_dir, resource.archive_dir or '', src))
+	return sources
+
+
+class Watcher:
+	"""
+	Polls package directories (and the directories of extra, e.g. document, resources) and redoes only what is
+	affected by changed files:
+
+	* a changed config.json, or added or removed files, reload that package (since resources come from patterns);
+	* a changed style or script is processed and copied again (only that resource);
+	* a changed python module is reimported (also if its package is reloaded), after which the actions of its package
+	  are recreated.
+	"""
+	def __init__(self, package_list, resources=(), *, interval=0.5, minify=False, output_dir=None, fingerprint=False,
+			gzip_level=None, gzip_min_size=GZIP_MIN_SIZE):
+		"""
+		:param resources: Extra resources to watch, that do not belong to a package.
+		:param minify: Minify changed resources again.
+		:param output_dir: If set, copy changed resources to this directory again.
+		:param fingerprint: Passed on to `Resource.copy` (use the same copy options as the build).
+		:param gzip_level: Passed on to `Resource.copy`.
+		:param gzip_min_size: Passed on to `Resource.copy`.
+		"""
+		self.package_list = package_list
+		self.resources = list(resources)
+		self.interval = interval
+		self.minify = minify
+		self.output_dir = output_dir
+		self.copy_options = {'fingerprint': fingerprint, 'gzip_level': gzip_level, 'gzip_min_size': gzip_min_size}
+		self.state = self._scan()
+
+	def _dirs(self):
+		dirs = {package.path for package in self.package_list.packages}
+		dirs.update(resource.resource_dir for resource in self.resources if resource.resource_dir)
+		return dirs
+
+	def _scan(self):
+		state = {}
+		for path in self._dirs():
+			state.update(scan_tree(path))
+		return state
+
+	def poll(self):
+		"""
+		Find what is affected by files that changed since the last poll.
+		"""
+		old_state, new_state = self.state, self._scan()
+		changed = {pth for pth in set(old_state.keys()) | set(new_state.keys())
+			if old_state.get(pth, None) != new_state.get(pth, None)}
+		self.state = new_state
+		packages, resources, module_names = [], [], []
+		if not changed:
+			return Changes(packages, resources, module_names)
+		for package in self.package_list.packages:
+			mine = {pth for pth in changed if pth == package.path or pth.startswith(package.path.rstrip('/') + '/')}
+			if not mine:
+				continue
+			reload_package = package.config_file(package.path) in mine or any(pth not in old_state or
+				pth not in new_state for pth in mine)
+			if reload_package:
+				packages.append(package)
+			for pth in mine:
+				# also for reloaded packages, since loading a package again does not reimport modules that are already imported
+				if splitext(pth)[1] == '.py' and pth in old_state and pth in new_state:
+					name = splitext(relpath(pth, package.path))[0].replace('/', '.')
+					if name.endswith('.__init__'):
+						name = name[:-9]
+					module_names.append((package, '{0:s}.{1:s}'.format(package.name, name)))
+			if not reload_package:
+				resources.extend(resource for resource in package.styles + package.scripts + package.static
+					if any(src in mine for src in resource_sources(resource)))
+		resources.extend(resource for resource in self.resources
+			if any(src in changed for src in resource_sources(resource)))
+		return Changes(packages, resources, module_names)
+
+	def apply(self, changes):
+		"""
+		Reload, reimport and reprocess what was found by `poll`.
+		"""
+		logger = self.package_list.logger
+		reloaded = []
+		for package, name in changes.modules:
+			if name in modules:
+				logger.info('reimporting {0:s}'.format(name), level=1)
+				reload(modules[name])
+				if package not in reloaded and package not in changes.packages:
+					reloaded.append(package)
+		for old in changes.packages:
+			logger.info('reloading {0:} because its files changed'.format(old), level=1)
+			# keep the watched version, rather than choosing again without the resolver and lockfile
+			new = Package(old.name, old.version_request, old.options, logger=old.logger, cache=old.cache,
+				compile_conf=old.compile_conf, packages_dir=old.packages_dir, lazy_actions=old.lazy_actions,
+				locked=(old.version, old.path))
+			self.package_list.replace_package(old, new)
+		for package in reloaded:
+			package.reload_actions()
+		if reloaded:
+			self.package_list.reindex()
+		for resource in changes.resources:
+			logger.info('processing {0:} again because it changed'.format(resource), level=1)
+			resource.processed_path = None
+			resource.fingerprinted_path = None
+			resource.fingerprints = {}
+			resource.__dict__.pop('_content', None)
+			if self.minify:
+				resource.minify()
+			if self.output_dir is not None:
+				resource.copy(self.output_dir, **self.copy_options)
+		if changes.packages:
+			self.state = self._scan()
+
+	def watch(self, callback=None):
+		"""
+		Keep polling and applying changes; `callback(changes)` is called after each change (e.g. to render the
+		document again). Stops when the callback returns False.
+		"""
+		while True:
+			changes = self.poll()
+			if changes.packages or changes.resources or changes.modules:
+				self.apply(changes)
+				if callback is not None and callback(changes) is False:
+					return
+			sleep(self.interval)
+
+
@@ -0,0 +1,179 @@
+
+from collections import OrderedDict
+from hashlib import sha256
+from json import loads
+from os import stat
+from os.path import abspath, join, isdir, isfile
+from threading import RLock
+from .archive import extract_members
+from .file_index import FileListing
+from .signatures import MANIFEST_NAME, manifest_files
+from .utils import run_parallel
+
+
+ARCHIVE_EXT = '.zip'
+
+
+def version_path(packages_dir, name, version):
+	"""
+	Path of an installed version: its directory, or its archive if there is no directory.
+	"""
+	path = join(packages_dir, name, version)
+	if not isdir(path) and isfile(path + ARCHIVE_EXT):
+		return path + ARCHIVE_EXT
+	return path
+
+
+def config_path(path):
+	"""
+	The file whose modification time tells whether the config of a version (or anything, for archives) changed.
+	"""
+	if path.endswith(ARCHIVE_EXT):
+		return path
+	return join(path, 'config.json')
+
+
+class _MappedFile:
+	"""
+	The file interface `ZipFile` needs, on top of a memory map (which lacks `seekable`).
+	"""
+	def __init__(self, mapped):
+		self._mapped = mapped
+
+	def seekable(self):
+		return True
+
+	def __getattr__(self, name):
+		return getattr(self._mapped, name)
+
+
+class PackageArchive(FileListing):
+	"""
+	A package version installed as a single zip archive (`<version>.zip`) instead of a directory. The archive is
+	memory mapped, so members are read without a file system call per file, and are only extracted (see `extract`)
+	when a real path is needed. Like `DirectoryIndex`, it answers glob patterns and existence checks from memory.
+
+	Archives must be replaced by renaming a new file into place, never rewritten in place: the mapping keeps the old
+	file, while truncating a mapped file makes reading it crash the process (SIGBUS).
+	"""
+	def __init__(self, path):
+		# imported here, since most packages are directories
+		from mmap import mmap, ACCESS_READ
+		from zipfile import ZipFile
+		super(PackageArchive, self).__init__(path)
+		info = stat(path)
+		self.stat = (info.st_size, info.st_mtime_ns)
+		self.sizes = {}
+		self._hashes = {}
+		with open(path, 'rb') as fh:
+			self._mapped = mmap(fh.fileno(), 0, access=ACCESS_READ)
+		self._zip = ZipFile(_MappedFile(self._mapped))
+		for zinfo in self._zip.infolist():
+			name = zinfo.filename.rstrip('/')
+			if not zinfo.is_dir():
+				self.files.add(name)
+				self.sizes[name] = zinfo.file_size
+			parts = name.split('/')
+			for k in range(1, len(parts) if not zinfo.is_dir() else len(parts) + 1):
+				self.dirs['/'.join(parts[:k])] = None
+
+	def is_valid(self):
+		try:
+			info = stat(self.path)
+		except FileNotFoundError:
+			return False
+		return (info.st_size, info.st_mtime_ns) == self.stat
+
+	def close(self):
+		"""
+		Release the memory map (and its file descriptor). Reading members fails after this; `is_valid` still works.
+		"""
+		self._zip.close()
+		self._mapped.close()
+
+	def size(self, relpth):
+		return self.sizes[self._member(relpth)]
+
+	def _member(self, relpth):
+		name = self._normalize(relpth)
+		if name not in self.files:
+			raise FileNotFoundError('"{0:s}" is not in archive "{1:s}"'.format(relpth, self.path))
+		return name
+
+	def read(self, relpth):
+		"""
+		The content of a member, as bytes; raises FileNotFoundError if there is no such member.
+		"""
+		return self._zip.read(self._member(relpth))
+
+	def hash(self, relpth):
+		name = self._member(relpth)
+		if name not in self._hashes:
+			self._hashes[name] = sha256(self._zip.read(name)).hexdigest()
+		return self._hashes[name]
+
+	def hash_members(self, names, workers=None):
+		"""
+		Like `hash_files`, for members of the archive.
+		"""
+		file_sigs = OrderedDict()
+		for name, hash, err in run_parallel(self.hash, sorted(names), workers=workers):
+			if err is not None:
+				raise err
+			file_sigs[name] = hash
+		return file_sigs
+
+	def read_manifest(self):
+		"""
+		The signature manifest included in the archive when it was made, or None.
+		"""
+		try:
+			return manifest_files(loads(self.read(MANIFEST_NAME).decode('utf-8')))
+		except (FileNotFoundError, ValueError):
+			return None
+
+	def verify_manifest(self, manifest, files, full_verify=False, workers=None):
+		"""
+		Like `verify_manifest`, for members. Members cannot change without rewriting the archive (and the manifest
+		with it), so hashes are trusted when the size matches; zip checks the CRC of every member that is read.
+		"""
+		file_sigs, rehash = OrderedDict(), []
+		for name in sorted(files):
+			known = manifest.get(name, None)
+			if known is not None and not full_verify and self.sizes.get(name, None) == known[0]:
+				file_sigs[name] = known[2]
+				continue
+			file_sigs[name] = None
+			rehash.append(name)
+		file_sigs.update(self.hash_members(rehash, workers=workers))
+		changed = [name for name in rehash if name not in manifest or file_sigs[name] != manifest[name][2]]
+		changed.extend(sorted(set(manifest.keys()) - set(file_sigs.keys())))
+		return file_sigs, changed
+
+	def extract(self, wanted):
+		"""
+		Extract (only) the wanted members, if they were not extracted before, to a cache directory per archive
+		version, and return that directory.
+		"""
+		key = sha256('{0:s}\t{1:d}\t{2:d}'.format(abspath(self.path), *self.stat).encode('utf-8')).hexdigest()
+		return extract_members(self.path, wanted, key=key)
+
+
+_ARCHIVES = {}
+_ARCHIVES_LOCK = RLock()
+
+
+def get_package_archive(path):
+	"""
+	Get the (process-wide) opened archive at `path`, reopening it if the file changed. The replaced archive is closed,
+	so long-running processes (like the daemon and watcher) do not keep a mapping per reinstall.
+	"""
+	with _ARCHIVES_LOCK:
+		archive = _ARCHIVES.get(path, None)
+		if archive is None or not archive.is_valid():
+			if archive is not None:
+				archive.close()
+			archive = _ARCHIVES[path] = PackageArchive(path)
+		return archive
+
+